@@ -1,14 +1,22 @@
+import asyncio
+
 from loguru import logger
 from pipecat.processors.aggregators.llm_context import LLMContext
 from pipecat.pipeline.task import PipelineTask
 from pipecat.frames.frames import LLMRunFrame, StartInterruptionFrame
+from app.core.tracing import Span
 from app.services.database import DatabaseService
 
+# Mensajes del usuario (los últimos) que se usan para elegir memorias al reanudar
+MEMORY_QUERY_MESSAGES = 3
+
 class ConversationActionHandler:
-    def __init__(self, db_service: DatabaseService, context: LLMContext):
+    def __init__(self, db_service: DatabaseService, context: LLMContext, trace_span: Span | None = None):
         self.db_service = db_service
         self.context = context
         self.task: PipelineTask | None = None
+        # Span de la sesión de voz: los spans que empiecen después heredan conversation_id y user_id
+        self.trace_span = trace_span
 
     def set_task(self, task: PipelineTask):
         self.task = task
@@ -26,8 +34,20 @@ class ConversationActionHandler:
             #self.db_service.ensure_user_exists(user_id)
         
         logger.info(f"🔄 Configurando conversación: {conversation_id}")
-
-        memories = self.db_service.get_all_memories(user_id=self.db_service.user_id)
+        if self.trace_span is not None:
+            self.trace_span.set_attributes(conversation_id=conversation_id, user_id=self.db_service.user_id)
+
+        # Las memorias se eligen según lo último que dijo el usuario; sin historial,
+        # las del usuario primero (ver memory_selection.py). Se cargan a la caché
+        # junto con el historial, así la selección ya no espera a la base.
+        history_query = self.db_service.get_conversation_history(conversation_id) if conversation_id else asyncio.sleep(0, result=[])
+        history, _ = await asyncio.gather(
+            history_query,
+            self.db_service.get_all_memories(user_id=self.db_service.user_id),
+        )
+        memories = await self.db_service.get_relevant_memories(
+            self._memory_query(history), user_id=self.db_service.user_id
+        )
         if memories:
             memory_list = [f"- {k}: {v}" for k, v in memories.items()]
             memory_text = "\nDATOS RECORDADOS:\n" + "\n".join(memory_list)
@@ -45,9 +65,6 @@ class ConversationActionHandler:
             self.db_service.conversation_id = conversation_id
             logger.info("✅ ID de conversación establecido.")
             
-            # Cargar historial
-            history = self.db_service.get_conversation_history(conversation_id)
-            
             if history:
                 logger.info(f"📜 Inyectando {len(history)} mensajes al contexto")
                 # Inyectar historial en el contexto del LLM
@@ -85,6 +102,15 @@ class ConversationActionHandler:
         
         return True
 
+    @staticmethod
+    def _memory_query(history: list) -> str | None:
+        """Los últimos mensajes de texto del usuario, o None si no hay."""
+        texts = [
+            msg["content"] for msg in history
+            if msg.get("role") == "user" and isinstance(msg.get("content"), str) and msg["content"].strip()
+        ]
+        return "\n".join(texts[-MEMORY_QUERY_MESSAGES:]) or None
+
     async def handle_user_image(self, image_base64: str):
         """Maneja imagenes subidas por el usuario (Legacy single image)."""
         if not image_base64:
@@ -141,7 +167,7 @@ class ConversationActionHandler:
         
         # 4. Guardar en Base de Datos (Persistencia)
         # Usamos el servicio de DB para guardar el registro
-        self.db_service.add_message("user", text, images=image_urls)
+        self.db_service.queue_message("user", text, images=image_urls)
 
         # 5. Disparar respuesta del LLM
         if self.task:
@@ -182,7 +208,7 @@ class ConversationActionHandler:
         })
 
         # Guardar en DB
-        self.db_service.add_message("user", f"[Archivo: {file_name}] {text if text else ''}")
+        self.db_service.queue_message("user", f"[Archivo: {file_name}] {text if text else ''}")
 
         # Disparar respuesta
         if self.task:
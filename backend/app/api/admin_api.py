@@ -0,0 +1,89 @@
+"""
+Rutas de diagnóstico de la API de chat (perfil, tareas, lag del loop,
+tracemalloc). Misma interfaz y mismo ADMIN_TOKEN que las del servidor de
+operaciones del bot de voz; la lógica vive en app/core/profiler.py.
+
+Las mediciones que bloquean (perfil, tracemalloc) corren en un hilo para no
+frenar el loop que se quiere medir.
+
+`ops_router` sirve bajo /ops las rutas que los módulos registran con
+`register_route` (/tools, /db/pool, /memory/cache, ...), porque este proceso
+no levanta el servidor de operaciones.
+"""
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core import ops_server, profiler
+from app.core.ops_server import check_admin
+
+
+def require_admin(request: Request):
+    denied = check_admin(request.headers)
+    if denied is not None:
+        raise HTTPException(status_code=denied[0], detail=denied[1])
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _query(request: Request) -> dict:
+    return dict(request.query_params)
+
+
+@router.get("/profile")
+async def profile(request: Request):
+    try:
+        seconds, mode, interval_ms, fmt = profiler.profile_args(_query(request))
+        result = await asyncio.to_thread(profiler.profile, seconds, mode, interval_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if fmt == "json":
+        return profiler.summarize(result)
+    return PlainTextResponse(
+        profiler.folded_text(result),
+        headers={"Content-Disposition": f'attachment; filename="chat-api-{result["mode"]}.folded"'},
+    )
+
+
+@router.get("/tasks")
+async def tasks():
+    # Se corre dentro del loop: si respondió, el loop no está bloqueado
+    return profiler.tasks_report(asyncio.get_running_loop())
+
+
+@router.get("/loop-lag")
+async def loop_lag(request: Request):
+    try:
+        seconds, interval_ms = profiler.loop_lag_args(_query(request))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await profiler.loop_lag(seconds, interval_ms)
+
+
+@router.get("/tracemalloc")
+async def tracemalloc_top(request: Request):
+    try:
+        args = profiler.tracemalloc_args(_query(request))
+        return await asyncio.to_thread(profiler.tracemalloc_top, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+ops_router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@ops_router.api_route("/{path:path}", methods=["GET", "POST"])
+async def ops_route(path: str, request: Request):
+    # Los handlers son sincrónicos y algunos leen estado con locks: fuera del loop
+    status, body = await asyncio.to_thread(
+        ops_server.dispatch, request.method, f"/{path}", _query(request), request.headers
+    )
+    if isinstance(body, str):
+        return PlainTextResponse(body, status_code=status)
+    return JSONResponse(body, status_code=status)
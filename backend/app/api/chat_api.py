@@ -2,8 +2,10 @@
 API HTTP para chat de texto.
 Usa la misma lógica del bot de voz (OpenAI + Tools).
 """
+import asyncio
 import os
 import json
+import time
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -11,10 +13,12 @@ from typing import Optional
 from openai import OpenAI
 from loguru import logger
 
+from app.core.tracing import current_span, span, start_span
 from app.services.database import DatabaseService
-from app.services.rag import get_relevant_context
+from app.services.rag import aget_relevant_context
 from app.services.tuguia_database import TuGuiaDatabase
 from app.prompts import SYSTEM_PROMPT
+from app.tools.runtime import ToolTimeout, get_tool_runtime
 
 router = APIRouter()
 
@@ -103,57 +107,62 @@ TOOLS = [
     }
 ]
 
-def execute_tool(tool_name: str, arguments: dict, db_service: DatabaseService, user_id: str = None) -> dict:
-    """Ejecuta una tool y retorna el resultado."""
+async def _run_tool(tool_name: str, arguments: dict, db_service: DatabaseService, user_id: str = None) -> dict:
+    if tool_name == "buscar_informacion":
+        query = arguments.get("query", "")
+        context = await aget_relevant_context(query)
+        return {"success": True, "informacion": context}
+
+    elif tool_name == "contar_usuarios_tuguia":
+        tuguia_db = TuGuiaDatabase()
+        count = await tuguia_db.count_users()
+        return {"success": True, "total_usuarios": count, "mensaje": f"Hay {count} usuarios registrados."}
+
+    elif tool_name == "contar_usuarios_por_subcategoria":
+        subcategory_names = arguments.get("subcategory_names", [])
+        tuguia_db = TuGuiaDatabase()
+        result = await tuguia_db.count_users_by_subcategory(subcategory_names)
+        return result
+
+    elif tool_name == "guardar_dato":
+        key = arguments.get("key")
+        value = arguments.get("value")
+        scope = arguments.get("scope", "user")
+        target_user_id = user_id if scope == "user" else None
+        success = await db_service.save_memory(key, value, user_id=target_user_id)
+        return {"success": success, "mensaje": f"Dato '{key}' guardado."}
+
+    elif tool_name == "borrar_dato":
+        key = arguments.get("key")
+        success = await db_service.delete_memory(key, user_id=user_id)
+        return {"success": success, "mensaje": f"Dato '{key}' borrado."}
+
+    else:
+        return {"success": False, "error": f"Tool '{tool_name}' no implementada"}
+
+async def execute_tool(tool_name: str, arguments: dict, db_service: DatabaseService, user_id: str = None) -> dict:
+    """Ejecuta una tool en el runtime compartido con el bot de voz y retorna el resultado."""
+    runtime = get_tool_runtime()
     try:
-        if tool_name == "buscar_informacion":
-            query = arguments.get("query", "")
-            context = get_relevant_context(query)
-            return {"success": True, "informacion": context}
-        
-        elif tool_name == "contar_usuarios_tuguia":
-            tuguia_db = TuGuiaDatabase()
-            count = tuguia_db.count_users()
-            return {"success": True, "total_usuarios": count, "mensaje": f"Hay {count} usuarios registrados."}
-        
-        elif tool_name == "contar_usuarios_por_subcategoria":
-            subcategory_names = arguments.get("subcategory_names", [])
-            tuguia_db = TuGuiaDatabase()
-            result = tuguia_db.count_users_by_subcategory(subcategory_names)
-            return result
-        
-        elif tool_name == "guardar_dato":
-            key = arguments.get("key")
-            value = arguments.get("value")
-            scope = arguments.get("scope", "user")
-            target_user_id = user_id if scope == "user" else None
-            success = db_service.save_memory(key, value, user_id=target_user_id)
-            return {"success": success, "mensaje": f"Dato '{key}' guardado."}
-        
-        elif tool_name == "borrar_dato":
-            key = arguments.get("key")
-            success = db_service.delete_memory(key, user_id=user_id)
-            return {"success": success, "mensaje": f"Dato '{key}' borrado."}
-        
-        else:
-            return {"success": False, "error": f"Tool '{tool_name}' no implementada"}
-    
+        return await runtime.call(tool_name, _run_tool, tool_name, arguments, db_service, user_id)
+    except ToolTimeout:
+        return runtime.timeout_result(tool_name)
     except Exception as e:
         logger.error(f"Error ejecutando tool {tool_name}: {e}")
         return {"success": False, "error": str(e)}
 
-def get_conversation_history(conversation_id: str, db_service: DatabaseService) -> list:
+async def get_conversation_history(conversation_id: str, db_service: DatabaseService) -> list:
     """Obtiene historial formateado para OpenAI."""
-    history = db_service.get_conversation_history(conversation_id)
+    history = await db_service.get_conversation_history(conversation_id)
     # Convertir 'agent' a 'assistant' para OpenAI
     for msg in history:
         if msg["role"] == "agent":
             msg["role"] = "assistant"
     return history
 
-def get_user_memory(user_id: str, db_service: DatabaseService) -> str:
-    """Obtiene memoria del usuario como texto."""
-    memories = db_service.get_all_memories(user_id)
+async def get_user_memory(user_id: str, db_service: DatabaseService, message: str = None) -> str:
+    """Obtiene como texto la memoria relevante al mensaje (fijas + las más parecidas)."""
+    memories = await db_service.get_relevant_memories(message, user_id)
     if not memories:
         return ""
     # memories es un diccionario {key: value}, iteramos sobre items()
@@ -166,14 +175,20 @@ async def chat(request: ChatRequest):
     db_service = DatabaseService()
     db_service.conversation_id = request.conversation_id
     db_service.user_id = request.user_id
+    # Los spans hijos (OpenAI, RAG, herramientas, base) heredan estos atributos
+    request_span = current_span()
+    if request_span is not None:
+        request_span.set_attributes(conversation_id=request.conversation_id, user_id=request.user_id)
     
     try:
         # 1. Guardar mensaje del usuario
-        db_service.add_message("user", request.message)
+        await db_service.add_message("user", request.message)
         
-        # 2. Obtener contexto
-        history = get_conversation_history(request.conversation_id, db_service)
-        memory = get_user_memory(request.user_id, db_service) if request.user_id else ""
+        # 2. Obtener contexto (historial y memoria a la vez)
+        history, memory = await asyncio.gather(
+            get_conversation_history(request.conversation_id, db_service),
+            get_user_memory(request.user_id, db_service, request.message) if request.user_id else asyncio.sleep(0, result=""),
+        )
         
         # 3. Construir mensajes
         system_content = SYSTEM_PROMPT + """
@@ -193,13 +208,15 @@ NOTA: Estás respondiendo en modo TEXTO (no voz).
         ]
         
         # 4. Llamar a OpenAI con tools
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            tools=TOOLS,
-            tool_choice="auto",
-            stream=False  # Primero sin stream para manejar tools
-        )
+        with span("openai.chat.completions", kind="client", **{"llm.model": "gpt-4o-mini", "llm.stream": False}) as llm_span:
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                tools=TOOLS,
+                tool_choice="auto",
+                stream=False  # Primero sin stream para manejar tools
+            )
+            llm_span.set_attribute("llm.tool_calls", len(response.choices[0].message.tool_calls or []))
         
         assistant_message = response.choices[0].message
         
@@ -208,33 +225,37 @@ NOTA: Estás respondiendo en modo TEXTO (no voz).
             # Agregar mensaje del asistente con tool calls
             messages.append(assistant_message.model_dump())
             
+            # Las tools de una misma respuesta son independientes: se ejecutan a la vez
+            calls = []
             for tool_call in assistant_message.tool_calls:
                 tool_name = tool_call.function.name
                 arguments = json.loads(tool_call.function.arguments)
-                
                 logger.info(f"🔧 Ejecutando tool: {tool_name}")
-                result = execute_tool(tool_name, arguments, db_service, request.user_id)
-                
+                calls.append(execute_tool(tool_name, arguments, db_service, request.user_id))
+            results = await asyncio.gather(*calls)
+
+            for tool_call, result in zip(assistant_message.tool_calls, results):
                 # Agregar resultado de la tool
                 messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call.id,
                     "content": json.dumps(result)
                 })
-            
-            # Segunda llamada para obtener respuesta final
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                stream=True
-            )
-        else:
-            # Sin tools, hacer streaming directamente
+        
+        # Respuesta final en streaming (segunda llamada si hubo tools, o directa).
+        # El span termina cuando se consume el stream
+        stream_span = start_span("openai.chat.completions", kind="client", **{"llm.model": "gpt-4o-mini", "llm.stream": True})
+        stream_start = time.perf_counter()
+        try:
             response = client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=messages,
                 stream=True
             )
+        except Exception as e:
+            stream_span.set_error(e)
+            stream_span.end()
+            raise
         
         # 6. Streaming de respuesta
         async def generate():
@@ -243,15 +264,22 @@ NOTA: Estás respondiendo en modo TEXTO (no voz).
                 for chunk in response:
                     content = chunk.choices[0].delta.content
                     if content:
+                        if not full_response:
+                            stream_span.set_attribute("llm.first_token_ms", round((time.perf_counter() - stream_start) * 1000, 1))
                         full_response += content
                         yield f"data: {json.dumps({'content': content})}\n\n"
+                stream_span.set_attribute("llm.output_chars", len(full_response))
+                stream_span.end()
                 
                 # Guardar respuesta del bot
-                db_service.add_message("agent", full_response)
+                await db_service.add_message("agent", full_response)
                 yield "data: [DONE]\n\n"
             except Exception as e:
                 logger.error(f"Error en streaming: {e}")
+                stream_span.set_error(e)
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            finally:
+                stream_span.end()
         
         return StreamingResponse(generate(), media_type="text/event-stream")
     
@@ -271,6 +299,9 @@ async def upload_file(
     db_service = DatabaseService()
     db_service.conversation_id = conversation_id
     db_service.user_id = user_id
+    request_span = current_span()
+    if request_span is not None:
+        request_span.set_attributes(conversation_id=conversation_id, user_id=user_id)
 
     try:
         # Leer archivo
@@ -296,7 +327,7 @@ async def upload_file(
             user_msg = message if message else f"[Imagen: {file_name}]"
             # Parsear URLs de imágenes
             img_list = [url.strip() for url in image_urls.split(",") if url.strip()] if image_urls else []
-            db_service.add_message("user", user_msg, images=img_list)
+            await db_service.add_message("user", user_msg, images=img_list)
 
             # Llamar a OpenAI con la imagen
             response = client.chat.completions.create(
@@ -313,7 +344,7 @@ async def upload_file(
         elif file_type in ["text/plain", "text/markdown"] or (file_name and file_name.lower().endswith((".txt", ".md", ".json"))):
             text_content = file_content.decode("utf-8")
             user_msg = f"{message}\n📄 [Archivo adjunto: {file_name}]"
-            db_service.add_message("user", user_msg)
+            await db_service.add_message("user", user_msg)
 
             # Llamar a OpenAI con el texto
             response = client.chat.completions.create(
@@ -338,7 +369,7 @@ async def upload_file(
                         yield f"data: {json.dumps({'content': content})}\n\n"
                 
                 # Guardar respuesta del bot
-                db_service.add_message("agent", full_response)
+                await db_service.add_message("agent", full_response)
                 yield "data: [DONE]\n\n"
             except Exception as e:
                 logger.error(f"Error en streaming upload: {e}")
@@ -1,15 +1,24 @@
 """
 Servidor FastAPI para la API de chat.
 Se ejecuta separado del bot de voz.
+
+Cada petición es un span de servidor (app/core/tracing.py) que continúa la
+traza del header `traceparent` del proxy de Next.js; la respuesta devuelve el
+trace id en `X-Trace-Id`.
 """
 import os
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from app.core import tracing
+
+tracing.configure(service_name="chat-api")
+
+from app.api.admin_api import ops_router, router as admin_router
 from app.api.chat_api import router as chat_router
 
 app = FastAPI(title="Bot Sonora Chat API", version="1.0.0")
@@ -23,8 +32,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    request_span = tracing.start_span(
+        f"{request.method} {request.url.path}",
+        parent=tracing.extract(request.headers),
+        kind="server",
+        **{"http.method": request.method, "http.route": request.url.path},
+    )
+    try:
+        with tracing.use_span(request_span):
+            response = await call_next(request)
+    except Exception as e:
+        request_span.set_error(e)
+        request_span.end()
+        raise
+    request_span.set_attribute("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        request_span.set_error(f"HTTP {response.status_code}")
+    response.headers["X-Trace-Id"] = request_span.context.trace_id
+
+    # En streaming (/api/chat) el span dura hasta que se manda el último chunk
+    body = getattr(response, "body_iterator", None)
+    if body is None:
+        request_span.end()
+        return response
+
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            request_span.end()
+
+    response.body_iterator = traced_body()
+    return response
+
 # Registrar router
 app.include_router(chat_router, prefix="/api", tags=["chat"])
+# Diagnóstico bajo demanda (requiere ADMIN_TOKEN, ver app/core/profiler.py)
+app.include_router(admin_router, prefix="/debug", tags=["debug"])
+# Rutas de register_route (/tools, /db/pool, /memory/...), también con ADMIN_TOKEN
+app.include_router(ops_router, prefix="/ops", tags=["ops"])
 
 @app.get("/health")
 async def health():
@@ -0,0 +1,45 @@
+"""
+Histogramas de latencia compartidos por el pipeline de voz y la API de texto.
+
+Sin dependencias de Pipecat para que la API de chat los pueda usar sin
+importar el stack de voz.
+"""
+from collections import deque
+
+import numpy as np
+
+# Límites de los buckets del histograma (ms)
+BUCKETS_MS = (100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+# Muestras recientes que se guardan para calcular percentiles
+RECENT_SAMPLES = 1000
+
+
+class LatencyHistogram:
+    """Histograma acumulativo más una ventana de muestras recientes para percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value_ms: float):
+        self.count += 1
+        self.total_ms += value_ms
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if value_ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.recent.append(value_ms)
+
+    def to_dict(self) -> dict:
+        recent = np.array(self.recent) if self.recent else None
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": round(float(np.percentile(recent, 50)), 1) if recent is not None else None,
+            "p95_ms": round(float(np.percentile(recent, 95)), 1) if recent is not None else None,
+            "p99_ms": round(float(np.percentile(recent, 99)), 1) if recent is not None else None,
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
@@ -0,0 +1,130 @@
+"""
+Servidor HTTP de operaciones del proceso de voz.
+
+El servidor de Pipecat (puerto 7860) no se puede extender fácilmente y no
+responde hasta que termina de importar todo, así que el estado del proceso se
+expone en un puerto aparte (OPS_PORT, 7862 por defecto) con la librería
+estándar, en un hilo daemon que arranca antes que cualquier import pesado.
+
+Rutas base:
+    GET /live     200 mientras el proceso esté vivo
+    GET /ready    200 cuando terminó la precarga, 503 mientras tanto
+    GET /startup  tiempos de cada fase del arranque
+
+Otros módulos agregan rutas con `register_route`. Las rutas con
+`admin=True` (diagnóstico: app/core/profiler.py) piden el header
+`Authorization: Bearer <ADMIN_TOKEN>` y están apagadas si ADMIN_TOKEN no
+está definido.
+
+La API de chat no levanta este servidor: sirve las mismas rutas bajo
+`/ops/...` de su app FastAPI, todas con ADMIN_TOKEN (ver app/api/admin_api.py).
+"""
+import json
+import os
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+from loguru import logger
+
+from app.core.startup import startup
+
+OPS_HOST = os.getenv("OPS_HOST", "0.0.0.0")
+OPS_PORT = int(os.getenv("OPS_PORT", 7862))
+# Token de las rutas de diagnóstico (vacío = apagadas)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# (método, ruta) -> handler(query) -> (status, body). Un body dict se manda
+# como JSON; un str, como texto plano (por ejemplo, un perfil para flamegraph)
+Handler = Callable[[Dict[str, str]], Tuple[int, Union[dict, str]]]
+_routes: Dict[Tuple[str, str], Handler] = {}
+_admin_routes: set = set()
+
+_server: ThreadingHTTPServer | None = None
+
+
+def register_route(path: str, handler: Handler, method: str = "GET", admin: bool = False):
+    """Agrega una ruta al servidor de operaciones (`admin=True`: requiere ADMIN_TOKEN)."""
+    _routes[(method, path)] = handler
+    if admin:
+        _admin_routes.add((method, path))
+
+
+def check_admin(headers: Mapping[str, str]) -> Optional[Tuple[int, str]]:
+    """None si los headers traen el ADMIN_TOKEN; si no, (status, motivo)."""
+    if not ADMIN_TOKEN:
+        return 403, "Rutas de administración deshabilitadas (falta ADMIN_TOKEN)"
+    authorization = headers.get("authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        return 401, "Token de administración inválido"
+    return None
+
+
+def dispatch(method: str, path: str, query: Dict[str, str], headers: Mapping[str, str]) -> Tuple[int, Union[dict, str]]:
+    """Resuelve una petición contra las rutas registradas (headers con claves en minúscula)."""
+    handler = _routes.get((method, path))
+    if handler is None:
+        return 404, {"error": "not found"}
+    if (method, path) in _admin_routes:
+        denied = check_admin(headers)
+        if denied is not None:
+            logger.warning(f"🔒 Ruta de administración {path} rechazada ({denied[0]})")
+            return denied[0], {"error": denied[1]}
+    try:
+        return handler(query)
+    except Exception as e:
+        logger.error(f"❌ Error en ruta de operaciones {path}: {e}")
+        return 500, {"error": str(e)}
+
+
+class _OpsHandler(BaseHTTPRequestHandler):
+    def _dispatch(self, method: str):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        self._send(*dispatch(method, url.path, query, headers))
+
+    def _send(self, status: int, body: Union[dict, str]):
+        if isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), "text/plain; charset=utf-8"
+        else:
+            payload, content_type = json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        # Los healthchecks llegan cada pocos segundos; no ensuciar el log
+        pass
+
+
+def start_ops_server(port: int = OPS_PORT, host: str = OPS_HOST) -> ThreadingHTTPServer | None:
+    """Levanta el servidor en un hilo daemon (idempotente)."""
+    global _server
+    if _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), _OpsHandler)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo abrir el puerto de operaciones {port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="ops-server", daemon=True).start()
+    logger.info(f"🩺 Servidor de operaciones en http://{host}:{port} (/live, /ready, /startup)")
+    return _server
+
+
+register_route("/live", lambda query: (200, {"status": "ok"}))
+register_route("/ready", lambda query: (200 if startup.ready else 503, {"ready": startup.ready}))
+register_route("/startup", lambda query: (200, startup.report()))
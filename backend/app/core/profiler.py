@@ -0,0 +1,432 @@
+"""
+Diagnóstico bajo demanda de un proceso en producción.
+
+Cuando el bot de voz o la API de chat se ponen lentos no hay forma de ver en
+qué se va el CPU o el event loop sin reiniciar bajo un profiler. Este módulo
+lo hace en caliente, solo mientras alguien lo pide:
+
+  - profile():          muestreo de stacks de todos los hilos durante unos
+                        segundos (`wall`: todo lo que esté en el stack, incluso
+                        esperando; `cpu`: solo los hilos que consumieron CPU
+                        entre muestras). Devuelve stacks colapsados, el formato
+                        que leen flamegraph.pl, speedscope e inferno.
+  - dump_tasks():       tareas de asyncio del loop con su stack.
+  - measure_loop_lag(): cuánto tarda el loop en despertar una tarea que duerme
+                        un intervalo fijo (p50/p95/max).
+  - tracemalloc_top():  las N líneas que más memoria asignaron en una ventana.
+
+Nada de esto corre si no se pide: no hay hooks, hilos ni tracemalloc activos
+fuera de una medición, así que el costo en reposo es cero. Hay una sola
+medición de perfil o de memoria a la vez por proceso (la segunda recibe 409).
+
+Rutas (requieren ADMIN_TOKEN, ver ops_server.py):
+    GET /debug/profile?seconds=10&mode=wall|cpu&interval_ms=10&format=folded|json
+    GET /debug/tasks
+    GET /debug/loop-lag?seconds=5&interval_ms=50
+    GET /debug/tracemalloc?seconds=10&limit=25&group_by=lineno|filename|traceback
+
+El bot de voz las expone en el servidor de operaciones (OPS_PORT) y la API
+de chat en su propio puerto (app/api/admin_api.py).
+"""
+import asyncio
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.metrics import LatencyHistogram
+from app.core.ops_server import register_route
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+# Frames por traza que guarda tracemalloc (más frames = más overhead mientras mide)
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", 10))
+TRACEMALLOC_MAX_LIMIT = 200
+# Frames por tarea en /debug/tasks
+TASK_STACK_LIMIT = 20
+
+PROFILE_MODES = ("wall", "cpu")
+TRACEMALLOC_GROUPS = ("lineno", "filename", "traceback")
+
+_PROC_TASKS = "/proc/self/task"
+
+
+class ProfilerBusy(RuntimeError):
+    """Ya hay una medición en curso en este proceso."""
+
+
+_busy = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_thread_id: int | None = None
+
+
+def register_loop(loop: asyncio.AbstractEventLoop | None = None):
+    """Registra el event loop que inspeccionan /debug/tasks y /debug/loop-lag.
+
+    Se llama desde el loop (sin argumento) o pasándolo explícitamente.
+    """
+    global _loop, _loop_thread_id
+    loop = loop or asyncio.get_running_loop()
+    if loop is _loop:
+        return
+    _loop = loop
+    _loop_thread_id = threading.get_ident()
+
+
+# ---------------------------------------------------------------------------
+# Perfil por muestreo
+# ---------------------------------------------------------------------------
+
+
+def _frame_label(code) -> str:
+    """`funcion (carpeta/archivo.py:linea)`; la línea es la de la definición
+    para que todas las muestras de una función se junten en un solo bloque."""
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    path = "/".join(parts[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame) -> List[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _cpu_ticks(native_id: int) -> Optional[int]:
+    """utime + stime del hilo en ticks del kernel, o None si no se puede leer."""
+    try:
+        with open(f"{_PROC_TASKS}/{native_id}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # El nombre del hilo va entre paréntesis y puede tener espacios
+    fields = stat[stat.rfind(b")") + 2:].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def profile(seconds: float, mode: str = "wall", interval_ms: float = PROFILE_INTERVAL_MS) -> dict:
+    """Muestrea los stacks de todos los hilos durante `seconds` (bloquea).
+
+    Devuelve {"folded": {stack: muestras}, "samples", "duration_s", ...}.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"mode debe ser uno de {PROFILE_MODES}")
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("Ya hay una medición en curso")
+    try:
+        return _sample(seconds, mode, interval_ms / 1000)
+    finally:
+        _busy.release()
+
+
+def _sample(seconds: float, mode: str, interval: float) -> dict:
+    cpu = mode == "cpu" and os.path.isdir(_PROC_TASKS)
+    if mode == "cpu" and not cpu:
+        logger.warning("⚠️ Sin /proc para medir CPU por hilo; el perfil será de tiempo de pared")
+    me = threading.get_ident()
+    folded: Counter = Counter()
+    ticks: Dict[int, int] = {}
+    samples = 0
+    overhead = 0.0
+
+    logger.info(f"🔬 Perfil {mode} de {seconds:g}s cada {interval * 1000:g} ms")
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        tick = time.perf_counter()
+        if tick >= deadline:
+            break
+        threads = {t.ident: t for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread = threads.get(ident)
+            if cpu:
+                native_id = getattr(thread, "native_id", None)
+                current = _cpu_ticks(native_id) if native_id else None
+                previous = ticks.get(ident)
+                if current is not None:
+                    ticks[ident] = current
+                # Primera vez que se ve el hilo, o no consumió CPU desde la muestra anterior
+                if current is None or previous is None or current == previous:
+                    continue
+            name = thread.name if thread is not None else f"thread-{ident}"
+            folded[";".join([f"thread:{name}", *_stack(frame)])] += 1
+        samples += 1
+        overhead += time.perf_counter() - tick
+        time.sleep(max(0.0, min(interval, deadline - time.perf_counter())))
+    duration = time.perf_counter() - started
+
+    logger.info(f"🔬 Perfil listo: {samples} muestras, {len(folded)} stacks distintos")
+    return {
+        "mode": "cpu" if cpu else "wall",
+        "duration_s": round(duration, 2),
+        "interval_ms": round(interval * 1000, 2),
+        "samples": samples,
+        "sampler_overhead_pct": round(overhead / duration * 100, 2) if duration else 0.0,
+        "folded": dict(folded),
+    }
+
+
+def folded_text(result: dict) -> str:
+    """Stacks colapsados, una línea `hilo;f1;f2;... muestras` por stack."""
+    lines = [f"{stack} {count}" for stack, count in sorted(result["folded"].items())]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def summarize(result: dict, top: int = 30) -> dict:
+    """Resumen JSON del perfil: funciones con más muestras propias y totales."""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in result["folded"].items():
+        frames = stack.split(";")[1:]
+        if frames:
+            own[frames[-1]] += count
+        for label in set(frames):
+            total[label] += count
+    hits = sum(result["folded"].values()) or 1
+
+    def as_rows(counter: Counter) -> List[dict]:
+        return [{"frame": label, "samples": n, "pct": round(n / hits * 100, 1)} for label, n in counter.most_common(top)]
+
+    return {
+        **{k: v for k, v in result.items() if k != "folded"},
+        "stacks": len(result["folded"]),
+        "top_self": as_rows(own),
+        "top_total": as_rows(total),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Event loop
+# ---------------------------------------------------------------------------
+
+
+def _describe_task(task: asyncio.Task) -> dict:
+    coro = task.get_coro()
+    info = {
+        "name": task.get_name(),
+        "coro": getattr(coro, "__qualname__", repr(coro)),
+        "state": "cancelled" if task.cancelled() else "done" if task.done() else "pending",
+        "stack": [
+            f"{f.f_code.co_name} ({f.f_code.co_filename}:{f.f_lineno})" for f in task.get_stack(limit=TASK_STACK_LIMIT)
+        ],
+    }
+    waiter = getattr(task, "_fut_waiter", None)
+    if waiter is not None:
+        info["waiting_on"] = repr(waiter)[:200]
+    return info
+
+
+def tasks_report(loop: asyncio.AbstractEventLoop) -> dict:
+    """Tareas de `loop` con su stack; se llama desde el hilo del loop."""
+    tasks = sorted((_describe_task(t) for t in asyncio.all_tasks(loop)), key=lambda t: t["name"])
+    return {"count": len(tasks), "loop_blocked": False, "tasks": tasks}
+
+
+async def _tasks_in_loop() -> dict:
+    return tasks_report(asyncio.get_running_loop())
+
+
+def dump_tasks(loop: asyncio.AbstractEventLoop | None = None, timeout: float = 2.0) -> dict:
+    """Tareas del loop; se llama desde otro hilo (bloquea hasta `timeout`).
+
+    Si el loop no responde (está bloqueado en código síncrono) se leen las
+    tareas igual, sin garantías de consistencia, y se agrega el stack del
+    hilo del loop, que es lo que lo está bloqueando.
+    """
+    loop = loop or _loop
+    if loop is None or loop.is_closed():
+        raise LookupError("No hay event loop registrado en este proceso")
+    try:
+        return asyncio.run_coroutine_threadsafe(_tasks_in_loop(), loop).result(timeout)
+    except concurrent.futures.TimeoutError:
+        logger.warning(f"⚠️ El event loop no respondió en {timeout:g}s; tareas leídas desde afuera")
+    for _ in range(3):
+        try:
+            report = tasks_report(loop)
+            break
+        except RuntimeError:
+            # El set de tareas cambió mientras se recorría
+            continue
+    else:
+        report = {"count": None, "tasks": []}
+    report["loop_blocked"] = True
+    frame = sys._current_frames().get(_loop_thread_id) if loop is _loop else None
+    if frame is not None:
+        report["loop_thread_stack"] = _stack(frame)
+    return report
+
+
+async def loop_lag(seconds: float, interval_ms: float = 50) -> dict:
+    """Retraso del loop actual: lo que tarda en volver un `sleep(interval)` de más."""
+    interval = interval_ms / 1000
+    histogram = LatencyHistogram()
+    worst = 0.0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag_ms = max(0.0, (time.perf_counter() - start - interval) * 1000)
+        histogram.observe(lag_ms)
+        worst = max(worst, lag_ms)
+    stats = histogram.to_dict()
+    return {
+        "interval_ms": interval_ms,
+        "probes": stats["count"],
+        "mean_ms": stats["mean_ms"],
+        "p50_ms": stats["p50_ms"],
+        "p95_ms": stats["p95_ms"],
+        "p99_ms": stats["p99_ms"],
+        "max_ms": round(worst, 1),
+        "loop_blocked": False,
+    }
+
+
+def measure_loop_lag(seconds: float, interval_ms: float = 50, loop: asyncio.AbstractEventLoop | None = None) -> dict:
+    """`loop_lag` sobre el loop registrado, desde otro hilo (bloquea)."""
+    loop = loop or _loop
+    if loop is None or loop.is_closed():
+        raise LookupError("No hay event loop registrado en este proceso")
+    future = asyncio.run_coroutine_threadsafe(loop_lag(seconds, interval_ms), loop)
+    try:
+        return future.result(seconds + 5)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        frame = sys._current_frames().get(_loop_thread_id) if loop is _loop else None
+        return {
+            "interval_ms": interval_ms,
+            "loop_blocked": True,
+            "loop_thread_stack": _stack(frame) if frame is not None else None,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Memoria
+# ---------------------------------------------------------------------------
+
+
+def tracemalloc_top(seconds: float, limit: int = 25, group_by: str = "lineno") -> dict:
+    """Las `limit` ubicaciones con más memoria asignada (y viva) tras `seconds`.
+
+    Si tracemalloc no estaba activo se enciende solo durante la ventana, así
+    que lo que se ve es lo asignado en esos segundos; si ya estaba activo
+    (PYTHONTRACEMALLOC) se respeta y se ve todo lo trazado.
+    """
+    if group_by not in TRACEMALLOC_GROUPS:
+        raise ValueError(f"group_by debe ser uno de {TRACEMALLOC_GROUPS}")
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("Ya hay una medición en curso")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        logger.info(f"🧮 tracemalloc durante {seconds:g}s")
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    stats = snapshot.statistics(group_by)
+    top = []
+    for stat in stats[:limit]:
+        frames = stat.traceback if group_by == "traceback" else stat.traceback[:1]
+        top.append({
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+            "location": [f"{frame.filename}:{frame.lineno}" for frame in frames],
+        })
+    return {
+        "window_s": seconds,
+        "window_only": started_here,
+        "group_by": group_by,
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "total_kb": round(sum(stat.size for stat in stats) / 1024, 1),
+        "top": top,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Parámetros compartidos por el servidor de operaciones y la API de chat
+# ---------------------------------------------------------------------------
+
+
+def _number(query: Dict[str, str], name: str, default: float, low: float, high: float) -> float:
+    raw = query.get(name)
+    try:
+        value = float(raw) if raw not in (None, "") else default
+    except ValueError:
+        raise ValueError(f"{name} debe ser un número")
+    if not low <= value <= high:
+        raise ValueError(f"{name} debe estar entre {low:g} y {high:g}")
+    return value
+
+
+def profile_args(query: Dict[str, str]) -> Tuple[float, str, float, str]:
+    """(seconds, mode, interval_ms, format) validados desde la query."""
+    fmt = query.get("format", "folded")
+    if fmt not in ("folded", "json"):
+        raise ValueError("format debe ser folded o json")
+    return (
+        _number(query, "seconds", 10, 0.1, PROFILE_MAX_SECONDS),
+        query.get("mode", "wall"),
+        _number(query, "interval_ms", PROFILE_INTERVAL_MS, 1, 1000),
+        fmt,
+    )
+
+
+def loop_lag_args(query: Dict[str, str]) -> Tuple[float, float]:
+    return _number(query, "seconds", 5, 0.1, PROFILE_MAX_SECONDS), _number(query, "interval_ms", 50, 1, 5000)
+
+
+def tracemalloc_args(query: Dict[str, str]) -> Tuple[float, int, str]:
+    return (
+        _number(query, "seconds", 10, 0, PROFILE_MAX_SECONDS),
+        int(_number(query, "limit", 25, 1, TRACEMALLOC_MAX_LIMIT)),
+        query.get("group_by", "lineno"),
+    )
+
+
+def run_profile(query: Dict[str, str]):
+    """Perfil según la query: texto colapsado o resumen JSON."""
+    seconds, mode, interval_ms, fmt = profile_args(query)
+    result = profile(seconds, mode, interval_ms)
+    return folded_text(result) if fmt == "folded" else summarize(result)
+
+
+def _ops(fn):
+    """Adapta una función de diagnóstico a un handler del servidor de operaciones."""
+    def handler(query):
+        try:
+            return 200, fn(query)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except ProfilerBusy as e:
+            return 409, {"error": str(e)}
+        except LookupError as e:
+            return 503, {"error": str(e)}
+    return handler
+
+
+register_route("/debug/profile", _ops(run_profile), admin=True)
+register_route("/debug/tasks", _ops(lambda query: dump_tasks()), admin=True)
+register_route("/debug/loop-lag", _ops(lambda query: measure_loop_lag(*loop_lag_args(query))), admin=True)
+register_route("/debug/tracemalloc", _ops(lambda query: tracemalloc_top(*tracemalloc_args(query))), admin=True)
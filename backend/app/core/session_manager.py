@@ -0,0 +1,181 @@
+"""
+Registro de sesiones de voz activas del proceso y control de admisión.
+
+Cada conexión pide un lugar con `try_acquire()` antes de armar el pipeline;
+si ya hay MAX_CONCURRENT_SESSIONS sesiones, se rechaza en el momento en vez
+de aceptar una llamada más que degrade la latencia de todas las demás.
+
+El consumo de CPU se estima muestreando el tiempo de CPU del proceso cada
+CPU_SAMPLE_INTERVAL segundos y repartiéndolo entre las sesiones activas en
+ese intervalo (todas comparten el mismo event loop, así que no hay forma de
+medirlo por sesión directamente). Con eso /capacity calcula cuántas sesiones
+más entran en los núcleos disponibles.
+
+`POST /drain` deja de aceptar sesiones nuevas (/capacity pasa a 503) sin
+cortar las activas; el supervisor de start.py lo usa antes de detener un
+worker para que las llamadas en curso terminen. Como no tiene vuelta atrás,
+pide ADMIN_TOKEN igual que las rutas de diagnóstico.
+"""
+import math
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from app.core.ops_server import register_route
+
+# 0 = sin límite
+MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", 0))
+CPU_SAMPLE_INTERVAL = float(os.getenv("CPU_SAMPLE_INTERVAL", 5))
+# Fracción de los núcleos que se considera usable al estimar capacidad
+CAPACITY_TARGET_UTILIZATION = float(os.getenv("CAPACITY_TARGET_UTILIZATION", 0.7))
+
+
+@dataclass
+class VoiceSession:
+    id: str
+    started_at: float = field(default_factory=time.time)
+    task: Any = None
+    cpu_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        age = time.time() - self.started_at
+        return {
+            "id": self.id,
+            "age_s": round(age, 1),
+            "cpu_seconds_est": round(self.cpu_seconds, 2),
+            "cores_est": round(self.cpu_seconds / age, 3) if age > 0 else 0.0,
+        }
+
+
+class SessionManager:
+    """Sesiones activas, límite de concurrencia y estimación de capacidad."""
+
+    def __init__(self, max_sessions: int = MAX_CONCURRENT_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, VoiceSession] = {}
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread | None = None
+        self._cores_per_session: float | None = None
+        self._process_cores = 0.0
+        self.draining = False
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0}
+
+    @property
+    def active(self) -> int:
+        return len(self._sessions)
+
+    def try_acquire(self, session_id: Optional[str] = None) -> Optional[VoiceSession]:
+        """Reserva un lugar para una sesión nueva. Retorna None si no hay capacidad."""
+        with self._lock:
+            if self.draining:
+                self.stats["rejected"] += 1
+                logger.warning(f"🚫 Sesión rechazada: el proceso se está drenando ({len(self._sessions)} activas)")
+                return None
+            if self.max_sessions and len(self._sessions) >= self.max_sessions:
+                self.stats["rejected"] += 1
+                logger.warning(f"🚫 Sesión rechazada: {len(self._sessions)}/{self.max_sessions} sesiones activas")
+                return None
+            session = VoiceSession(id=session_id or str(uuid.uuid4()))
+            self._sessions[session.id] = session
+            self.stats["accepted"] += 1
+        self._ensure_sampler()
+        logger.info(f"📞 Sesión {session.id} iniciada ({self.active} activas)")
+        return session
+
+    def drain(self) -> dict:
+        """Deja de aceptar sesiones nuevas; las activas siguen hasta terminar."""
+        if not self.draining:
+            self.draining = True
+            logger.info(f"🚰 Drenando: no se aceptan sesiones nuevas ({self.active} activas)")
+        return self.snapshot()
+
+    def register_task(self, session: VoiceSession, task):
+        """Asocia el PipelineTask de la sesión (para poder cancelarla desde afuera)."""
+        session.task = task
+
+    def release(self, session: VoiceSession):
+        with self._lock:
+            if self._sessions.pop(session.id, None) is None:
+                return
+            self.stats["completed"] += 1
+        logger.info(
+            f"📴 Sesión {session.id} terminada ({time.time() - session.started_at:.0f}s, "
+            f"~{session.cpu_seconds:.1f}s de CPU, {self.active} activas)"
+        )
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_cpu, name="session-cpu", daemon=True)
+            self._sampler.start()
+
+    def _sample_cpu(self):
+        last_cpu, last_wall = time.process_time(), time.monotonic()
+        while True:
+            time.sleep(CPU_SAMPLE_INTERVAL)
+            cpu, wall = time.process_time(), time.monotonic()
+            cpu_delta, wall_delta = cpu - last_cpu, wall - last_wall
+            last_cpu, last_wall = cpu, wall
+
+            self._process_cores = cpu_delta / wall_delta if wall_delta else 0.0
+            with self._lock:
+                sessions = list(self._sessions.values())
+            if not sessions:
+                continue
+            share = cpu_delta / len(sessions)
+            for session in sessions:
+                session.cpu_seconds += share
+            # Media móvil de núcleos por sesión para suavizar picos
+            current = self._process_cores / len(sessions)
+            if self._cores_per_session is None:
+                self._cores_per_session = current
+            else:
+                self._cores_per_session = 0.8 * self._cores_per_session + 0.2 * current
+
+    def capacity(self) -> dict:
+        """Estado para autoscaling y el balanceador."""
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        estimated_max = None
+        if self._cores_per_session:
+            estimated_max = math.floor(cores * CAPACITY_TARGET_UTILIZATION / self._cores_per_session)
+        limit = self.max_sessions or None
+        candidates = [x for x in (limit, estimated_max) if x is not None]
+        effective_max = min(candidates) if candidates else None
+        available = max(effective_max - self.active, 0) if effective_max is not None else None
+
+        return {
+            "active_sessions": self.active,
+            "max_sessions": limit,
+            "estimated_max_sessions": estimated_max,
+            "available": available,
+            "accepting": not self.draining and not (limit and self.active >= limit),
+            "draining": self.draining,
+            "cores": cores,
+            "process_cores_used": round(self._process_cores, 3),
+            "cores_per_session_est": round(self._cores_per_session, 3) if self._cores_per_session else None,
+            "utilization": round(self._process_cores / cores, 3),
+            **self.stats,
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            sessions = [s.to_dict() for s in self._sessions.values()]
+        return {"active_sessions": len(sessions), "draining": self.draining, "sessions": sessions}
+
+
+session_manager = SessionManager()
+
+
+def _capacity_route(query):
+    # 503 cuando no acepta sesiones, para usarlo como health check del balanceador
+    capacity = session_manager.capacity()
+    return (200 if capacity["accepting"] else 503), capacity
+
+
+register_route("/capacity", _capacity_route)
+register_route("/sessions", lambda query: (200, session_manager.snapshot()))
+register_route("/drain", lambda query: (200, session_manager.drain()), method="POST", admin=True)
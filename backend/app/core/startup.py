@@ -0,0 +1,96 @@
+"""
+Medición del arranque y precarga en segundo plano.
+
+`startup.phase("nombre")` mide una fase (imports, carga de modelos...) y
+`startup.prewarm([...])` ejecuta en un hilo aparte las precargas que no hacen
+falta para levantar el servidor. Cuando terminan, el proceso queda "listo"
+(`startup.ready`), que es lo que expone /ready en el servidor de operaciones.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from loguru import logger
+
+# Si quien lanza el proceso (start.py, benchmarks/startup) define
+# STARTUP_LAUNCHED_AT=time.time(), el reporte incluye el arranque del intérprete
+_LAUNCHED_AT = float(os.getenv("STARTUP_LAUNCHED_AT", 0)) or None
+
+
+class StartupTracker:
+    """Tiempos de cada fase del arranque y estado de readiness."""
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._wall_t0 = time.time()
+        self._phases: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._ready = threading.Event()
+        self._ready_at: float | None = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Mide la duración de un bloque y la guarda con ese nombre."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] = round(elapsed, 3)
+            logger.info(f"⏱️ {name}: {elapsed:.2f}s")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def mark_ready(self):
+        if self._ready.is_set():
+            return
+        self._ready_at = time.perf_counter() - self._t0
+        self._ready.set()
+        logger.info(f"✅ Listo para recibir sesiones ({self._ready_at:.2f}s desde el import)")
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def prewarm(self, tasks: List[Tuple[str, Callable[[], object]]]) -> threading.Thread:
+        """
+        Ejecuta las precargas en orden en un hilo daemon y marca el proceso
+        como listo al terminar. Una precarga que falla no bloquea la
+        readiness: la primera sesión la volverá a intentar al usarla.
+        """
+        def run():
+            for name, task in tasks:
+                try:
+                    with self.phase(name):
+                        task()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    logger.error(f"❌ Error en precarga '{name}': {e}")
+            self.mark_ready()
+
+        thread = threading.Thread(target=run, name="startup-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self) -> dict:
+        with self._lock:
+            phases = dict(self._phases)
+        report = {
+            "ready": self.ready,
+            "ready_after_s": round(self._ready_at, 3) if self._ready_at is not None else None,
+            "uptime_s": round(time.perf_counter() - self._t0, 3),
+            "phases": phases,
+            "errors": dict(self._errors),
+        }
+        if _LAUNCHED_AT:
+            # Tiempo entre el lanzamiento del proceso y el primer import de este módulo
+            report["interpreter_s"] = round(self._wall_t0 - _LAUNCHED_AT, 3)
+        return report
+
+
+startup = StartupTracker()
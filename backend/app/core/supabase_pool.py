@@ -0,0 +1,290 @@
+"""
+Acceso asíncrono a Supabase con un pool de conexiones HTTP compartido.
+
+Los clientes de `supabase_client.py` son síncronos: cada consulta bloquea el
+hilo que la hace (y, llamadas desde el event loop, la llamada de voz entera),
+con los timeouts por defecto de httpx y sin reintentos. `SupabasePool` usa el
+cliente asíncrono de supabase-py sobre un único `httpx.AsyncClient` por
+proyecto y event loop:
+
+  - Conexiones keep-alive reutilizadas entre consultas (SUPABASE_MAX_CONNECTIONS,
+    SUPABASE_MAX_KEEPALIVE, SUPABASE_KEEPALIVE_EXPIRY): sin handshake TLS por
+    consulta.
+  - Timeouts de conexión, lectura y espera de una conexión libre
+    (SUPABASE_CONNECT_TIMEOUT, SUPABASE_READ_TIMEOUT, SUPABASE_POOL_TIMEOUT).
+  - Reintentos acotados (SUPABASE_RETRIES) con backoff exponencial y jitter
+    completo. Las lecturas (`idempotent=True`) se reintentan ante cualquier
+    error de red o 5xx; las escrituras solo si la petición no llegó a salir
+    (fallo al conectar o al conseguir conexión).
+  - Métricas por proyecto en /db/pool: consultas en curso, espera por una
+    conexión, conexiones abiertas y reutilización, reintentos y latencia.
+  - Un span por consulta (`db <label>`, app/core/tracing.py) con el proyecto,
+    los reintentos y el resultado.
+
+Las consultas se arman con una función que recibe el cliente asíncrono:
+
+    rows = (await get_supabase_pool().execute(
+        lambda c: c.table("messages").select("*").eq("conversation_id", cid),
+        idempotent=True,
+    )).data
+
+La función se vuelve a llamar en cada intento, así que también sirve para
+corrutinas (`lambda c: c.auth.admin.create_user({...})`).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+import httpx
+from dotenv import load_dotenv
+from loguru import logger
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+from app.core.metrics import LatencyHistogram
+from app.core.ops_server import register_route
+from app.core.tracing import span
+
+load_dotenv()
+
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 3.0))
+SUPABASE_READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", 10.0))
+# Espera máxima por una conexión libre del pool
+SUPABASE_POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", 5.0))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", 20))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", 10))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", 60.0))
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", 2))
+SUPABASE_RETRY_BACKOFF = float(os.getenv("SUPABASE_RETRY_BACKOFF", 0.1))
+SUPABASE_RETRY_MAX_BACKOFF = float(os.getenv("SUPABASE_RETRY_MAX_BACKOFF", 1.0))
+
+# La petición no llegó al servidor: se puede reintentar aunque escriba
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Errores de red que solo se reintentan en lecturas
+TRANSIENT_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+# Gateway caído o PostgREST sin conexión a Postgres
+TRANSIENT_CODES = {502, 503, 504, "502", "503", "504", "PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+
+
+@dataclass
+class PoolConfig:
+    connect_timeout: float = SUPABASE_CONNECT_TIMEOUT
+    read_timeout: float = SUPABASE_READ_TIMEOUT
+    pool_timeout: float = SUPABASE_POOL_TIMEOUT
+    max_connections: int = SUPABASE_MAX_CONNECTIONS
+    max_keepalive: int = SUPABASE_MAX_KEEPALIVE
+    keepalive_expiry: float = SUPABASE_KEEPALIVE_EXPIRY
+    retries: int = SUPABASE_RETRIES
+    retry_backoff: float = SUPABASE_RETRY_BACKOFF
+    retry_max_backoff: float = SUPABASE_RETRY_MAX_BACKOFF
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def is_retryable(error: Exception, idempotent: bool) -> bool:
+    if isinstance(error, NOT_SENT_ERRORS):
+        return True
+    if not idempotent:
+        return False
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return getattr(error, "code", None) in TRANSIENT_CODES
+
+
+class PoolStats:
+    """Contadores e histogramas de un pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.http_requests = 0
+        self.connections_opened = 0
+        self.latency = LatencyHistogram()
+        # Espera por un lugar en el pool antes de mandar la consulta
+        self.queue_wait = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        reused = self.http_requests - self.connections_opened
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "http_requests": self.http_requests,
+            "connections_opened": self.connections_opened,
+            "connection_reuse": round(reused / self.http_requests, 3) if self.http_requests else None,
+            "latency": self.latency.to_dict(),
+            "queue_wait": self.queue_wait.to_dict(),
+        }
+
+
+@dataclass
+class _LoopClient:
+    client: AsyncClient
+    http: httpx.AsyncClient
+    slots: asyncio.Semaphore
+
+
+class SupabasePool:
+    """Cliente asíncrono de un proyecto de Supabase con pool, timeouts, reintentos y métricas."""
+
+    def __init__(self, name: str, url: str | None, key: str | None, config: PoolConfig | None = None):
+        self.name = name
+        self._url = url
+        self._key = key
+        self.config = config or PoolConfig()
+        # httpx y asyncio atan las conexiones al event loop donde se crearon
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClient]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.stats = PoolStats()
+
+    def _http_client(self) -> httpx.AsyncClient:
+        config = self.config
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.read_timeout,
+                connect=config.connect_timeout,
+                pool=config.pool_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            event_hooks={"request": [self._on_request]},
+        )
+
+    async def _on_request(self, request: httpx.Request):
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.stats.http_requests += 1
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.started":
+            with self._lock:
+                self.stats.connections_opened += 1
+
+    async def _loop_client(self) -> _LoopClient:
+        loop = asyncio.get_running_loop()
+        state = self._clients.get(loop)
+        if state is not None:
+            return state
+        if not self._url or not self._key:
+            raise RuntimeError(f"Faltan la URL o la key de Supabase ({self.name})")
+        http = self._http_client()
+        client = await acreate_client(
+            self._url,
+            self._key,
+            options=AsyncClientOptions(httpx_client=http, auto_refresh_token=False, persist_session=False),
+        )
+        # Otra corrutina pudo haberlo creado mientras tanto
+        state = self._clients.get(loop)
+        if state is not None:
+            await http.aclose()
+            return state
+        state = _LoopClient(client=client, http=http, slots=asyncio.Semaphore(self.config.max_connections))
+        self._clients[loop] = state
+        logger.debug(f"🔌 Pool de Supabase '{self.name}' creado ({self.config.max_connections} conexiones)")
+        return state
+
+    async def client(self) -> AsyncClient:
+        """Cliente asíncrono de supabase-py del event loop actual."""
+        return (await self._loop_client()).client
+
+    def _backoff(self, attempt: int) -> float:
+        # Jitter completo: entre 0 y el backoff exponencial del intento
+        ceiling = min(self.config.retry_max_backoff, self.config.retry_backoff * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def execute(self, build: Callable[[AsyncClient], Any], idempotent: bool = False, label: str = "") -> Any:
+        """
+        Ejecuta `build(client)` (un builder de postgrest o una corrutina) y
+        retorna la respuesta. Reintenta los errores transitorios según
+        `idempotent`; el último error se propaga.
+        """
+        with span(f"db {label or 'query'}", kind="client", **{"db.system": "postgrest", "db.pool": self.name}) as db_span:
+            return await self._execute(build, idempotent, label, db_span)
+
+    async def _execute(self, build: Callable[[AsyncClient], Any], idempotent: bool, label: str, db_span) -> Any:
+        state = await self._loop_client()
+        stats = self.stats
+        start = time.perf_counter()
+        with self._lock:
+            stats.requests += 1
+
+        async with state.slots:
+            with self._lock:
+                queue_wait_ms = (time.perf_counter() - start) * 1000
+                stats.queue_wait.observe(queue_wait_ms)
+                stats.in_flight += 1
+                stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            try:
+                attempt = 0
+                while True:
+                    request = build(state.client)
+                    try:
+                        response = await (request.execute() if hasattr(request, "execute") else request)
+                        db_span.set_attributes(**{"db.attempts": attempt + 1, "db.queue_wait_ms": round(queue_wait_ms, 1)})
+                        return response
+                    except Exception as e:
+                        if attempt >= self.config.retries or not is_retryable(e, idempotent):
+                            db_span.set_attributes(**{"db.attempts": attempt + 1, "db.error_code": getattr(e, "code", None)})
+                            with self._lock:
+                                stats.errors += 1
+                            raise
+                        delay = self._backoff(attempt)
+                        attempt += 1
+                        with self._lock:
+                            stats.retries += 1
+                        logger.warning(
+                            f"🔁 Supabase '{self.name}'{f' ({label})' if label else ''}: "
+                            f"{type(e).__name__}, reintento {attempt}/{self.config.retries} en {delay * 1000:.0f} ms"
+                        )
+                        await asyncio.sleep(delay)
+            finally:
+                with self._lock:
+                    stats.in_flight -= 1
+                    stats.latency.observe((time.perf_counter() - start) * 1000)
+
+    async def aclose(self):
+        """Cierra las conexiones del event loop actual."""
+        state = self._clients.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state.http.aclose()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"loops": len(self._clients), "config": self.config.to_dict(), **self.stats.to_dict()}
+
+
+_pools: Dict[str, SupabasePool] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(name: str, url_env: str, key_env: str) -> SupabasePool:
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = SupabasePool(name, os.getenv(url_env), os.getenv(key_env))
+        return _pools[name]
+
+
+def get_supabase_pool() -> SupabasePool:
+    """Pool del proyecto principal (CerebroSonora)."""
+    return _get_pool("main", "SUPABASE_URL", "SUPABASE_SERVICE_KEY")
+
+
+def get_tuguia_pool() -> SupabasePool:
+    """Pool del proyecto de Tu Guía."""
+    return _get_pool("tuguia", "TUGUIA_SUPABASE_URL", "TUGUIA_SUPABASE_SERVICE_KEY")
+
+
+register_route("/db/pool", lambda query: (200, {name: pool.snapshot() for name, pool in list(_pools.items())}))
@@ -0,0 +1,404 @@
+"""
+Supervisor de procesos de `start.py --supervise`.
+
+Levanta la API de chat y VOICE_WORKERS procesos de voz (bot.py), cada uno en
+su puerto local (VOICE_WORKER_PORT_BASE + i, operaciones en
+VOICE_WORKER_OPS_PORT_BASE + i), y los mantiene vivos:
+
+  - Arranque: cada worker tiene STARTUP_READY_TIMEOUT segundos para responder
+    en su URL de listo (/ready del servidor de operaciones, /health en chat).
+  - Vida: una vez listo se le pregunta cada SUPERVISOR_CHECK_INTERVAL
+    segundos; con LIVENESS_FAILURES fallas seguidas se lo mata y reinicia.
+    En voz se consulta el puerto de Pipecat (no el de operaciones, que corre
+    en su propio hilo y responde aunque el event loop esté colgado).
+  - Reinicio: con backoff exponencial (RESTART_BACKOFF_BASE, hasta
+    RESTART_BACKOFF_MAX); el contador vuelve a cero cuando el worker aguanta
+    WORKER_STABLE_SECONDS.
+  - SIGTERM / Ctrl+C: los workers de voz reciben POST /drain con el
+    ADMIN_TOKEN (si no está definido, el supervisor genera uno para sus
+    workers) y dejan de tomar llamadas, y se espera a que terminen las activas, hasta DRAIN_TIMEOUT; la
+    API de chat recibe SIGTERM, que en uvicorn ya espera las peticiones en
+    curso. Los hijos corren en su propia sesión para que el Ctrl+C de la
+    terminal no les llegue directo y corte las llamadas.
+
+Los clientes de voz entran por un solo puerto (VOICE_PORT, 7860) a través de
+`VoiceRouter` (app/core/voice_router.py). El estado agregado queda en el
+puerto de operaciones del supervisor (OPS_PORT, 7862):
+
+    GET /live     200 mientras el supervisor esté vivo
+    GET /ready    200 si hay al menos un worker de voz listo y la API de chat
+    GET /status   estado de cada worker, reinicios y sesiones totales
+"""
+import json
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.core.ops_server import register_route, start_ops_server
+
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", 1))
+VOICE_PORT = int(os.getenv("VOICE_PORT", 7860))
+VOICE_WORKER_HOST = os.getenv("VOICE_WORKER_HOST", "127.0.0.1")
+VOICE_WORKER_PORT_BASE = int(os.getenv("VOICE_WORKER_PORT_BASE", 7870))
+VOICE_WORKER_OPS_PORT_BASE = int(os.getenv("VOICE_WORKER_OPS_PORT_BASE", 7880))
+CHAT_API_PORT = int(os.getenv("CHAT_API_PORT", 7861))
+
+SUPERVISOR_CHECK_INTERVAL = float(os.getenv("SUPERVISOR_CHECK_INTERVAL", 2))
+SUPERVISOR_STATUS_INTERVAL = float(os.getenv("SUPERVISOR_STATUS_INTERVAL", 60))
+LIVENESS_TIMEOUT = float(os.getenv("LIVENESS_TIMEOUT", 2))
+LIVENESS_FAILURES = int(os.getenv("LIVENESS_FAILURES", 3))
+READY_TIMEOUT = float(os.getenv("STARTUP_READY_TIMEOUT", 120))
+RESTART_BACKOFF_BASE = float(os.getenv("RESTART_BACKOFF_BASE", 1))
+RESTART_BACKOFF_MAX = float(os.getenv("RESTART_BACKOFF_MAX", 60))
+WORKER_STABLE_SECONDS = float(os.getenv("WORKER_STABLE_SECONDS", 60))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 300))
+# Espera entre SIGTERM y SIGKILL
+STOP_TIMEOUT = float(os.getenv("STOP_TIMEOUT", 10))
+# /drain de los workers pide token; sin ADMIN_TOKEN se usa uno que solo conoce el supervisor
+WORKER_ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or secrets.token_urlsafe(32)
+
+
+def probe(url: str, method: str = "GET", timeout: float = LIVENESS_TIMEOUT) -> Optional[int]:
+    """Status HTTP de `url`, o None si no respondió."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def fetch_json(
+    url: str, method: str = "GET", timeout: float = LIVENESS_TIMEOUT, headers: Optional[Dict[str, str]] = None
+) -> Optional[dict]:
+    """JSON de `url` (también en respuestas 4xx/5xx), o None si no respondió."""
+    try:
+        request = urllib.request.Request(url, method=method, headers=headers or {})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            return json.loads(e.read())
+        except ValueError:
+            return None
+    except Exception:
+        return None
+
+
+@dataclass
+class WorkerSpec:
+    """Cómo lanzar y revisar un proceso."""
+
+    name: str
+    command: List[str]
+    ready_url: str
+    live_url: str
+    env: Dict[str, str] = field(default_factory=dict)
+    port: Optional[int] = None
+    # Solo voz: servidor de operaciones del worker
+    ops_url: Optional[str] = None
+
+
+@dataclass
+class Worker:
+    """Estado de un proceso supervisado."""
+
+    spec: WorkerSpec
+    process: Optional[subprocess.Popen] = None
+    state: str = "stopped"  # starting | ready | backoff | draining | stopped
+    started_at: float = 0.0
+    ready_at: Optional[float] = None
+    restart_at: float = 0.0
+    restarts: int = 0
+    consecutive_restarts: int = 0
+    liveness_failures: int = 0
+    last_exit: Optional[int] = None
+    last_restart_reason: Optional[str] = None
+    capacity: Optional[dict] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def routable(self) -> bool:
+        """Puede recibir llamadas nuevas (listo, no drenando y con lugar)."""
+        return self.state == "ready" and self.alive and (self.capacity or {}).get("accepting", True)
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        info = {
+            "name": self.spec.name,
+            "state": self.state,
+            "pid": self.process.pid if self.alive else None,
+            "port": self.spec.port,
+            "uptime_s": round(now - self.started_at, 1) if self.alive else None,
+            "startup_s": round(self.ready_at - self.started_at, 1) if self.ready_at else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "last_restart_reason": self.last_restart_reason,
+        }
+        if self.state == "backoff":
+            info["restart_in_s"] = round(max(self.restart_at - now, 0.0), 1)
+        if self.capacity is not None:
+            info["active_sessions"] = self.capacity.get("active_sessions")
+            info["accepting"] = self.capacity.get("accepting")
+            info["cores_used"] = self.capacity.get("process_cores_used")
+        return info
+
+
+def voice_worker_spec(index: int) -> WorkerSpec:
+    port = VOICE_WORKER_PORT_BASE + index
+    ops_port = VOICE_WORKER_OPS_PORT_BASE + index
+    ops_url = f"http://127.0.0.1:{ops_port}"
+    return WorkerSpec(
+        name=f"voice-{index}",
+        command=[sys.executable, "bot.py", "--host", VOICE_WORKER_HOST, "--port", str(port)],
+        env={"OPS_PORT": str(ops_port), "OPS_HOST": "127.0.0.1", "ADMIN_TOKEN": WORKER_ADMIN_TOKEN},
+        ready_url=f"{ops_url}/ready",
+        # Lo atiende el event loop de Pipecat: 405 (GET en una ruta POST) prueba que el loop responde
+        live_url=f"http://127.0.0.1:{port}/api/offer",
+        port=port,
+        ops_url=ops_url,
+    )
+
+
+def chat_worker_spec() -> WorkerSpec:
+    health = f"http://127.0.0.1:{CHAT_API_PORT}/health"
+    return WorkerSpec(
+        name="chat",
+        command=[sys.executable, "-m", "app.api.server"],
+        env={"CHAT_API_PORT": str(CHAT_API_PORT)},
+        ready_url=health,
+        live_url=health,
+        port=CHAT_API_PORT,
+    )
+
+
+class Supervisor:
+    """Lanza los workers, los revisa y los reinicia; drena todo al detenerse."""
+
+    def __init__(self, specs: List[WorkerSpec], cwd: str):
+        self.workers = [Worker(spec) for spec in specs]
+        self.cwd = cwd
+        self._stop = threading.Event()
+        self._force = threading.Event()
+        self._lock = threading.Lock()
+        self._last_status_log = 0.0
+
+    @property
+    def voice_workers(self) -> List[Worker]:
+        return [w for w in self.workers if w.spec.ops_url]
+
+    # -- ciclo de vida -------------------------------------------------------
+
+    def _spawn(self, worker: Worker):
+        now = time.time()
+        worker.process = subprocess.Popen(
+            worker.spec.command,
+            cwd=self.cwd,
+            env={**os.environ, **worker.spec.env, "STARTUP_LAUNCHED_AT": str(now)},
+            start_new_session=True,
+        )
+        worker.state = "starting"
+        worker.started_at = now
+        worker.ready_at = None
+        worker.liveness_failures = 0
+        worker.capacity = None
+        logger.info(f"▶️ {worker.spec.name} lanzado (pid {worker.process.pid})")
+
+    def _kill(self, worker: Worker, timeout: float = STOP_TIMEOUT):
+        """SIGTERM y, si no sale en `timeout`, SIGKILL."""
+        if not worker.alive:
+            return
+        worker.process.terminate()
+        try:
+            worker.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"⚠️ {worker.spec.name} no salió con SIGTERM en {timeout:g}s; SIGKILL")
+            worker.process.kill()
+            worker.process.wait()
+
+    def _schedule_restart(self, worker: Worker, reason: str):
+        self._kill(worker)
+        worker.last_exit = worker.process.returncode if worker.process else None
+        delay = min(RESTART_BACKOFF_BASE * 2 ** worker.consecutive_restarts, RESTART_BACKOFF_MAX)
+        worker.consecutive_restarts += 1
+        worker.restarts += 1
+        worker.last_restart_reason = reason
+        worker.restart_at = time.time() + delay
+        worker.state = "backoff"
+        worker.capacity = None
+        logger.error(f"💥 {worker.spec.name}: {reason}; reinicio en {delay:g}s (reinicio #{worker.restarts})")
+
+    def _check(self, worker: Worker):
+        now = time.time()
+        if worker.state == "backoff":
+            if now >= worker.restart_at:
+                self._spawn(worker)
+            return
+        if worker.state not in ("starting", "ready"):
+            return
+        if worker.process.poll() is not None:
+            self._schedule_restart(worker, f"terminó con código {worker.process.returncode}")
+            return
+
+        if worker.state == "starting":
+            if probe(worker.spec.ready_url) == 200:
+                worker.state = "ready"
+                worker.ready_at = now
+                logger.info(f"✅ {worker.spec.name} listo en {now - worker.started_at:.1f}s")
+            elif now - worker.started_at > READY_TIMEOUT:
+                self._schedule_restart(worker, f"no estuvo listo en {READY_TIMEOUT:.0f}s")
+            return
+
+        status = probe(worker.spec.live_url)
+        if status is None or status >= 500:
+            worker.liveness_failures += 1
+            logger.warning(f"⚠️ {worker.spec.name} no respondió ({worker.liveness_failures}/{LIVENESS_FAILURES})")
+            if worker.liveness_failures >= LIVENESS_FAILURES:
+                self._schedule_restart(worker, f"{LIVENESS_FAILURES} chequeos de vida fallidos")
+            return
+        worker.liveness_failures = 0
+        if worker.consecutive_restarts and now - worker.started_at >= WORKER_STABLE_SECONDS:
+            worker.consecutive_restarts = 0
+        if worker.spec.ops_url:
+            worker.capacity = fetch_json(f"{worker.spec.ops_url}/capacity")
+
+    def check_all(self):
+        with self._lock:
+            for worker in self.workers:
+                try:
+                    self._check(worker)
+                except Exception as e:
+                    logger.error(f"❌ Error revisando {worker.spec.name}: {e}")
+        if SUPERVISOR_STATUS_INTERVAL and time.time() - self._last_status_log >= SUPERVISOR_STATUS_INTERVAL:
+            self._last_status_log = time.time()
+            self.log_status()
+
+    def run(self):
+        """Lanza los workers y los supervisa hasta `stop()` (bloquea)."""
+        with self._lock:
+            for worker in self.workers:
+                self._spawn(worker)
+        while not self._stop.wait(SUPERVISOR_CHECK_INTERVAL):
+            self.check_all()
+        self.shutdown()
+
+    def stop(self):
+        """Pide la detención (seguro desde un handler de señal). La segunda vez
+        no espera a que terminen las llamadas."""
+        if self._stop.is_set():
+            self._force.set()
+        self._stop.set()
+
+    def shutdown(self, drain_timeout: float = DRAIN_TIMEOUT):
+        """Drena los workers de voz, detiene la API de chat y espera a todos."""
+        logger.info("⏹️ Deteniendo: drenando workers")
+        with self._lock:
+            for worker in self.workers:
+                if worker.state == "backoff":
+                    worker.state = "stopped"
+                elif worker.alive:
+                    worker.state = "draining"
+            voice = [w for w in self.voice_workers if w.state == "draining"]
+            others = [w for w in self.workers if w.state == "draining" and w not in voice]
+
+        for worker in voice:
+            drained = fetch_json(
+                f"{worker.spec.ops_url}/drain",
+                method="POST",
+                headers={"Authorization": f"Bearer {WORKER_ADMIN_TOKEN}"},
+            )
+            if drained is None or "error" in drained:
+                logger.warning(f"⚠️ {worker.spec.name} no aceptó /drain: {(drained or {}).get('error', 'sin respuesta')}")
+        # uvicorn ya drena las peticiones en curso con SIGTERM
+        for worker in others:
+            worker.process.terminate()
+
+        deadline = time.time() + drain_timeout
+        pending = list(voice)
+        while pending and time.time() < deadline and not self._force.is_set():
+            still = []
+            for worker in pending:
+                sessions = fetch_json(f"{worker.spec.ops_url}/sessions") if worker.alive else None
+                if worker.alive and sessions and sessions.get("active_sessions"):
+                    still.append(worker)
+                    worker.capacity = {**(worker.capacity or {}), "active_sessions": sessions["active_sessions"]}
+            if still and still != pending:
+                active = sum((w.capacity or {}).get("active_sessions") or 0 for w in still)
+                logger.info(f"🚰 {len(still)} workers de voz con {active} llamadas en curso")
+            pending = still
+            if pending:
+                self._force.wait(1)
+        if pending:
+            logger.warning("⚠️ Drenado interrumpido (DRAIN_TIMEOUT o segunda señal); se cortan las llamadas restantes")
+
+        remaining = max(deadline - time.time(), STOP_TIMEOUT)
+        for worker in voice:
+            self._kill(worker)
+        for worker in others:
+            self._kill(worker, remaining)
+        for worker in self.workers:
+            worker.state = "stopped"
+        logger.info("✅ Todos los workers detenidos")
+
+    # -- estado ---------------------------------------------------------------
+
+    def status(self) -> dict:
+        workers = [w.to_dict() for w in self.workers]
+        voice = self.voice_workers
+        return {
+            "stopping": self._stop.is_set(),
+            "voice_workers": len(voice),
+            "voice_ready": sum(w.state == "ready" for w in voice),
+            "voice_accepting": sum(w.routable for w in voice),
+            "active_sessions": sum((w.capacity or {}).get("active_sessions") or 0 for w in voice),
+            "restarts": sum(w.restarts for w in self.workers),
+            "workers": workers,
+        }
+
+    def ready(self) -> bool:
+        voice = self.voice_workers
+        others = [w for w in self.workers if w not in voice]
+        return any(w.state == "ready" for w in voice) and all(w.state == "ready" for w in others)
+
+    def log_status(self):
+        status = self.status()
+        states = ", ".join(f"{w['name']}={w['state']}" for w in status["workers"])
+        logger.info(
+            f"📋 {status['voice_ready']}/{status['voice_workers']} workers de voz listos, "
+            f"{status['active_sessions']} llamadas, {status['restarts']} reinicios ({states})"
+        )
+
+
+def run_supervised(cwd: str, voice_workers: int = VOICE_WORKERS):
+    """Punto de entrada de `start.py --supervise`."""
+    from app.core.voice_router import VoiceRouter
+
+    supervisor = Supervisor([*(voice_worker_spec(i) for i in range(voice_workers)), chat_worker_spec()], cwd)
+    router = VoiceRouter(supervisor)
+    register_route("/status", lambda query: (200, {**supervisor.status(), "router": router.report()}))
+    # Reemplaza al /ready del proceso: el supervisor no precarga nada propio
+    register_route("/ready", lambda query: (200 if supervisor.ready() else 503, supervisor.status()))
+    start_ops_server()
+    router.start(VOICE_PORT)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: supervisor.stop())
+    logger.info(
+        f"🧭 Supervisor: {voice_workers} workers de voz (puertos {VOICE_WORKER_PORT_BASE}-"
+        f"{VOICE_WORKER_PORT_BASE + voice_workers - 1}) detrás de :{VOICE_PORT}, chat en :{CHAT_API_PORT}"
+    )
+    supervisor.run()
@@ -0,0 +1,29 @@
+"""
+Conteo de tokens del modelo de chat (o200k_base, gpt-4o).
+
+Lo usan el compactador de contexto de voz y la selección de memorias, que
+también corre en la API de chat; por eso vive acá y no en app/pipeline, que
+importa Pipecat.
+"""
+from functools import lru_cache
+
+from loguru import logger
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Tokenizer de gpt-4o. Si no se puede cargar (sin red), se estima por caracteres."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken no disponible, se estiman tokens por caracteres: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
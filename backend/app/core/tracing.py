@@ -0,0 +1,505 @@
+"""
+Trazas distribuidas al estilo OpenTelemetry, sin dependencias nuevas.
+
+Una petición de chat cruza el proxy de Next.js, /api/chat, OpenAI, el RAG
+(embedding + RPC), Tu Guía y las escrituras en Supabase; una llamada de voz,
+STT, LLM, herramientas y TTS en cada turno. Los logs dicen qué pasó pero no
+dónde se fue el tiempo. Este módulo arma spans anidados con:
+
+  - Contexto en contextvars: un span abierto con `span(...)` es el padre de
+    los que se abran dentro, también en tareas de asyncio y en
+    `asyncio.to_thread` (copia el contexto).
+  - Propagación W3C (`traceparent`): `extract(headers)` continúa la traza que
+    llega en una petición; `inject(headers)` la pasa a la siguiente.
+  - Muestreo por traza (TRACE_SAMPLE_RATE) que respeta la decisión del padre.
+    Un span no muestreado solo lleva los IDs para propagarlos: no toma
+    tiempos ni guarda atributos.
+  - Atributos heredados: conversation_id y user_id pasan del padre a cada
+    span hijo.
+  - Exportación en lotes desde un hilo aparte (TRACE_EXPORTER): `none` (por
+    defecto) solo cuenta, `file` escribe un span por línea en TRACE_FILE
+    (JSONL, rota al pasar TRACE_FILE_MAX_MB y guarda TRACE_FILE_BACKUPS
+    archivos viejos), `otlp` los manda en OTLP/HTTP JSON a un collector local
+    (TRACE_OTLP_ENDPOINT). Si la cola se llena se descartan spans en vez de frenar a quien
+    llama.
+
+Uso:
+
+    with span("rag.retrieve", query_chars=len(query)) as s:
+        ...
+        s.set_attribute("rag.results", len(results))
+
+El costo por span se mide con `uv run python -m benchmarks.tracing.run`;
+/tracing muestra la configuración, spans creados, muestreados, exportados y
+descartados.
+"""
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from loguru import logger
+
+from app.core.ops_server import register_route
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Fracción de trazas nuevas que se guardan (las que llegan con traceparent siguen al padre)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", 100))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", 3))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "bot-sonora")
+# Spans esperando exportación; pasado esto se descartan
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", 4096))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", 256))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", 2.0))
+
+# Atributos que cada span copia de su padre al empezar
+INHERITED_ATTRIBUTES = ("conversation_id", "user_id")
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: str | None) -> Optional[SpanContext]:
+    """Contexto de un header `traceparent` W3C, o None si falta o es inválido."""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return SpanContext(trace_id=trace_id, span_id=span_id, sampled=bool(int(flags, 16) & 1))
+
+
+class Span:
+    """Una operación con duración. Sin muestreo solo lleva los IDs."""
+
+    __slots__ = ("name", "context", "parent_id", "kind", "start_ns", "end_ns", "attributes", "status", "status_message", "_tracer")
+
+    def __init__(self, tracer: "Tracer", name: str, context: SpanContext, parent_id: str | None, kind: str, start_ns: int | None):
+        self._tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {}
+        self.status = "unset"
+        self.status_message = ""
+        self.end_ns: Optional[int] = None
+        self.start_ns = (start_ns or time.time_ns()) if context.sampled else 0
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value: Any) -> "Span":
+        if self.context.sampled and value is not None:
+            self.attributes[key] = value
+        return self
+
+    def set_attributes(self, **attributes) -> "Span":
+        if self.context.sampled:
+            self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+        return self
+
+    def set_error(self, error: BaseException | str):
+        if self.context.sampled:
+            self.status = "error"
+            self.status_message = str(error)[:500]
+            if isinstance(error, BaseException):
+                self.attributes["exception.type"] = type(error).__name__
+
+    def end(self, end_ns: int | None = None):
+        if not self.context.sampled or self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self._tracer._export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self._tracer.service_name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "status_message": self.status_message or None,
+            "attributes": self.attributes,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+# Contexto de los spans con las trazas apagadas (no se propaga)
+INVALID_CONTEXT = SpanContext(trace_id="0" * 32, span_id="0" * 16, sampled=False)
+
+
+class _SpanScope:
+    """`with tracer.span(...)`: hace actual el span y lo cierra al salir."""
+
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        # Quien lo marcó antes ya dejó un mensaje más preciso
+        if exc is not None and self.span.status != "error":
+            self.span.set_error(exc)
+        self.span.end()
+        return False
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Hace actual un span creado con `start_span` sin cerrarlo al salir."""
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+
+
+def inject(headers: Dict[str, str] | None = None) -> Dict[str, str]:
+    """Agrega `traceparent` del span actual a `headers` (si hay uno)."""
+    headers = headers if headers is not None else {}
+    span = _current.get()
+    if span is not None and span.context is not INVALID_CONTEXT:
+        headers["traceparent"] = span.context.traceparent
+    return headers
+
+
+def extract(headers: Mapping[str, str]) -> Optional[SpanContext]:
+    """Contexto de la traza que llega en los headers de una petición."""
+    return parse_traceparent(headers.get("traceparent"))
+
+
+# --- exportadores ---
+
+
+class FileExporter:
+    """Un span por línea (JSON) en un archivo local, rotado por tamaño.
+
+    Al pasar `max_mb` el archivo se renombra a `<archivo>.1` (el `.1` anterior
+    pasa a `.2`, y así hasta `backups`; el más viejo se borra), así que en
+    disco nunca hay más de (backups + 1) * max_mb.
+    """
+
+    def __init__(self, path: str = TRACE_FILE, max_mb: float = TRACE_FILE_MAX_MB, backups: int = TRACE_FILE_BACKUPS):
+        self.path = Path(path)
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._backups = backups
+        self._size: Optional[int] = None
+        self.rotations = 0
+
+    def _backup(self, index: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{index}")
+
+    def _rotate(self):
+        if self._backups <= 0:
+            self.path.unlink(missing_ok=True)
+        else:
+            self._backup(self._backups).unlink(missing_ok=True)
+            for index in range(self._backups - 1, 0, -1):
+                if self._backup(index).exists():
+                    self._backup(index).replace(self._backup(index + 1))
+            if self.path.exists():
+                self.path.replace(self._backup(1))
+        self._size = 0
+        self.rotations += 1
+
+    def export(self, spans: List[Span]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in spans).encode("utf-8")
+        if self._size is None:
+            self._size = self.path.stat().st_size if self.path.exists() else 0
+        if self._size and self._size + len(data) > self._max_bytes:
+            self._rotate()
+        with self.path.open("ab") as f:
+            f.write(data)
+        self._size += len(data)
+
+    def close(self):
+        pass
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class OtlpExporter:
+    """OTLP/HTTP con JSON hacia un collector (Jaeger, Tempo, otel-collector)."""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, service_name: str = TRACE_SERVICE_NAME):
+        import httpx
+
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=5.0)
+
+    def export(self, spans: List[Span]):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [{
+                    "traceId": s.context.trace_id,
+                    "spanId": s.context.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": _OTLP_KINDS.get(s.kind, 1),
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2, "message": s.status_message} if s.status == "error" else {},
+                } for s in spans],
+            }],
+        }]}
+        response = self._client.post(self.endpoint, json=payload)
+        response.raise_for_status()
+
+    def close(self):
+        self._client.close()
+
+
+class NullExporter:
+    def export(self, spans: List[Span]):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_exporter(kind: str = TRACE_EXPORTER, service_name: str = TRACE_SERVICE_NAME):
+    if kind == "otlp":
+        return OtlpExporter(service_name=service_name)
+    if kind == "file":
+        return FileExporter()
+    return NullExporter()
+
+
+# --- tracer ---
+
+
+class Tracer:
+    """Crea spans, decide el muestreo y exporta en lotes desde un hilo aparte."""
+
+    def __init__(
+        self,
+        service_name: str = TRACE_SERVICE_NAME,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        exporter=None,
+        enabled: bool = TRACING_ENABLED,
+        queue_size: int = TRACE_QUEUE_SIZE,
+    ):
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.exporter = exporter if exporter is not None else create_exporter(service_name=service_name)
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=queue_size)
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+        # Span que devuelve start_span con las trazas apagadas
+        self._disabled = Span(self, "disabled", INVALID_CONTEXT, None, "internal", None)
+        self.stats = {
+            "traces": 0, "traces_sampled": 0, "remote_parents": 0,
+            "spans": 0, "exported": 0, "dropped": 0, "export_errors": 0,
+        }
+
+    # --- creación ---
+
+    def start_span(
+        self,
+        name: str,
+        parent: Span | SpanContext | None = None,
+        kind: str = "internal",
+        start_ns: int | None = None,
+        **attributes,
+    ) -> Span:
+        """
+        Span nuevo (hay que cerrarlo con `end()`). Sin `parent` usa el span
+        actual; si no hay, empieza una traza. `parent` puede ser el contexto
+        remoto de `extract(headers)`.
+        """
+        if not self.enabled:
+            return self._disabled
+        if parent is None:
+            parent = _current.get()
+        if isinstance(parent, Span):
+            if not parent.context.sampled:
+                # Los hijos de una traza no muestreada tampoco se registran: alcanza con el contexto del padre
+                return parent
+            trace_id, parent_id, sampled = parent.context.trace_id, parent.context.span_id, True
+        elif isinstance(parent, SpanContext):
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < self.sample_rate
+        with self._lock:
+            if parent_id is None:
+                self.stats["traces"] += 1
+                self.stats["traces_sampled"] += sampled
+            self.stats["remote_parents"] += isinstance(parent, SpanContext)
+            self.stats["spans"] += sampled
+
+        span = Span(self, name, SpanContext(trace_id, f"{random.getrandbits(64):016x}", sampled), parent_id, kind, start_ns)
+        if sampled:
+            if isinstance(parent, Span):
+                for key in INHERITED_ATTRIBUTES:
+                    if key in parent.attributes:
+                        span.attributes[key] = parent.attributes[key]
+            span.set_attributes(**attributes)
+        return span
+
+    def span(self, name: str, parent: Span | SpanContext | None = None, kind: str = "internal", **attributes) -> "_SpanScope":
+        """Abre un span como actual (`with`); lo marca con error si sale una excepción."""
+        return _SpanScope(self.start_span(name, parent=parent, kind=kind, **attributes))
+
+    # --- exportación ---
+
+    def _export(self, span: Span):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            try:
+                item = self._queue.get(timeout=TRACE_FLUSH_INTERVAL)
+                stop = item is None
+                if item is not None:
+                    batch.append(item)
+                while not stop and len(batch) < TRACE_BATCH_SIZE:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        stop = True
+                    else:
+                        batch.append(item)
+            except queue.Empty:
+                stop = False
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+            with self._lock:
+                self.stats["exported"] += len(batch)
+        except Exception as e:
+            with self._lock:
+                self.stats["export_errors"] += 1
+                self.stats["dropped"] += len(batch)
+            logger.warning(f"⚠️ No se pudieron exportar {len(batch)} spans ({type(self.exporter).__name__}): {e}")
+
+    def shutdown(self, timeout: float = 5.0):
+        """Exporta lo pendiente y detiene el hilo."""
+        worker = self._worker
+        if worker is not None:
+            self._queue.put(None)
+            worker.join(timeout)
+            self._worker = None
+        self.exporter.close()
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            "enabled": self.enabled,
+            "service": self.service_name,
+            "sample_rate": self.sample_rate,
+            "exporter": type(self.exporter).__name__,
+            "exporter_rotations": getattr(self.exporter, "rotations", None),
+            "queued": self._queue.qsize(),
+            **stats,
+        }
+
+
+_tracer: Tracer | None = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Tracer del proceso."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+                atexit.register(_tracer.shutdown)
+    return _tracer
+
+
+def configure(service_name: str):
+    """Nombre del servicio de este proceso (voz o API de chat), antes del primer span."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(service_name=os.getenv("TRACE_SERVICE_NAME", service_name))
+            atexit.register(_tracer.shutdown)
+
+
+def span(name: str, parent: Span | SpanContext | None = None, kind: str = "internal", **attributes):
+    """`get_tracer().span(...)`."""
+    return get_tracer().span(name, parent=parent, kind=kind, **attributes)
+
+
+def start_span(name: str, parent: Span | SpanContext | None = None, kind: str = "internal", start_ns: int | None = None, **attributes) -> Span:
+    """`get_tracer().start_span(...)`."""
+    return get_tracer().start_span(name, parent=parent, kind=kind, start_ns=start_ns, **attributes)
+
+
+register_route("/tracing", lambda query: (200, get_tracer().report()))
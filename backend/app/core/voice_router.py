@@ -0,0 +1,206 @@
+"""
+Puerto único de voz delante de los workers de `start.py --supervise`.
+
+Solo pasa por acá la señalización HTTP de Pipecat (la oferta SDP, los
+candidatos ICE, /start); el audio va por WebRTC directo al worker. Cada
+conexión tiene que volver siempre al mismo worker, porque el
+`SmallWebRTCConnection` y las sesiones de /start viven en su memoria:
+
+  - POST /api/offer sin `pc_id` y POST /start eligen el worker con menos
+    llamadas entre los que aceptan (según /capacity que consulta el
+    supervisor, más las asignadas desde la última consulta).
+  - El `pc_id` de la respuesta de la oferta y el `sessionId` de /start quedan
+    asociados a ese worker; PATCH /api/offer, las renegociaciones y
+    /sessions/{id}/... se mandan al mismo aunque se esté drenando.
+  - El resto (la UI de /client) va a cualquier worker listo.
+
+Sin workers disponibles responde 503. No soporta WebSocket (/ws, transportes
+de telefonía): esos se conectan al puerto del worker.
+"""
+import http.client
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import TYPE_CHECKING, Optional
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from app.core.supervisor import Supervisor, Worker
+
+ROUTER_HOST = "0.0.0.0"
+# Conexiones recordadas (pc_id / sessionId -> worker)
+AFFINITY_MAX = 10000
+# Cuánto cuenta una llamada asignada que /capacity todavía no refleja
+ASSIGNMENT_WINDOW_S = 10
+PROXY_TIMEOUT = 30
+
+# Headers que no se reenvían (son de cada salto, no del mensaje)
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length", "host",
+}
+
+
+class VoiceRouter:
+    """Reparte la señalización de voz entre los workers, con afinidad por conexión."""
+
+    def __init__(self, supervisor: "Supervisor"):
+        self.supervisor = supervisor
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+        self._assigned: dict = {}
+        self._round_robin = count()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "offers": 0, "pinned": 0, "unavailable": 0, "errors": 0}
+
+    # -- elección del worker ---------------------------------------------------
+
+    def _by_name(self, name: str) -> Optional["Worker"]:
+        return next((w for w in self.supervisor.voice_workers if w.spec.name == name), None)
+
+    def _load(self, worker: "Worker", now: float) -> int:
+        recent = [t for t in self._assigned.get(worker.spec.name, []) if now - t < ASSIGNMENT_WINDOW_S]
+        self._assigned[worker.spec.name] = recent
+        return ((worker.capacity or {}).get("active_sessions") or 0) + len(recent)
+
+    def pick(self) -> Optional["Worker"]:
+        """Worker con menos llamadas entre los que aceptan nuevas."""
+        candidates = [w for w in self.supervisor.voice_workers if w.routable]
+        if not candidates:
+            return None
+        now = time.time()
+        with self._lock:
+            worker = min(candidates, key=lambda w: self._load(w, now))
+            self._assigned.setdefault(worker.spec.name, []).append(now)
+        return worker
+
+    def any_ready(self) -> Optional["Worker"]:
+        ready = [w for w in self.supervisor.voice_workers if w.state in ("ready", "draining") and w.alive]
+        return ready[next(self._round_robin) % len(ready)] if ready else None
+
+    def pinned(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        with self._lock:
+            name = self._affinity.get(key)
+            if name is not None:
+                self._affinity.move_to_end(key)
+            return name
+
+    def remember(self, key: Optional[str], worker: "Worker"):
+        if not key:
+            return
+        with self._lock:
+            self._affinity[key] = worker.spec.name
+            self._affinity.move_to_end(key)
+            while len(self._affinity) > AFFINITY_MAX:
+                self._affinity.popitem(last=False)
+
+    def route(self, method: str, path: str, body: bytes):
+        """(worker, motivo) para una petición; worker None si no hay a dónde mandarla."""
+        key = None
+        if path.startswith("/sessions/"):
+            key = path.split("/")[2]
+        elif body:
+            try:
+                key = json.loads(body).get("pc_id")
+            except (ValueError, AttributeError):
+                pass
+        name = self.pinned(key)
+        if name is not None:
+            worker = self._by_name(name)
+            if worker is not None and worker.alive:
+                return worker, "pinned"
+            return None, f"el worker {name} de esta conexión no está disponible"
+        if key:
+            return None, "conexión desconocida"
+        if method == "POST" and path.split("?")[0] in ("/api/offer", "/start"):
+            worker = self.pick()
+            return worker, "new" if worker else "ningún worker de voz acepta llamadas"
+        worker = self.any_ready()
+        return worker, "any" if worker else "ningún worker de voz listo"
+
+    # -- servidor --------------------------------------------------------------
+
+    def start(self, port: int, host: str = ROUTER_HOST) -> Optional[ThreadingHTTPServer]:
+        handler = type("VoiceRouterHandler", (_ProxyHandler,), {"router": self})
+        try:
+            server = ThreadingHTTPServer((host, port), handler)
+        except OSError as e:
+            logger.error(f"❌ No se pudo abrir el puerto de voz {port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="voice-router", daemon=True).start()
+        logger.info(f"🔀 Router de voz en http://{host}:{port}")
+        return server
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"connections": len(self._affinity), **self.stats}
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    router: VoiceRouter
+    protocol_version = "HTTP/1.1"
+
+    def _proxy(self):
+        router = self.router
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        router.stats["requests"] += 1
+
+        worker, reason = router.route(self.command, self.path, body)
+        if worker is None:
+            router.stats["unavailable"] += 1
+            self._reply(503, json.dumps({"error": reason}, ensure_ascii=False).encode(), "application/json")
+            return
+        if reason == "pinned":
+            router.stats["pinned"] += 1
+        elif reason == "new":
+            router.stats["offers"] += 1
+
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+        connection = http.client.HTTPConnection("127.0.0.1", worker.spec.port, timeout=PROXY_TIMEOUT)
+        try:
+            connection.request(self.command, self.path, body=body or None, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except Exception as e:
+            router.stats["errors"] += 1
+            logger.warning(f"⚠️ {worker.spec.name} no respondió a {self.command} {self.path}: {e}")
+            self._reply(502, json.dumps({"error": f"{worker.spec.name} no respondió"}).encode(), "application/json")
+            return
+        finally:
+            connection.close()
+
+        # pc_id (respuesta de la oferta) y sessionId (de /start) quedan atados a este worker
+        if response.status < 400 and "json" in (response.getheader("Content-Type") or ""):
+            try:
+                data = json.loads(payload)
+                router.remember(data.get("pc_id") or data.get("sessionId"), worker)
+            except (ValueError, AttributeError):
+                pass
+
+        self.send_response(response.status)
+        for name, value in response.getheaders():
+            if name.lower() not in HOP_BY_HOP:
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Voice-Worker", worker.spec.name)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reply(self, status: int, payload: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = do_OPTIONS = _proxy
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,217 @@
+"""
+Compactación en segundo plano del LLMContext de las sesiones de voz.
+
+El contexto de una llamada solo crece: historial cargado al reanudar,
+memorias, instrucciones de saludo y cada turno hablado. Con eso el TTFB del
+LLM sube a lo largo de la llamada.
+
+`ContextCompactor` cuenta los tokens del contexto cuando el bot termina de
+hablar. Si pasan CONTEXT_COMPACT_THRESHOLD, resume los turnos más viejos con
+un modelo barato en una tarea aparte (nunca en el camino de un turno) y,
+justo antes de la siguiente llamada al LLM, reemplaza esos mensajes por el
+resumen. Nunca toca:
+  - los mensajes de sistema (prompt, memorias, instrucciones)
+  - las llamadas a herramientas y sus resultados
+  - los últimos CONTEXT_KEEP_RECENT mensajes
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+from openai import AsyncOpenAI
+from pipecat.processors.aggregators.llm_context import LLMContext
+
+from app.core.ops_server import register_route
+from app.core.tokens import count_tokens
+
+CONTEXT_COMPACT_ENABLED = os.getenv("CONTEXT_COMPACT_ENABLED", "true").lower() == "true"
+CONTEXT_COMPACT_THRESHOLD = int(os.getenv("CONTEXT_COMPACT_THRESHOLD", 6000))
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", 10))
+CONTEXT_COMPACT_MODEL = os.getenv("CONTEXT_COMPACT_MODEL", "gpt-4o-mini")
+# Menos mensajes que esto no vale la pena resumir
+MIN_MESSAGES_TO_COMPACT = 4
+
+SUMMARY_PREFIX = "RESUMEN DE LA CONVERSACIÓN ANTERIOR:\n"
+SUMMARY_PROMPT = (
+    "Resume en español la siguiente parte de una conversación entre un usuario y un "
+    "asistente de voz. Conserva los datos concretos (nombres, números, fechas, "
+    "correos), lo que el usuario pidió, lo que se resolvió y lo que quedó pendiente. "
+    "Máximo 200 palabras, en prosa, sin inventar nada."
+)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text")
+    return ""
+
+
+def _is_protected(message: dict) -> bool:
+    role = message.get("role")
+    if role == "system":
+        return not _message_text(message).startswith(SUMMARY_PREFIX)
+    return role == "tool" or bool(message.get("tool_calls"))
+
+
+class CompactionStats:
+    """Totales del proceso para /context/compaction."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.errors = 0
+        self.messages_summarized = 0
+        self.tokens_removed = 0
+        self.summary_seconds = 0.0
+
+    def record(self, messages: int, tokens_removed: int, seconds: float):
+        with self._lock:
+            self.compactions += 1
+            self.messages_summarized += messages
+            self.tokens_removed += tokens_removed
+            self.summary_seconds += seconds
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": CONTEXT_COMPACT_ENABLED,
+                "threshold_tokens": CONTEXT_COMPACT_THRESHOLD,
+                "keep_recent": CONTEXT_KEEP_RECENT,
+                "compactions": self.compactions,
+                "errors": self.errors,
+                "messages_summarized": self.messages_summarized,
+                "tokens_removed": self.tokens_removed,
+                "avg_summary_s": round(self.summary_seconds / self.compactions, 2) if self.compactions else None,
+            }
+
+
+compaction_stats = CompactionStats()
+register_route("/context/compaction", lambda query: (200, compaction_stats.snapshot()))
+
+
+class ContextCompactor:
+    """Resume los turnos viejos del contexto cuando supera el umbral de tokens."""
+
+    def __init__(
+        self,
+        context: LLMContext,
+        threshold: int = CONTEXT_COMPACT_THRESHOLD,
+        keep_recent: int = CONTEXT_KEEP_RECENT,
+        client: AsyncOpenAI | None = None,
+        enabled: bool = CONTEXT_COMPACT_ENABLED,
+    ):
+        self._context = context
+        self._threshold = threshold
+        self._keep_recent = keep_recent
+        self._client = client
+        self._enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        # Resumen listo para aplicar: (mensajes a reemplazar, mensaje de resumen, tokens quitados)
+        self._ready: Optional[tuple] = None
+        # id(mensaje) -> (mensaje, largo del texto, tokens); evita re-tokenizar todo en cada turno
+        self._counts: Dict[int, tuple] = {}
+        self.last_tokens = 0
+
+    def _tokens(self, message: dict) -> int:
+        text = _message_text(message)
+        cached = self._counts.get(id(message))
+        if cached and cached[0] is message and cached[1] == len(text):
+            return cached[2]
+        tokens = count_tokens(text) + 4  # rol y separadores
+        self._counts[id(message)] = (message, len(text), tokens)
+        return tokens
+
+    def context_tokens(self) -> int:
+        messages = [m for m in self._context.get_messages() if isinstance(m, dict)]
+        live = {id(m) for m in messages}
+        self._counts = {k: v for k, v in self._counts.items() if k in live}
+        return sum(self._tokens(m) for m in messages)
+
+    def _candidates(self) -> List[dict]:
+        """Mensajes viejos que se pueden resumir (incluye un resumen anterior)."""
+        messages = self._context.get_messages()
+        old = messages[: max(len(messages) - self._keep_recent, 0)]
+        return [m for m in old if isinstance(m, dict) and not _is_protected(m)]
+
+    def after_turn(self):
+        """Al terminar un turno: si el contexto es grande, lanza el resumen en segundo plano."""
+        if not self._enabled or self._ready is not None or (self._task and not self._task.done()):
+            return
+        self.last_tokens = self.context_tokens()
+        if self.last_tokens < self._threshold:
+            return
+        candidates = self._candidates()
+        if len(candidates) < MIN_MESSAGES_TO_COMPACT:
+            return
+        logger.info(f"🗜️ Contexto en ~{self.last_tokens} tokens; resumiendo {len(candidates)} mensajes viejos")
+        self._task = asyncio.get_running_loop().create_task(self._summarize(candidates))
+
+    async def _summarize(self, candidates: List[dict]):
+        start = time.perf_counter()
+        transcript = "\n".join(
+            f"{'Usuario' if m.get('role') == 'user' else 'Asistente' if m.get('role') == 'assistant' else 'Resumen previo'}: "
+            f"{_message_text(m).removeprefix(SUMMARY_PREFIX)}"
+            for m in candidates
+        )
+        try:
+            if self._client is None:
+                self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            response = await self._client.chat.completions.create(
+                model=CONTEXT_COMPACT_MODEL,
+                max_tokens=400,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+            )
+            summary = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo compactar el contexto: {e}")
+            compaction_stats.record_error()
+            return
+        if not summary:
+            return
+        summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        removed = sum(self._tokens(m) for m in candidates) - self._tokens(summary_message)
+        self._ready = (candidates, summary_message, removed, time.perf_counter() - start)
+
+    def before_llm(self):
+        """Aplica un resumen ya listo. Solo reordena la lista de mensajes (microsegundos)."""
+        if self._ready is None:
+            return
+        candidates, summary_message, removed, seconds = self._ready
+        self._ready = None
+
+        messages = self._context.get_messages()
+        replace = {id(m) for m in candidates}
+        if not any(id(m) in replace for m in messages):
+            return
+        spliced, inserted = [], False
+        for message in messages:
+            if id(message) in replace:
+                if not inserted:
+                    spliced.append(summary_message)
+                    inserted = True
+                continue
+            spliced.append(message)
+        self._context.set_messages(spliced)
+
+        compaction_stats.record(len(candidates), removed, seconds)
+        logger.info(
+            f"🗜️ Contexto compactado: {len(candidates)} mensajes -> 1 resumen "
+            f"(~{removed} tokens menos, resumen en {seconds:.1f}s)"
+        )
+
+    async def cleanup(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
@@ -0,0 +1,60 @@
+"""
+Punto de enganche para lo que ajusta el LLMContext entre turnos.
+
+El LLM recibe el contexto por dos caminos: el LLMContextFrame que el agregador
+de usuario manda hacia abajo y el que el agregador del asistente manda hacia
+arriba después de una herramienta. Un `ContextHookProcessor` antes del LLM y
+otro después cubren los dos.
+
+Cada hook implementa (todos opcionales):
+    before_llm()       sincrónico y barato, justo antes de cada llamada al LLM
+    after_turn()       cuando el bot termina de hablar (fuera del camino crítico)
+    async cleanup()    al cerrar la sesión
+"""
+from typing import List
+
+from loguru import logger
+from pipecat.frames.frames import BotStoppedSpeakingFrame, Frame, LLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+
+class ContextHookProcessor(FrameProcessor):
+    """Llama a los hooks de contexto con los frames que pasan por esta posición."""
+
+    def __init__(self, hooks: List[object], turn_events: bool = False, **kwargs):
+        """
+        `turn_events=True` solo en una de las instancias: BotStoppedSpeakingFrame
+        sube por todo el pipeline y si no se dispararía after_turn dos veces.
+        """
+        super().__init__(**kwargs)
+        self._hooks = hooks
+        self._turn_events = turn_events
+
+    def _call(self, method: str):
+        for hook in self._hooks:
+            callback = getattr(hook, method, None)
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception as e:
+                # Nunca cortar el turno por esto: el contexto sigue como estaba
+                logger.error(f"❌ Error en {type(hook).__name__}.{method}: {e}")
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMContextFrame):
+            self._call("before_llm")
+        elif isinstance(frame, BotStoppedSpeakingFrame) and self._turn_events:
+            self._call("after_turn")
+
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await super().cleanup()
+        if not self._turn_events:
+            return
+        for hook in self._hooks:
+            if hasattr(hook, "cleanup"):
+                await hook.cleanup()
@@ -0,0 +1,252 @@
+"""
+Retención de imágenes en el LLMContext de las sesiones de voz.
+
+Cada `ver_camara`, `handle_user_image` y `handle_multimodal_message` agrega
+una imagen al contexto y el LLM la vuelve a recibir en todos los turnos
+siguientes. `ContextImageManager` deja en línea solo las últimas
+CONTEXT_IMAGES_INLINE imágenes; las anteriores se reemplazan por una
+descripción corta generada una sola vez con un modelo barato.
+
+La descripción se pide en segundo plano cuando la imagen pasa a ser la más
+vieja de las que quedan en línea, así cuando llega la siguiente ya está lista
+y el reemplazo no agrega latencia. Si todavía no está, la imagen se queda en
+línea un turno más.
+
+El contexto lo leen dos caminos distintos: el LLMContextFrame que el
+agregador de usuario manda hacia abajo y el que el agregador del asistente
+manda hacia arriba después de una herramienta. Por eso el manager se engancha
+con `ContextHookProcessor` (app/pipeline/context_hooks.py) a ambos lados del LLM.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from loguru import logger
+from openai import AsyncOpenAI
+from pipecat.processors.aggregators.llm_context import LLMContext
+
+from app.core.ops_server import register_route
+
+CONTEXT_IMAGES_INLINE = max(int(os.getenv("CONTEXT_IMAGES_INLINE", 2)), 1)
+CONTEXT_IMAGE_DESCRIBE_MODEL = os.getenv("CONTEXT_IMAGE_DESCRIBE_MODEL", "gpt-4o-mini")
+CONTEXT_IMAGE_CACHE_SIZE = int(os.getenv("CONTEXT_IMAGE_CACHE_SIZE", 256))
+
+DESCRIBE_PROMPT = (
+    "Describe en español, en una o dos frases, lo que se ve en esta imagen. "
+    "Incluye los detalles que sirvan para seguir una conversación sobre ella "
+    "(personas, objetos, texto visible, colores)."
+)
+# Si no se pudo describir, la imagen igual sale del contexto
+FALLBACK_DESCRIPTION = "sin descripción disponible"
+
+# Tokens de imagen de OpenAI: 85 base + 170 por cada tile de 512px
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+# Para URLs remotas no sabemos el tamaño: se asume 1024x1024 (4 tiles)
+UNKNOWN_IMAGE_TOKENS = IMAGE_BASE_TOKENS + 4 * IMAGE_TILE_TOKENS
+
+
+def image_tokens(width: int, height: int, detail: str = "auto") -> int:
+    """Tokens que cobra OpenAI por una imagen de ese tamaño."""
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _estimate_tokens(url: str, detail: str) -> int:
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    if url.startswith("data:") and "," in url:
+        try:
+            from PIL import Image
+
+            data = base64.b64decode(url.split(",", 1)[1])
+            with Image.open(io.BytesIO(data)) as img:  # solo lee el encabezado
+                return image_tokens(*img.size, detail)
+        except Exception:
+            pass
+    return UNKNOWN_IMAGE_TOKENS
+
+
+class _DescriptionCache:
+    """Descripciones por hash de imagen, compartidas entre sesiones (LRU)."""
+
+    def __init__(self, max_size: int = CONTEXT_IMAGE_CACHE_SIZE):
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+
+class ContextImageStats:
+    """Totales del proceso para /context/images."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.image_tokens_sent = 0
+        self.image_tokens_saved = 0
+        self.images_evicted = 0
+        self.descriptions = 0
+        self.description_errors = 0
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "inline_limit": CONTEXT_IMAGES_INLINE,
+                "turns": self.turns,
+                "avg_image_tokens_per_turn": round(self.image_tokens_sent / self.turns, 1) if self.turns else None,
+                "image_tokens_sent": self.image_tokens_sent,
+                "image_tokens_saved": self.image_tokens_saved,
+                "images_evicted": self.images_evicted,
+                "descriptions": self.descriptions,
+                "description_errors": self.description_errors,
+            }
+
+
+_descriptions = _DescriptionCache()
+context_image_stats = ContextImageStats()
+register_route("/context/images", lambda query: (200, context_image_stats.snapshot()))
+
+
+class ContextImageManager:
+    """Deja en línea las últimas N imágenes del contexto y describe las anteriores."""
+
+    def __init__(self, context: LLMContext, keep_inline: int = CONTEXT_IMAGES_INLINE, client: AsyncOpenAI | None = None):
+        self._context = context
+        self._keep_inline = max(keep_inline, 1)
+        self._client = client
+        self._pending: Dict[str, asyncio.Task] = {}
+        # hash -> tokens estimados de la imagen
+        self._tokens: Dict[str, int] = {}
+        # hash -> tokens que se dejan de mandar por turno al reemplazarla
+        self._evicted: Dict[str, int] = {}
+        self.last_turn: dict = {}
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _image_parts(self) -> List[tuple]:
+        """(mensaje, índice de la parte, url, detail) de cada imagen del contexto, de la más vieja a la más nueva."""
+        parts = []
+        for message in self._context.get_messages():
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, list):
+                continue
+            for index, part in enumerate(content):
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    image_url = part.get("image_url") or {}
+                    url = image_url.get("url", "") if isinstance(image_url, dict) else str(image_url)
+                    detail = image_url.get("detail", "auto") if isinstance(image_url, dict) else "auto"
+                    parts.append((message, index, url, detail))
+        return parts
+
+    def before_llm(self):
+        """
+        Ajusta el contexto antes de una llamada al LLM. Es sincrónico y barato:
+        solo reemplaza imágenes cuya descripción ya está en caché.
+        """
+        parts = self._image_parts()
+        inline_tokens = 0
+        evicted_now = 0
+        cutoff = len(parts) - self._keep_inline
+
+        for position, (message, index, url, detail) in enumerate(parts):
+            key = self._key(url)
+            if key not in self._tokens:
+                self._tokens[key] = _estimate_tokens(url, detail)
+            tokens = self._tokens[key]
+
+            if position < cutoff:
+                description = _descriptions.get(key)
+                if description is not None:
+                    message["content"][index] = {"type": "text", "text": f"[Imagen anterior: {description}]"}
+                    self._evicted[key] = max(tokens - len(description) // 4, 0)
+                    evicted_now += 1
+                    continue
+                self._describe_later(key, url)
+            elif position == cutoff:
+                # La más vieja de las que quedan: será la próxima en salir
+                self._describe_later(key, url)
+            inline_tokens += tokens
+
+        saved = sum(self._evicted.values())
+        self.last_turn = {
+            "images_inline": len(parts) - evicted_now,
+            "image_tokens": inline_tokens,
+            "image_tokens_saved": saved,
+        }
+        context_image_stats.add(
+            turns=1, image_tokens_sent=inline_tokens, image_tokens_saved=saved, images_evicted=evicted_now
+        )
+        if evicted_now:
+            logger.info(
+                f"🖼️ {evicted_now} imagen(es) reemplazadas por su descripción; "
+                f"{len(parts) - evicted_now} en línea (~{inline_tokens} tokens de imagen este turno)"
+            )
+
+    def _describe_later(self, key: str, url: str):
+        if key in self._pending or _descriptions.get(key) is not None:
+            return
+        self._pending[key] = asyncio.get_running_loop().create_task(self._describe(key, url))
+
+    async def _describe(self, key: str, url: str):
+        try:
+            if self._client is None:
+                self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            response = await self._client.chat.completions.create(
+                model=CONTEXT_IMAGE_DESCRIBE_MODEL,
+                max_tokens=120,
+                messages=[{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": DESCRIBE_PROMPT},
+                        {"type": "image_url", "image_url": {"url": url, "detail": "low"}},
+                    ],
+                }],
+            )
+            description = (response.choices[0].message.content or "").strip() or FALLBACK_DESCRIPTION
+            context_image_stats.add(descriptions=1)
+            logger.debug(f"🖼️ Imagen descrita: {description}")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo describir la imagen del contexto: {e}")
+            description = FALLBACK_DESCRIPTION
+            context_image_stats.add(description_errors=1)
+        finally:
+            self._pending.pop(key, None)
+        _descriptions.put(key, description)
+
+    async def cleanup(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+        self._pending.clear()
+
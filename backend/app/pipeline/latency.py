@@ -0,0 +1,296 @@
+"""
+Latencia voz a voz por turno.
+
+`LatencyObserver` mira los frames que pasan entre los processors del
+pipeline (sin agregar etapas) y marca, en cada turno:
+
+    usuario deja de hablar -> transcripción final (STT) -> contexto al LLM
+    -> primer token del LLM (con las herramientas en el medio)
+    -> primer audio del TTS -> el bot empieza a hablar (transporte de salida)
+
+Al completar el turno calcula la latencia voz a voz y el desglose por etapa,
+lo suma a los histogramas del proceso (ruta /latency del servidor de
+operaciones) y, si LATENCY_PERSIST=true, lo guarda por lotes en la tabla
+`turn_latency` junto a la conversación.
+
+Cada turno completo también queda como un span `voice.turn` (con un span
+hijo por etapa) bajo el span de la sesión (app/core/tracing.py).
+
+También recoge los MetricsFrame de Pipecat (TTFB y tiempo de procesamiento
+de cada servicio), que con `enable_metrics=True` se emitían pero nadie leía.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    LLMContextFrame,
+    LLMTextFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import ProcessingMetricsData, TTFBMetricsData
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+
+from app.core.metrics import LatencyHistogram
+from app.core.ops_server import register_route
+from app.core.tracing import Span, start_span
+
+LATENCY_PERSIST = os.getenv("LATENCY_PERSIST", "false").lower() == "true"
+LATENCY_BATCH_SIZE = int(os.getenv("LATENCY_BATCH_SIZE", 10))
+
+STAGES = ("voice_to_voice", "stt", "llm", "tools", "tts", "transport")
+
+
+class LatencyStats:
+    """Histogramas por etapa, compartidos por todas las sesiones del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self.turns = 0
+
+    def observe(self, name: str, value_ms: float):
+        with self._lock:
+            self._histograms.setdefault(name, LatencyHistogram()).observe(value_ms)
+
+    def record_turn(self, breakdown: Dict[str, float]):
+        with self._lock:
+            self.turns += 1
+        for stage, value in breakdown.items():
+            if value is not None:
+                self.observe(stage, value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "stages": {name: h.to_dict() for name, h in sorted(self._histograms.items())},
+            }
+
+
+latency_stats = LatencyStats()
+register_route("/latency", lambda query: (200, latency_stats.snapshot()))
+
+
+@dataclass
+class TurnTiming:
+    """Marcas de tiempo (segundos del reloj del pipeline) de un turno."""
+
+    index: int
+    user_stopped: float
+    transcript: Optional[float] = None
+    llm_request: Optional[float] = None
+    llm_first_token: Optional[float] = None
+    tts_first_audio: Optional[float] = None
+    bot_started: Optional[float] = None
+    tools: List[dict] = field(default_factory=list)
+    _tool_starts: Dict[str, tuple] = field(default_factory=dict)
+    # La salida ya empezó a hablar con un relleno: la respuesta no trae otro BotStartedSpeakingFrame
+    _filler_spoke: bool = False
+    # time.time_ns() - reloj del pipeline, para pasar las marcas a hora real en las trazas
+    wall_offset_ns: int = 0
+
+    def wall_ns(self, t: float) -> int:
+        return int(t * 1e9) + self.wall_offset_ns
+
+    @property
+    def tools_ms(self) -> float:
+        return sum(t["ms"] for t in self.tools)
+
+    def breakdown(self) -> Dict[str, Optional[float]]:
+        """Milisegundos por etapa. None si la etapa no se observó en este turno."""
+        def ms(end, start):
+            if end is None or start is None:
+                return None
+            return round(max(end - start, 0.0) * 1000, 1)
+
+        llm_start = self.llm_request or self.transcript or self.user_stopped
+        llm = ms(self.llm_first_token, llm_start)
+        if llm is not None:
+            # Con herramientas, el primer texto llega después de ejecutarlas
+            llm = max(llm - self.tools_ms, 0.0)
+        return {
+            "voice_to_voice": ms(self.bot_started, self.user_stopped),
+            "stt": ms(self.transcript, self.user_stopped),
+            "llm": llm,
+            "tools": round(self.tools_ms, 1) if self.tools else None,
+            "tts": ms(self.tts_first_audio, self.llm_first_token),
+            "transport": ms(self.bot_started, self.tts_first_audio),
+        }
+
+
+class LatencyObserver(BaseObserver):
+    """Mide la latencia de cada turno de una sesión de voz."""
+
+    def __init__(
+        self, *, stt, llm, tts, transport_output, filler=None, db_service=None, persist: bool = LATENCY_PERSIST,
+        trace_span: Span | None = None, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self._stt = stt
+        self._llm = llm
+        self._tts = tts
+        self._output = transport_output
+        # ToolFillerProcessor: su audio no cuenta como la respuesta del turno
+        self._filler = filler
+        self._db = db_service
+        self._persist = persist and db_service is not None
+        # Span de la sesión: padre de los spans de cada turno
+        self._trace_span = trace_span
+
+        self._turn: Optional[TurnTiming] = None
+        self._turn_count = 0
+        self._user_started: Optional[float] = None
+        self._last_transcript: Optional[float] = None
+        self._seen_metrics = deque(maxlen=256)
+        self._pending: List[dict] = []
+        self._closed = False
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        t = data.timestamp / 1e9
+
+        if isinstance(frame, MetricsFrame):
+            self._observe_metrics(frame)
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            # Si el bot todavía no habló, el turno anterior se interrumpió y no se cuenta
+            self._turn = None
+            self._user_started = t
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            if self._turn is None:
+                self._turn_count += 1
+                self._turn = TurnTiming(
+                    index=self._turn_count, user_stopped=t, wall_offset_ns=time.time_ns() - data.timestamp
+                )
+                # Deepgram a veces entrega la transcripción final antes de que el VAD corte
+                if self._last_transcript and (self._user_started is None or self._last_transcript >= self._user_started):
+                    self._turn.transcript = self._last_transcript
+        elif isinstance(frame, TranscriptionFrame) and data.source is self._stt:
+            self._last_transcript = t
+            if self._turn and self._turn.transcript is None:
+                self._turn.transcript = t
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._close()
+        elif self._turn is not None:
+            self._observe_turn_frame(data, t)
+
+    def _observe_turn_frame(self, data: FramePushed, t: float):
+        frame, turn = data.frame, self._turn
+        if isinstance(frame, LLMContextFrame) and data.destination is self._llm:
+            if turn.llm_request is None:
+                turn.llm_request = t
+        elif isinstance(frame, LLMTextFrame) and data.source is self._llm:
+            if turn.llm_first_token is None:
+                turn.llm_first_token = t
+        elif isinstance(frame, FunctionCallInProgressFrame) and data.source is self._llm:
+            turn._tool_starts.setdefault(frame.tool_call_id, (frame.function_name, t))
+        elif isinstance(frame, FunctionCallResultFrame):
+            started = turn._tool_starts.pop(frame.tool_call_id, None)
+            if started:
+                name, start = started
+                turn.tools.append({"name": name, "ms": round((t - start) * 1000, 1)})
+        elif isinstance(frame, TTSAudioRawFrame) and data.source is self._tts:
+            if turn.tts_first_audio is None:
+                turn.tts_first_audio = t
+        elif isinstance(frame, TTSAudioRawFrame) and turn._filler_spoke and data.source is self._filler:
+            # El relleno se corta con TTSStartedFrame; si la respuesta llega antes de que la
+            # salida detecte silencio no hay BotStartedSpeakingFrame nuevo: cuenta este audio
+            if not self._filler.playing:
+                turn.bot_started = t
+                self._complete_turn(turn)
+        elif isinstance(frame, BotStartedSpeakingFrame) and data.source is self._output:
+            if self._filler is not None and self._filler.playing:
+                turn._filler_spoke = True
+                return
+            turn.bot_started = t
+            self._complete_turn(turn)
+
+    def _complete_turn(self, turn: TurnTiming):
+        self._turn = None
+        breakdown = turn.breakdown()
+        latency_stats.record_turn(breakdown)
+        for tool in turn.tools:
+            latency_stats.observe(f"tool.{tool['name']}", tool["ms"])
+
+        parts = ", ".join(f"{k} {v:.0f}" for k, v in breakdown.items() if k != "voice_to_voice" and v is not None)
+        logger.info(f"⏱️ Turno {turn.index}: voz a voz {breakdown['voice_to_voice']:.0f}ms ({parts})")
+        self._trace_turn(turn, breakdown)
+
+        if self._persist:
+            self._pending.append({
+                "conversation_id": self._db.conversation_id,
+                "turn_index": turn.index,
+                **{f"{stage}_ms": value for stage, value in breakdown.items()},
+                "tool_calls": turn.tools,
+            })
+            if len(self._pending) >= LATENCY_BATCH_SIZE:
+                self._flush()
+
+    def _trace_turn(self, turn: TurnTiming, breakdown: Dict[str, Optional[float]]):
+        """Span del turno y uno por etapa, con las marcas ya tomadas (se registran al terminar)."""
+        conversation_id = self._db.conversation_id if self._db is not None else None
+        turn_span = start_span(
+            "voice.turn",
+            parent=self._trace_span,
+            start_ns=turn.wall_ns(turn.user_stopped),
+            conversation_id=conversation_id,
+            **{"turn.index": turn.index, "turn.tools": ",".join(t["name"] for t in turn.tools) or None},
+        )
+        if not turn_span.recording:
+            return
+        llm_start = turn.llm_request or turn.transcript or turn.user_stopped
+        stages = (
+            ("voice.stt", turn.user_stopped, turn.transcript),
+            ("voice.llm", llm_start, turn.llm_first_token),
+            ("voice.tts", turn.llm_first_token, turn.tts_first_audio),
+            ("voice.transport", turn.tts_first_audio, turn.bot_started),
+        )
+        for name, start, end in stages:
+            if start is None or end is None:
+                continue
+            start_ns = turn.wall_ns(start)
+            stage = start_span(name, parent=turn_span, start_ns=start_ns)
+            stage.end(max(turn.wall_ns(end), start_ns))
+        turn_span.set_attributes(**{f"turn.{stage}_ms": value for stage, value in breakdown.items()})
+        turn_span.end(turn.wall_ns(turn.bot_started))
+
+    def _observe_metrics(self, frame: MetricsFrame):
+        # El mismo MetricsFrame se observa en cada salto del pipeline
+        if frame.id in self._seen_metrics:
+            return
+        self._seen_metrics.append(frame.id)
+        for item in frame.data:
+            processor = item.processor.split("#")[0]
+            if isinstance(item, TTFBMetricsData) and item.value:
+                latency_stats.observe(f"ttfb.{processor}", item.value * 1000)
+            elif isinstance(item, ProcessingMetricsData) and item.value:
+                latency_stats.observe(f"processing.{processor}", item.value * 1000)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        records, self._pending = self._pending, []
+        # Sin bloquear el event loop de la llamada
+        asyncio.get_running_loop().create_task(self._db.add_turn_latencies(records))
+
+    async def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._persist and self._pending:
+            records, self._pending = self._pending, []
+            await self._db.add_turn_latencies(records)
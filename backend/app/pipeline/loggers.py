@@ -14,7 +14,8 @@ class UserLogger(FrameProcessor):
         await super().process_frame(frame, direction)
         if isinstance(frame, TranscriptionFrame):
             if frame.text.strip():
-                self.db.add_message("user", frame.text)
+                # Sin esperar a la base: la transcripción sigue hacia el LLM enseguida
+                self.db.queue_message("user", frame.text)
         await self.push_frame(frame, direction)
 
 class AssistantLogger(FrameProcessor):
@@ -29,6 +30,6 @@ class AssistantLogger(FrameProcessor):
             self._buffer += frame.text
         elif isinstance(frame, LLMFullResponseEndFrame):
             if self._buffer.strip():
-                self.db.add_message("assistant", self._buffer)
+                self.db.queue_message("assistant", self._buffer)
                 self._buffer = ""
         await self.push_frame(frame, direction)
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Modelos locales compartidos entre sesiones de voz (Silero VAD y Smart Turn V3).
+
+Pipecat crea una InferenceSession de ONNX por cada analizador, o sea una por
+llamada. Acá cada modelo se carga una sola vez por proceso y cada sesión
+recibe un analizador liviano que reutiliza esa InferenceSession (`run` de
+onnxruntime es thread-safe) con su propio estado:
+  - VAD: el estado recurrente de Silero (_state/_context) es por analizador.
+  - Smart Turn: no guarda estado entre inferencias; el buffer de audio ya es
+    por analizador en BaseSmartTurn.
+
+Opcionalmente (MODEL_INFERENCE_WORKERS > 0) las inferencias de todas las
+sesiones corren en un pool compartido en lugar de un hilo por analizador.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from loguru import logger
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+# 0 = un hilo por analizador (comportamiento de Pipecat)
+MODEL_INFERENCE_WORKERS = int(os.getenv("MODEL_INFERENCE_WORKERS", 0))
+SMART_TURN_CPU_COUNT = int(os.getenv("SMART_TURN_CPU_COUNT", 1))
+
+
+def _package_file(package: str, name: str) -> str:
+    from importlib import resources
+
+    return str(resources.files(package).joinpath(name))
+
+
+class ModelRuntime:
+    """Carga perezosa y única de los modelos ONNX del proceso."""
+
+    def __init__(self, workers: int = MODEL_INFERENCE_WORKERS):
+        self._lock = threading.Lock()
+        self._silero_session = None
+        self._smart_turn = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model") if workers > 0 else None
+        self.stats = {"vad_analyzers": 0, "turn_analyzers": 0, "load_seconds": {}}
+
+    def silero_session(self):
+        """InferenceSession de Silero VAD (se crea la primera vez)."""
+        if self._silero_session is None:
+            with self._lock:
+                if self._silero_session is None:
+                    start = time.perf_counter()
+                    model = SileroOnnxModel(
+                        _package_file("pipecat.audio.vad.data", "silero_vad.onnx"), force_onnx_cpu=True
+                    )
+                    self._silero_session = model.session
+                    self._record_load("silero_vad", start)
+        return self._silero_session
+
+    def smart_turn(self):
+        """(InferenceSession, WhisperFeatureExtractor) de Smart Turn V3 (se crean la primera vez)."""
+        if self._smart_turn is None:
+            with self._lock:
+                if self._smart_turn is None:
+                    import onnxruntime as ort
+                    from transformers import WhisperFeatureExtractor
+
+                    start = time.perf_counter()
+                    options = ort.SessionOptions()
+                    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                    options.inter_op_num_threads = 1
+                    options.intra_op_num_threads = SMART_TURN_CPU_COUNT
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    session = ort.InferenceSession(
+                        _package_file("pipecat.audio.turn.smart_turn.data", "smart-turn-v3.0.onnx"),
+                        sess_options=options,
+                    )
+                    self._smart_turn = (session, WhisperFeatureExtractor(chunk_length=8))
+                    self._record_load("smart_turn_v3", start)
+        return self._smart_turn
+
+    def _record_load(self, name: str, start: float):
+        elapsed = time.perf_counter() - start
+        self.stats["load_seconds"][name] = round(elapsed, 3)
+        logger.info(f"🧠 Modelo {name} cargado una vez para todo el proceso ({elapsed:.2f}s)")
+
+    def _use_shared_executor(self, analyzer):
+        if self.executor is not None:
+            analyzer._executor.shutdown(wait=False)
+            analyzer._executor = self.executor
+
+
+class SharedSileroOnnxModel(SileroOnnxModel):
+    """SileroOnnxModel que reutiliza una InferenceSession existente."""
+
+    def __init__(self, session):
+        self.session = session
+        self.reset_states()
+        self.sample_rates = [8000, 16000]
+
+
+class SharedSileroVADAnalyzer(SileroVADAnalyzer):
+    """SileroVADAnalyzer sin cargar el modelo: usa la sesión del runtime compartido."""
+
+    def __init__(self, *, sample_rate: int | None = None, params: VADParams | None = None, runtime: ModelRuntime | None = None):
+        # Saltamos SileroVADAnalyzer.__init__, que crea una InferenceSession nueva
+        VADAnalyzer.__init__(self, sample_rate=sample_rate, params=params)
+        runtime = runtime or get_model_runtime()
+        self._model = SharedSileroOnnxModel(runtime.silero_session())
+        self._last_reset_time = 0
+        runtime._use_shared_executor(self)
+        runtime.stats["vad_analyzers"] += 1
+
+
+@lru_cache(maxsize=1)
+def _shared_smart_turn_class():
+    # Importar Smart Turn carga transformers; solo se hace si se usa
+    from pipecat.audio.turn.smart_turn.base_smart_turn import BaseSmartTurn
+    from pipecat.audio.turn.smart_turn.local_smart_turn_v3 import LocalSmartTurnAnalyzerV3
+
+    class SharedSmartTurnAnalyzerV3(LocalSmartTurnAnalyzerV3):
+        """LocalSmartTurnAnalyzerV3 que reutiliza la sesión y el extractor del runtime."""
+
+        def __init__(self, *, runtime: ModelRuntime | None = None, **kwargs):
+            BaseSmartTurn.__init__(self, **kwargs)
+            runtime = runtime or get_model_runtime()
+            self._session, self._feature_extractor = runtime.smart_turn()
+            runtime._use_shared_executor(self)
+            runtime.stats["turn_analyzers"] += 1
+
+    return SharedSmartTurnAnalyzerV3
+
+
+_runtime: ModelRuntime | None = None
+
+
+def get_model_runtime() -> ModelRuntime:
+    """Runtime de modelos del proceso (singleton)."""
+    global _runtime
+    if _runtime is None:
+        _runtime = ModelRuntime()
+    return _runtime
+
+
+def create_vad_analyzer(params: VADParams | None = None) -> SileroVADAnalyzer:
+    """Analizador VAD para una sesión nueva (modelo compartido, estado propio)."""
+    return SharedSileroVADAnalyzer(params=params)
+
+
+def create_turn_analyzer(**kwargs):
+    """Analizador Smart Turn V3 para una sesión nueva (modelo compartido)."""
+    return _shared_smart_turn_class()(**kwargs)
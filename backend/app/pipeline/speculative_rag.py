@@ -0,0 +1,240 @@
+"""
+Processor que adelanta la búsqueda RAG usando las transcripciones de Deepgram.
+
+Mientras el usuario habla, Deepgram emite transcripciones parciales
+(InterimTranscriptionFrame). Si la frase parece una consulta a la base de
+conocimiento, lanzamos la búsqueda en segundo plano para que, cuando el LLM
+llame a `buscar_informacion`, el resultado ya esté calculado.
+"""
+import asyncio
+import os
+import re
+import time
+import unicodedata
+
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InterimTranscriptionFrame,
+    TranscriptionFrame,
+    UserStartedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.services.rag import aget_relevant_context
+
+# Palabras que indican una pregunta
+INTERROGATIVAS = {"que", "como", "cual", "cuales", "cuando", "donde", "quien", "quienes", "cuanto", "cuanta", "cuantos", "cuantas", "porque"}
+
+# Vocabulario de la base de conocimiento (contratos, políticas, servicios)
+TEMAS_CONOCIMIENTO = {
+    "contrato", "termino", "condicion", "politica", "privacidad", "cookie", "adherido",
+    "adhesion", "asesor", "servicio", "obligacion", "responsabilidad", "baja", "suspension",
+    "jurisdiccion", "reembolso", "pago", "precio", "costo", "comision", "dato", "imagen",
+    "red", "futura", "guia", "empresa", "ecosistema", "ley", "clausula", "cv", "curriculum",
+    "documento", "archivo", "regla", "nosotro", "mision", "vision",
+}
+
+# Palabras sin contenido que se ignoran al comparar consultas
+STOPWORDS = {
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "de", "del", "al", "a", "en", "y",
+    "o", "que", "como", "cual", "cuales", "por", "para", "con", "sin", "se", "su", "sus", "es",
+    "son", "me", "mi", "te", "tu", "lo", "le", "les", "hay", "sobre", "puedes", "puede",
+    "decir", "dime", "quiero", "saber", "favor", "hola", "bueno", "entonces", "pues", "eh",
+}
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas y sin acentos."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _raiz(palabra: str) -> str:
+    """Raíz muy simple: quita plurales para comparar 'contratos' con 'contrato'."""
+    if len(palabra) > 4 and palabra.endswith("es"):
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith("s"):
+        return palabra[:-1]
+    return palabra
+
+
+def _palabras_clave(texto: str) -> set[str]:
+    palabras = re.findall(r"[a-z0-9ñ]+", _normalizar(texto))
+    return {_raiz(p) for p in palabras if p not in STOPWORDS and len(p) > 1}
+
+
+def parece_consulta(texto: str) -> bool:
+    """Heurística: ¿la frase parece una pregunta a la base de conocimiento?"""
+    normalizado = _normalizar(texto)
+    palabras = re.findall(r"[a-z0-9ñ]+", normalizado)
+    if len(palabras) < 3:
+        return False
+
+    es_pregunta = "?" in texto or bool(INTERROGATIVAS.intersection(palabras))
+    menciona_tema = bool(TEMAS_CONOCIMIENTO.intersection(_raiz(p) for p in palabras))
+    return menciona_tema and (es_pregunta or len(palabras) >= 5)
+
+
+class _Especulacion:
+    """Búsqueda lanzada para un texto concreto del turno actual."""
+
+    def __init__(self, texto: str, task: asyncio.Task):
+        self.texto = texto
+        self.claves = _palabras_clave(texto)
+        self.task = task
+        self.inicio = time.perf_counter()
+        self.fin: float | None = None
+
+
+class SpeculativeRAGProcessor(FrameProcessor):
+    """
+    Observa transcripciones parciales y finales, y lanza la búsqueda RAG
+    antes de que el LLM la pida. `BotTools.buscar_informacion` consulta
+    `tomar_resultado()` y solo usa la especulación si coincide con su query.
+    """
+
+    def __init__(
+        self,
+        min_coverage: float = float(os.getenv("SPECULATIVE_RAG_MIN_COVERAGE", 0.6)),
+        max_age: float = float(os.getenv("SPECULATIVE_RAG_MAX_AGE", 20.0)),
+        min_interval: float = float(os.getenv("SPECULATIVE_RAG_MIN_INTERVAL", 0.4)),
+    ):
+        super().__init__()
+        self._min_coverage = min_coverage
+        self._max_age = max_age
+        self._min_interval = min_interval
+        self._actual: _Especulacion | None = None
+        self._ultimo_lanzamiento = 0.0
+
+        # Métricas de la sesión
+        self.lanzadas = 0
+        self.descartadas = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.ms_ahorrados = 0.0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            # Nuevo turno: lo que no se usó del turno anterior ya es viejo
+            self._descartar("nuevo turno")
+        elif isinstance(frame, InterimTranscriptionFrame):
+            self._especular(frame.text, final=False)
+        elif isinstance(frame, TranscriptionFrame):
+            self._especular(frame.text, final=True)
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            self._descartar("fin de sesión")
+            self.log_stats()
+
+        await self.push_frame(frame, direction)
+
+    def _especular(self, texto: str, final: bool):
+        if not texto or not parece_consulta(texto):
+            return
+
+        ahora = time.perf_counter()
+        if self._actual:
+            nuevas = _palabras_clave(texto) - self._actual.claves
+            # La transcripción no cambió lo suficiente: reutilizamos la búsqueda en curso
+            if not nuevas:
+                return
+            # Limitar la frecuencia con parciales; el texto final siempre relanza
+            if not final and ahora - self._ultimo_lanzamiento < self._min_interval:
+                return
+            self._descartar("transcripción actualizada")
+
+        self._ultimo_lanzamiento = ahora
+        task = asyncio.create_task(aget_relevant_context(texto))
+        especulacion = _Especulacion(texto, task)
+        task.add_done_callback(lambda _: setattr(especulacion, "fin", time.perf_counter()))
+        self._actual = especulacion
+        self.lanzadas += 1
+        logger.debug(f"🔮 RAG especulativo lanzado: '{texto}'")
+
+    def _descartar(self, motivo: str):
+        if not self._actual:
+            return
+        if not self._actual.task.done():
+            self._actual.task.cancel()
+        logger.debug(f"🗑️ RAG especulativo descartado ({motivo}): '{self._actual.texto}'")
+        self._actual = None
+        self.descartadas += 1
+
+    async def tomar_resultado(self, query: str) -> str | None:
+        """
+        Retorna el contexto especulado si corresponde a `query`, o None.
+        Un resultado solo se usa una vez; si no coincide se descarta.
+        """
+        especulacion = self._actual
+        self._actual = None
+
+        if not especulacion:
+            self.fallos += 1
+            return None
+
+        llamada = time.perf_counter()
+        if llamada - especulacion.inicio > self._max_age:
+            especulacion.task.cancel()
+            self.descartadas += 1
+            self.fallos += 1
+            logger.debug("🔮 Especulación vieja, se descarta")
+            return None
+
+        claves_query = _palabras_clave(query)
+        if not claves_query:
+            cobertura = 0.0
+        else:
+            cobertura = len(claves_query & especulacion.claves) / len(claves_query)
+        if cobertura < self._min_coverage:
+            especulacion.task.cancel()
+            self.descartadas += 1
+            self.fallos += 1
+            logger.debug(f"🔮 Especulación no coincide con '{query}' (cobertura {cobertura:.0%})")
+            return None
+
+        try:
+            resultado = await especulacion.task
+        except asyncio.CancelledError:
+            # Si cancelaron a quien espera (deadline de la herramienta, interrupción) se propaga;
+            # solo es un fallo de la especulación si cancelaron su propia tarea
+            if not especulacion.task.cancelled() or asyncio.current_task().cancelling() > 0:
+                raise
+            logger.warning("⚠️ Especulación RAG cancelada")
+            self.fallos += 1
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Especulación RAG falló: {e}")
+            self.fallos += 1
+            return None
+
+        # Lo ahorrado es la parte de la búsqueda que ya había corrido al llegar la llamada
+        ahorrado = (min(especulacion.fin or llamada, llamada) - especulacion.inicio) * 1000
+        self.aciertos += 1
+        self.ms_ahorrados += ahorrado
+        logger.info(f"🔮 RAG especulativo: acierto, {ahorrado:.0f} ms ahorrados en este turno")
+        return resultado
+
+    def stats(self) -> dict:
+        consultas = self.aciertos + self.fallos
+        return {
+            "lanzadas": self.lanzadas,
+            "descartadas": self.descartadas,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "hit_rate": self.aciertos / consultas if consultas else 0.0,
+            "ms_ahorrados_total": round(self.ms_ahorrados, 1),
+            "ms_ahorrados_por_acierto": round(self.ms_ahorrados / self.aciertos, 1) if self.aciertos else 0.0,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"🔮 RAG especulativo: hit rate {stats['hit_rate']:.0%} "
+            f"({stats['aciertos']}/{stats['aciertos'] + stats['fallos']}), "
+            f"{stats['ms_ahorrados_por_acierto']:.0f} ms ahorrados por acierto, "
+            f"{stats['lanzadas']} lanzadas, {stats['descartadas']} descartadas"
+        )
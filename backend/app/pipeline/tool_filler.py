@@ -0,0 +1,353 @@
+"""
+Relleno de audio mientras corren las herramientas lentas de voz.
+
+`buscar_informacion`, `contar_usuarios_tuguia`, `crear_usuario_tuguia` y
+compañía tardan lo que tarde el RAG, Tu Guía o la API de administración, y
+mientras tanto el usuario escucha silencio. `ToolFillerProcessor` va entre el
+TTS y el transporte de salida y, si una herramienta pasa su umbral
+(TOOL_FILLER_THRESHOLDS, por herramienta), reproduce una frase corta
+("Déjame revisar...") elegida para esa herramienta.
+
+  - Las frases se sintetizan una sola vez al empezar la sesión con la misma
+    voz del TTS (`CachedCartesiaTTSService.prerender`) y quedan en la caché
+    de audio. Si una frase todavía no está lista, no se reproduce nada: el
+    relleno nunca espera a la síntesis.
+  - Solo se reproduce si el bot no está hablando, y uno a la vez.
+  - Se corta con un fundido corto cuando llega el resultado (o se cancela la
+    herramienta) y de inmediato si el usuario interrumpe.
+  - El audio sale sin texto: no entra al contexto del LLM ni a la transcripción.
+
+Las métricas (ruta /tools/fillers del servidor de operaciones) muestran el
+silencio que se evitó y el que quedó, por herramienta.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    FunctionCallCancelFrame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    InterruptionFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    TTSStartedFrame,
+    UserStartedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from app.core.ops_server import register_route
+from app.pipeline.latency import latency_stats
+from app.pipeline.tts_cache import CachedAudio
+from app.tools.runtime import parse_tool_values
+
+TOOL_FILLER_ENABLED = os.getenv("TOOL_FILLER_ENABLED", "true").lower() == "true"
+# Umbral para las herramientas que no están en TOOL_FILLER_THRESHOLDS
+TOOL_FILLER_DEFAULT_THRESHOLD = float(os.getenv("TOOL_FILLER_DEFAULT_THRESHOLD", 1.0))
+
+# Segundos de espera antes del relleno. Las que consultan servicios externos arrancan antes
+DEFAULT_THRESHOLDS = {
+    "buscar_informacion": 0.7,
+    "contar_usuarios_tuguia": 0.8,
+    "contar_usuarios_por_subcategoria": 0.8,
+    "crear_usuario_tuguia": 0.5,
+    "ver_camara": 1.0,
+}
+
+# Frases por herramienta; se van rotando para no repetir siempre la misma
+FILLER_PHRASES = {
+    "buscar_informacion": ["Déjame revisar eso.", "Un momento, lo estoy buscando.", "Dame un segundo, lo busco."],
+    "contar_usuarios_tuguia": ["Déjame consultar Tu Guía.", "Un momento, reviso los números."],
+    "contar_usuarios_por_subcategoria": ["Déjame consultar Tu Guía.", "Un momento, reviso los números."],
+    "crear_usuario_tuguia": ["Estoy creando la cuenta, un momento.", "Dame un segundo, ya lo registro."],
+    "ver_camara": ["Déjame ver.", "A ver, un momento."],
+}
+DEFAULT_PHRASES = ["Un momento, por favor."]
+
+# Tamaño de cada frame de audio y cuánto se adelanta al transporte
+CHUNK_SECONDS = 0.04
+LEAD_SECONDS = 0.12
+# Fundido al cortar porque llegó el resultado
+FADE_SECONDS = 0.03
+
+
+TOOL_FILLER_THRESHOLDS = {
+    **DEFAULT_THRESHOLDS,
+    **parse_tool_values(os.getenv("TOOL_FILLER_THRESHOLDS", ""), float, "TOOL_FILLER_THRESHOLDS"),
+}
+
+
+class FillerStats:
+    """Totales del proceso para /tools/fillers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tools: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, **values):
+        with self._lock:
+            tool = self.tools.setdefault(name, {
+                "calls": 0, "fillers_played": 0, "cancelled_by_result": 0, "cancelled_by_user": 0,
+                "skipped_not_ready": 0, "skipped_busy": 0, "wait_s": 0.0, "silence_avoided_s": 0.0,
+                "silence_residual_s": 0.0,
+            })
+            for key, value in values.items():
+                tool[key] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tools = {name: {k: round(v, 2) if isinstance(v, float) else v for k, v in t.items()}
+                     for name, t in sorted(self.tools.items())}
+        waited = sum(t["wait_s"] for t in tools.values())
+        avoided = sum(t["silence_avoided_s"] for t in tools.values())
+        return {
+            "enabled": TOOL_FILLER_ENABLED,
+            "thresholds_s": TOOL_FILLER_THRESHOLDS,
+            "tool_wait_s": round(waited, 2),
+            "silence_avoided_s": round(avoided, 2),
+            "silence_avoided_ratio": round(avoided / waited, 3) if waited else None,
+            "tools": tools,
+        }
+
+
+filler_stats = FillerStats()
+register_route("/tools/fillers", lambda query: (200, filler_stats.snapshot()))
+
+
+@dataclass
+class _ToolCall:
+    name: str
+    started: float
+    timer: Optional[asyncio.Task] = None
+    # Se reanuda el conteo cuando el bot deja de hablar
+    waiting_for_bot: bool = False
+    # Tras una interrupción no se vuelve a rellenar esta llamada
+    interrupted: bool = False
+    played_s: float = 0.0
+
+
+@dataclass
+class _Playback:
+    call_id: str
+    audio: CachedAudio
+    started: float
+    offset: int = 0
+    task: Optional[asyncio.Task] = None
+
+    @property
+    def pushed_s(self) -> float:
+        return self.offset / 2 / self.audio.sample_rate
+
+    def played_s(self, now: float) -> float:
+        return min(now - self.started, self.pushed_s)
+
+
+class ToolFillerProcessor(FrameProcessor):
+    """Reproduce una frase de relleno cuando una herramienta tarda más que su umbral."""
+
+    def __init__(
+        self,
+        tts,
+        *,
+        thresholds: Dict[str, float] | None = None,
+        phrases: Dict[str, List[str]] | None = None,
+        enabled: bool = TOOL_FILLER_ENABLED,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._tts = tts
+        self._thresholds = thresholds if thresholds is not None else TOOL_FILLER_THRESHOLDS
+        self._phrases = phrases if phrases is not None else FILLER_PHRASES
+        self._enabled = enabled
+        self._audio: Dict[str, CachedAudio] = {}
+        self._rotation: Dict[str, itertools.cycle] = {}
+        self._prerender_task: Optional[asyncio.Task] = None
+        self._calls: Dict[str, _ToolCall] = {}
+        self._playback: Optional[_Playback] = None
+        self._bot_speaking = False
+
+    @property
+    def playing(self) -> bool:
+        """True mientras suena un relleno (lo usa LatencyObserver para no contarlo como respuesta)."""
+        return self._playback is not None
+
+    def _threshold(self, name: str) -> float:
+        return self._thresholds.get(name, TOOL_FILLER_DEFAULT_THRESHOLD)
+
+    def _phrases_for(self, name: str) -> List[str]:
+        return self._phrases.get(name) or DEFAULT_PHRASES
+
+    async def _prerender(self):
+        phrases = {p for name in self._thresholds for p in self._phrases_for(name)} | set(DEFAULT_PHRASES)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._tts.prerender(p) for p in phrases), return_exceptions=True)
+        for phrase, entry in zip(phrases, results):
+            if isinstance(entry, CachedAudio):
+                self._audio[phrase] = entry
+        logger.debug(
+            f"🔊 Rellenos de herramientas listos: {len(self._audio)}/{len(phrases)} "
+            f"en {time.perf_counter() - start:.2f}s"
+        )
+
+    def _next_audio(self, name: str) -> Optional[CachedAudio]:
+        phrases = self._phrases_for(name)
+        rotation = self._rotation.setdefault(name, itertools.cycle(phrases))
+        for _ in range(len(phrases)):
+            audio = self._audio.get(next(rotation))
+            if audio is not None and audio.sample_rate == self._tts.sample_rate:
+                return audio
+        return None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            await self.push_frame(frame, direction)
+            if self._enabled and hasattr(self._tts, "prerender"):
+                # El TTS ya tomó su sample rate al pasar el StartFrame
+                self._prerender_task = self.create_task(self._prerender())
+            return
+
+        if isinstance(frame, FunctionCallInProgressFrame):
+            self._on_tool_started(frame)
+        elif isinstance(frame, (FunctionCallResultFrame, FunctionCallCancelFrame)):
+            await self._on_tool_finished(frame.tool_call_id)
+        elif isinstance(frame, (InterruptionFrame, UserStartedSpeakingFrame)):
+            await self._on_interruption()
+        elif isinstance(frame, TTSStartedFrame):
+            # Empieza la respuesta real: el relleno no se superpone
+            await self._stop(fade=True)
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_speaking = True
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_speaking = False
+            self._resume_waiting()
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._shutdown()
+
+        await self.push_frame(frame, direction)
+
+    def _on_tool_started(self, frame: FunctionCallInProgressFrame):
+        if not self._enabled or frame.tool_call_id in self._calls:
+            return
+        call = _ToolCall(name=frame.function_name, started=time.monotonic())
+        self._calls[frame.tool_call_id] = call
+        call.timer = self.create_task(self._after_threshold(frame.tool_call_id, self._threshold(call.name)))
+
+    def _resume_waiting(self):
+        # Lo que dijo el bot antes de la herramienta ya cubrió parte de la espera: el umbral cuenta desde ahora
+        for call_id, call in self._calls.items():
+            if call.waiting_for_bot and not call.interrupted:
+                call.waiting_for_bot = False
+                call.timer = self.create_task(self._after_threshold(call_id, self._threshold(call.name)))
+
+    async def _after_threshold(self, call_id: str, delay: float):
+        await asyncio.sleep(delay)
+        call = self._calls.get(call_id)
+        if call is None or call.interrupted:
+            return
+        call.timer = None
+        if self._bot_speaking and self._playback is None:
+            call.waiting_for_bot = True
+            return
+        if self._playback is not None:
+            filler_stats.record(call.name, skipped_busy=1)
+            return
+        audio = self._next_audio(call.name)
+        if audio is None:
+            filler_stats.record(call.name, skipped_not_ready=1)
+            return
+        self._playback = _Playback(call_id=call_id, audio=audio, started=time.monotonic())
+        self._playback.task = self.create_task(self._play(self._playback))
+        filler_stats.record(call.name, fillers_played=1)
+        logger.debug(f"🔊 Relleno para {call.name} tras {time.monotonic() - call.started:.2f}s")
+
+    async def _play(self, playback: _Playback):
+        audio, sample_rate = playback.audio.audio, playback.audio.sample_rate
+        chunk_bytes = int(sample_rate * CHUNK_SECONDS) * 2
+        while playback.offset < len(audio):
+            chunk = audio[playback.offset:playback.offset + chunk_bytes]
+            await self.push_frame(OutputAudioRawFrame(audio=chunk, sample_rate=sample_rate, num_channels=1))
+            playback.offset += len(chunk)
+            # No adelantarse más que LEAD_SECONDS: así el corte se escucha enseguida
+            ahead = playback.pushed_s - (time.monotonic() - playback.started)
+            if ahead > LEAD_SECONDS:
+                await asyncio.sleep(ahead - LEAD_SECONDS)
+        await asyncio.sleep(max(playback.pushed_s - (time.monotonic() - playback.started), 0))
+        self._finish_playback(playback)
+
+    def _finish_playback(self, playback: _Playback):
+        if self._playback is not playback:
+            return
+        self._playback = None
+        call = self._calls.get(playback.call_id)
+        if call is not None:
+            call.played_s += playback.played_s(time.monotonic())
+
+    async def _stop(self, fade: bool) -> Optional[_Playback]:
+        playback = self._playback
+        if playback is None:
+            return None
+        if playback.task is not None:
+            await self.cancel_task(playback.task)
+        self._finish_playback(playback)
+        if fade and playback.offset < len(playback.audio.audio):
+            # En vez de cortar en seco, unos milisegundos más de la frase bajando a cero
+            fade_bytes = int(playback.audio.sample_rate * FADE_SECONDS) * 2
+            tail = np.frombuffer(playback.audio.audio[playback.offset:playback.offset + fade_bytes], dtype=np.int16)
+            if len(tail):
+                faded = (tail * np.linspace(1.0, 0.0, len(tail))).astype(np.int16)
+                await self.push_frame(
+                    OutputAudioRawFrame(audio=faded.tobytes(), sample_rate=playback.audio.sample_rate, num_channels=1)
+                )
+        return playback
+
+    async def _on_tool_finished(self, call_id: str):
+        call = self._calls.get(call_id)
+        if call is None:
+            return
+        if call.timer is not None:
+            await self.cancel_task(call.timer)
+        if self._playback is not None and self._playback.call_id == call_id:
+            await self._stop(fade=True)
+            filler_stats.record(call.name, cancelled_by_result=1)
+        del self._calls[call_id]
+
+        wait = time.monotonic() - call.started
+        residual = max(wait - call.played_s, 0.0)
+        filler_stats.record(call.name, calls=1, wait_s=wait, silence_avoided_s=call.played_s, silence_residual_s=residual)
+        if call.played_s:
+            latency_stats.observe("filler.silence_avoided", call.played_s * 1000)
+            latency_stats.observe("filler.silence_residual", residual * 1000)
+
+    async def _on_interruption(self):
+        playback = await self._stop(fade=False)
+        if playback is not None and playback.call_id in self._calls:
+            filler_stats.record(self._calls[playback.call_id].name, cancelled_by_user=1)
+        for call in self._calls.values():
+            call.interrupted = True
+            call.waiting_for_bot = False
+            if call.timer is not None:
+                await self.cancel_task(call.timer)
+                call.timer = None
+
+    async def _shutdown(self):
+        await self._stop(fade=False)
+        for call in self._calls.values():
+            if call.timer is not None:
+                await self.cancel_task(call.timer)
+        self._calls.clear()
+        if self._prerender_task is not None:
+            await self.cancel_task(self._prerender_task)
+            self._prerender_task = None
@@ -0,0 +1,440 @@
+"""
+Caché de audio sintetizado para las frases que el bot repite.
+
+Saludos, "Hola de nuevo", confirmaciones de herramientas y mensajes de error
+se sintetizan igual una y otra vez. `CachedCartesiaTTSService` busca cada
+oración en `TTSAudioCache` antes de mandarla al websocket de Cartesia:
+
+  - La clave es el texto normalizado más todo lo que cambia el audio: voz,
+    modelo, idioma, velocidad, emoción, GenerationConfig y formato de salida.
+  - El audio se guarda como PCM crudo en disco (TTS_CACHE_DIR, acotado a
+    TTS_CACHE_MAX_MB, se borra lo menos usado) con una capa en memoria
+    (TTS_CACHE_HOT_MB) para las frases más frecuentes.
+  - Una frase entra a la caché recién la TTS_CACHE_MIN_REPEATS-ésima vez que
+    se dice en el proceso (contando todas las llamadas: el saludo se dice una
+    vez por llamada); se sintetiza aparte con la API HTTP (/tts/bytes) en segundo plano
+    para no mezclarla con el audio del websocket.
+
+Un acierto se reproduce como su propio contexto de audio, con los TTSTextFrame
+intercalados en el audio (Cartesia no da timestamps por HTTP; se reparten por
+cantidad de caracteres). Solo se sirven aciertos al principio de una
+respuesta: si el websocket ya empezó a hablar, el resto de la respuesta sigue
+por ahí para no partir el contexto de Cartesia a la mitad.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncGenerator, Dict, Optional
+
+import aiohttp
+from loguru import logger
+from pipecat.frames.frames import (
+    Frame,
+    InterruptionFrame,
+    LLMFullResponseEndFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    TTSTextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.cartesia.tts import CartesiaTTSService
+
+from app.core.ops_server import register_route
+
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".cache/tts")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", 200))
+TTS_CACHE_HOT_MB = float(os.getenv("TTS_CACHE_HOT_MB", 20))
+# Oraciones más largas casi nunca se repiten textualmente
+TTS_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", 160))
+TTS_CACHE_MIN_REPEATS = int(os.getenv("TTS_CACHE_MIN_REPEATS", 2))
+
+CARTESIA_API_URL = "https://api.cartesia.ai"
+# Tamaño de cada TTSAudioRawFrame al reproducir un acierto
+CHUNK_SECONDS = 0.1
+# Frases vistas (para decidir cuándo cachear), acotado
+SEEN_MAX = 2000
+
+
+def normalize_text(text: str) -> str:
+    """Texto de la clave: espacios colapsados. Se respetan mayúsculas y puntuación (cambian la prosodia)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+@dataclass
+class CachedAudio:
+    audio: bytes
+    sample_rate: int
+    synth_seconds: float
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / 2 / self.sample_rate
+
+
+class TTSAudioCache:
+    """PCM por clave: capa en memoria (LRU) sobre un directorio acotado por tamaño."""
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_mb: float = TTS_CACHE_MAX_MB, hot_mb: float = TTS_CACHE_HOT_MB):
+        self._dir = Path(directory)
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._hot_max_bytes = int(hot_mb * 1024 * 1024)
+        self._hot: "OrderedDict[str, CachedAudio]" = OrderedDict()
+        self._hot_bytes = 0
+        self._sizes: Dict[str, int] = {}
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._filling: set = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0, "hits_memory": 0, "hits_disk": 0, "misses": 0,
+            "fills": 0, "fill_errors": 0, "evictions": 0,
+            "synth_seconds_saved": 0.0, "audio_seconds_served": 0.0,
+        }
+        self._scan()
+
+    def _scan(self):
+        try:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            for path in self._dir.glob("*.pcm"):
+                self._sizes[path.stem] = path.stat().st_size
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo abrir la caché de TTS en {self._dir}: {e}")
+        if self._sizes:
+            logger.info(f"🔊 Caché de TTS: {len(self._sizes)} frases en disco ({self.disk_bytes / 1e6:.1f} MB)")
+
+    def add_stats(self, **values):
+        """Suma a los contadores (se actualizan desde el loop y desde los hilos de disco)."""
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    @property
+    def disk_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def _remember(self, key: str, entry: CachedAudio):
+        with self._lock:
+            if key in self._hot:
+                self._hot.move_to_end(key)
+                return
+            self._hot[key] = entry
+            self._hot_bytes += len(entry.audio)
+            while self._hot_bytes > self._hot_max_bytes and len(self._hot) > 1:
+                _, old = self._hot.popitem(last=False)
+                self._hot_bytes -= len(old.audio)
+
+    def _read(self, key: str) -> Optional[CachedAudio]:
+        path = self._dir / f"{key}.pcm"
+        try:
+            meta = json.loads((self._dir / f"{key}.json").read_text(encoding="utf-8"))
+            audio = path.read_bytes()
+            os.utime(path)  # el mtime marca el último uso para el desalojo
+        except (OSError, ValueError):
+            self._sizes.pop(key, None)
+            return None
+        return CachedAudio(audio=audio, sample_rate=meta["sample_rate"], synth_seconds=meta.get("synth_seconds", 0.0))
+
+    async def _lookup(self, key: str) -> tuple:
+        """(entrada, "memory" | "disk" | None)."""
+        entry = self._hot.get(key)
+        if entry is not None:
+            self._remember(key, entry)
+            return entry, "memory"
+        if key in self._sizes:
+            entry = await asyncio.to_thread(self._read, key)
+            if entry is not None:
+                self._remember(key, entry)
+                return entry, "disk"
+        return None, None
+
+    async def get(self, key: str) -> Optional[CachedAudio]:
+        entry, source = await self._lookup(key)
+        if entry is None:
+            self.add_stats(lookups=1, misses=1)
+            return None
+        self.add_stats(
+            lookups=1,
+            **{f"hits_{source}": 1},
+            synth_seconds_saved=entry.synth_seconds,
+            audio_seconds_served=entry.duration,
+        )
+        return entry
+
+    async def peek(self, key: str) -> Optional[CachedAudio]:
+        """Como `get`, sin contar en las estadísticas (audio que no se reproduce todavía)."""
+        entry, _ = await self._lookup(key)
+        return entry
+
+    def _write(self, key: str, text: str, entry: CachedAudio):
+        tmp = self._dir / f"{key}.pcm.tmp"
+        tmp.write_bytes(entry.audio)
+        (self._dir / f"{key}.json").write_text(
+            json.dumps({"text": text, "sample_rate": entry.sample_rate, "synth_seconds": round(entry.synth_seconds, 3)},
+                       ensure_ascii=False),
+            encoding="utf-8",
+        )
+        tmp.replace(self._dir / f"{key}.pcm")
+        self._sizes[key] = len(entry.audio)
+        self._evict()
+
+    def _evict(self):
+        """Borra las frases usadas hace más tiempo hasta quedar bajo TTS_CACHE_MAX_MB."""
+        if self.disk_bytes <= self._max_bytes:
+            return
+        paths = sorted(self._dir.glob("*.pcm"), key=lambda p: p.stat().st_mtime)
+        for path in paths:
+            if self.disk_bytes <= self._max_bytes:
+                break
+            key = path.stem
+            path.unlink(missing_ok=True)
+            (self._dir / f"{key}.json").unlink(missing_ok=True)
+            self._sizes.pop(key, None)
+            self.add_stats(evictions=1)
+
+    def admit(self, key: str, min_repeats: int = TTS_CACHE_MIN_REPEATS) -> bool:
+        """Cuenta una vez más la frase; True si toca sintetizarla para la caché.
+
+        El conteo es del proceso, no de la sesión, y solo una sesión a la vez
+        rellena cada clave (hasta `put` o `release`).
+        """
+        with self._lock:
+            if key in self._sizes or key in self._hot or key in self._filling:
+                return False
+            count = self._seen.pop(key, 0) + 1
+            self._seen[key] = count
+            while len(self._seen) > SEEN_MAX:
+                self._seen.popitem(last=False)
+            if count < min_repeats:
+                return False
+            self._filling.add(key)
+            return True
+
+    def release(self, key: str):
+        """Libera una clave admitida cuyo relleno no terminó (error o cancelación)."""
+        with self._lock:
+            self._filling.discard(key)
+
+    async def put(self, key: str, text: str, entry: CachedAudio):
+        self._remember(key, entry)
+        try:
+            await asyncio.to_thread(self._write, key, text, entry)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar audio en la caché de TTS: {e}")
+        with self._lock:
+            self._filling.discard(key)
+            self._seen.pop(key, None)
+            self.stats["fills"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["hits_memory"] + stats["hits_disk"]
+        return {
+            "enabled": TTS_CACHE_ENABLED,
+            **stats,
+            "hit_rate": round(hits / stats["lookups"], 3) if stats["lookups"] else None,
+            "synth_seconds_saved": round(stats["synth_seconds_saved"], 2),
+            "audio_seconds_served": round(stats["audio_seconds_served"], 2),
+            "entries_disk": len(self._sizes),
+            "disk_mb": round(self.disk_bytes / 1e6, 2),
+            "entries_memory": len(self._hot),
+            "phrases_seen": len(self._seen),
+            "fills_pending": len(self._filling),
+            "memory_mb": round(self._hot_bytes / 1e6, 2),
+        }
+
+
+_cache: TTSAudioCache | None = None
+
+
+def get_tts_cache() -> TTSAudioCache:
+    """Caché del proceso (compartida por todas las sesiones)."""
+    global _cache
+    if _cache is None:
+        _cache = TTSAudioCache()
+    return _cache
+
+
+register_route("/tts/cache", lambda query: (200, get_tts_cache().snapshot()))
+
+
+class CachedCartesiaTTSService(CartesiaTTSService):
+    """CartesiaTTSService que reproduce localmente las frases ya sintetizadas."""
+
+    def __init__(self, *, cache: TTSAudioCache | None = None, cache_enabled: bool = TTS_CACHE_ENABLED, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = (cache or get_tts_cache()) if cache_enabled else None
+        self._cache_context_id: Optional[str] = None
+        self._fills: Dict[str, asyncio.Task] = {}
+        self._http: aiohttp.ClientSession | None = None
+
+    def _cache_key(self, text: str) -> str:
+        settings = self._settings
+        generation_config = settings["generation_config"]
+        key = {
+            "text": normalize_text(text),
+            "voice": self._voice_id,
+            "model": self.model_name,
+            "language": settings["language"],
+            "speed": settings["speed"],
+            "emotion": settings["emotion"],
+            "generation_config": generation_config.model_dump(exclude_none=True) if generation_config else None,
+            "output_format": settings["output_format"],
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        cacheable = self._cache is not None and 0 < len(text.strip()) <= TTS_CACHE_MAX_CHARS
+        if cacheable:
+            key = self._cache_key(text)
+            # Con un contexto del websocket abierto, el resto de la respuesta sigue por ahí
+            if not self._context_id:
+                entry = await self._cache.get(key)
+                if entry is not None and entry.sample_rate == self.sample_rate:
+                    logger.debug(f"{self}: TTS desde caché [{text}]")
+                    async for frame in self._play_cached(text, entry):
+                        yield frame
+                    return
+            self._maybe_fill(key, text)
+
+        if self._cache_context_id:
+            await self._close_cache_context(end_response=False)
+        async for frame in super().run_tts(text):
+            yield frame
+
+    async def _play_cached(self, text: str, entry: CachedAudio) -> AsyncGenerator[Frame, None]:
+        await self.start_ttfb_metrics()
+        if not self._cache_context_id:
+            yield TTSStartedFrame()
+            self._cache_context_id = str(uuid.uuid4())
+            await self.create_audio_context(self._cache_context_id)
+
+        # Las palabras van intercaladas con el audio (sin pts): el transporte
+        # las emite en orden con lo que va sonando
+        words = text.split()
+        total_chars = sum(len(w) for w in words) or 1
+        chunk_bytes = int(self.sample_rate * CHUNK_SECONDS) * 2
+        word_index, chars_before = 0, 0
+        for offset in range(0, len(entry.audio), chunk_bytes):
+            progress = offset / len(entry.audio)
+            while word_index < len(words) and chars_before / total_chars <= progress:
+                await self.append_to_audio_context(self._cache_context_id, TTSTextFrame(words[word_index]))
+                chars_before += len(words[word_index])
+                word_index += 1
+            await self.append_to_audio_context(
+                self._cache_context_id,
+                TTSAudioRawFrame(audio=entry.audio[offset:offset + chunk_bytes], sample_rate=self.sample_rate, num_channels=1),
+            )
+            if offset == 0:
+                await self.stop_ttfb_metrics()
+        for word in words[word_index:]:
+            await self.append_to_audio_context(self._cache_context_id, TTSTextFrame(word))
+        yield None
+
+    async def _close_cache_context(self, end_response: bool):
+        context_id, self._cache_context_id = self._cache_context_id, None
+        await self.append_to_audio_context(context_id, TTSStoppedFrame())
+        # Sin websocket no llega el "done" de Cartesia que cierra la respuesta
+        if end_response and self._llm_response_started:
+            self._llm_response_started = False
+            await self.append_to_audio_context(context_id, LLMFullResponseEndFrame())
+        await self.remove_audio_context(context_id)
+
+    async def flush_audio(self):
+        if self._cache_context_id:
+            await self._close_cache_context(end_response=True)
+        await super().flush_audio()
+
+    async def _handle_interruption(self, frame: InterruptionFrame, direction: FrameDirection):
+        await super()._handle_interruption(frame, direction)
+        self._cache_context_id = None
+
+    def _maybe_fill(self, key: str, text: str):
+        if self._cache.admit(key):
+            self._fills[key] = self.create_task(self._fill(key, text))
+
+    async def _synthesize(self, text: str) -> CachedAudio:
+        """Sintetiza el texto completo por HTTP (fuera del websocket de la llamada)."""
+        voice = {"mode": "id", "id": self._voice_id}
+        if self._settings["emotion"]:
+            voice["__experimental_controls"] = {"emotion": self._settings["emotion"]}
+        payload = {
+            "model_id": self.model_name,
+            "transcript": text.strip(),
+            "voice": voice,
+            "output_format": self._settings["output_format"],
+            "language": self._settings["language"],
+        }
+        if self._settings["speed"]:
+            payload["speed"] = self._settings["speed"]
+        if self._settings["generation_config"]:
+            payload["generation_config"] = self._settings["generation_config"].model_dump(exclude_none=True)
+        headers = {"Cartesia-Version": self._cartesia_version, "X-API-Key": self._api_key}
+
+        start = time.perf_counter()
+        if self._http is None:
+            self._http = aiohttp.ClientSession()
+        async with self._http.post(f"{CARTESIA_API_URL}/tts/bytes", json=payload, headers=headers) as response:
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status}: {await response.text()}")
+            audio = await response.read()
+        return CachedAudio(audio=audio, sample_rate=self.sample_rate, synth_seconds=time.perf_counter() - start)
+
+    async def _fill(self, key: str, text: str):
+        """Sintetiza la frase y la guarda en la caché."""
+        try:
+            entry = await self._synthesize(text)
+            await self._cache.put(key, normalize_text(text), entry)
+            logger.debug(f"🔊 Frase cacheada ({entry.duration:.1f}s de audio): {text.strip()}")
+        except Exception as e:
+            self._cache.add_stats(fill_errors=1)
+            logger.warning(f"⚠️ No se pudo cachear el audio de '{text.strip()}': {e}")
+        finally:
+            # Si se canceló (fin de la llamada), otra sesión puede volver a intentarlo
+            self._cache.release(key)
+            self._fills.pop(key, None)
+
+    async def prerender(self, text: str) -> Optional[CachedAudio]:
+        """
+        Audio de una frase fija (p. ej. los rellenos de herramientas) con la voz
+        y configuración de este servicio. Sale de la caché si ya está; si no, se
+        sintetiza y se guarda. None si no se pudo sintetizar.
+        """
+        key = self._cache_key(text)
+        if self._cache is not None:
+            entry = await self._cache.peek(key)
+            if entry is not None and entry.sample_rate == self.sample_rate:
+                return entry
+        try:
+            entry = await self._synthesize(text)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo pre-renderizar '{text.strip()}': {e}")
+            return None
+        if self._cache is not None:
+            await self._cache.put(key, normalize_text(text), entry)
+        return entry
+
+    async def _close_http(self):
+        for task in list(self._fills.values()):
+            await self.cancel_task(task)
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def stop(self, frame):
+        await super().stop(frame)
+        await self._close_http()
+
+    async def cancel(self, frame):
+        await super().cancel(frame)
+        await self._close_http()
@@ -1,12 +1,28 @@
 """
 Processor para capturar frames de video y pasarlos a GPT-4o.
+
+En modo perezoso (VISION_LAZY=true, por defecto) el processor solo guarda una
+referencia al último frame crudo; la compresión (resize + JPEG) se hace
+cuando alguien pide la imagen (ver_camara) y corre en un pool de hilos, así
+el event loop que mueve el audio nunca queda bloqueado por PIL.
+
+Antes de mandar una imagen al LLM se compara con la última enviada usando una
+firma barata (miniatura en grises de 16x16 + dHash, calculada con NumPy). Si
+la escena no cambió, ver_camara no manda una imagen nueva.
 """
 import base64
 import asyncio
 import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pipecat.processors.frame_processor import FrameProcessor, FrameDirection
-from pipecat.frames.frames import Frame, UserImageRawFrame
+from pipecat.frames.frames import CancelFrame, EndFrame, Frame, UserImageRawFrame
 from loguru import logger
+import numpy as np
+
+from app.core.ops_server import register_route
 
 try:
     from PIL import Image
@@ -15,30 +31,203 @@ except ImportError:
     HAS_PIL = False
     logger.warning("PIL no instalado. Las imagenes no se comprimiran.")
 
+VISION_LAZY = os.getenv("VISION_LAZY", "true").lower() == "true"
+# nearest, box, bilinear, hamming, bicubic, lanczos (de más rápido a más fino)
+RESAMPLE_FILTERS = ("NEAREST", "BOX", "BILINEAR", "HAMMING", "BICUBIC", "LANCZOS")
+DEFAULT_RESAMPLE = "LANCZOS"
+VISION_RESAMPLE = os.getenv("VISION_RESAMPLE", DEFAULT_RESAMPLE).upper()
+if VISION_RESAMPLE not in RESAMPLE_FILTERS:
+    logger.warning(
+        f"⚠️ VISION_RESAMPLE={VISION_RESAMPLE.lower()} no es válido "
+        f"({', '.join(f.lower() for f in RESAMPLE_FILTERS)}); se usa {DEFAULT_RESAMPLE.lower()}"
+    )
+    VISION_RESAMPLE = DEFAULT_RESAMPLE
+VISION_JPEG_OPTIMIZE = os.getenv("VISION_JPEG_OPTIMIZE", "true").lower() == "true"
+VISION_ENCODE_WORKERS = int(os.getenv("VISION_ENCODE_WORKERS", 1))
+
+VISION_SCENE_DETECTION = os.getenv("VISION_SCENE_DETECTION", "true").lower() == "true"
+# Fracción de bits del dHash que tienen que cambiar (estructura de la escena)
+VISION_SCENE_HASH_THRESHOLD = float(os.getenv("VISION_SCENE_HASH_THRESHOLD", 0.12))
+# Diferencia media de la miniatura en grises, 0-255 (luz, color, objetos grandes)
+VISION_SCENE_DIFF_THRESHOLD = float(os.getenv("VISION_SCENE_DIFF_THRESHOLD", 8))
+# Pasado este tiempo se manda la imagen aunque la escena no haya cambiado
+VISION_SCENE_MAX_AGE = float(os.getenv("VISION_SCENE_MAX_AGE", 120))
+# Qué hace ver_camara si la escena no cambió: "note" (avisa al modelo con texto)
+# o "reuse" (vuelve a mandar la imagen anterior sin comprimir otra)
+VISION_UNCHANGED_MODE = os.getenv("VISION_UNCHANGED_MODE", "note").lower()
+
+SCENE_THUMB_SIZE = 16
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool compartido por todas las sesiones (PIL libera el GIL al redimensionar y codificar)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=VISION_ENCODE_WORKERS, thread_name_prefix="vision")
+    return _executor
+
+
+def scene_signature(frame: UserImageRawFrame) -> np.ndarray | None:
+    """
+    Miniatura en grises de SCENE_THUMB_SIZE² por promedio de bloques (menos de 1 ms en 720p).
+    None si el frame tiene menos de SCENE_THUMB_SIZE píxeles de lado (se trata como escena nueva).
+    """
+    width, height = frame.size
+    n = SCENE_THUMB_SIZE
+    if width < n or height < n:
+        return None
+    channels = len(frame.image) // (width * height)
+    pixels = np.frombuffer(frame.image, dtype=np.uint8).reshape(height, width, channels)
+    # Submuestrear antes de promediar: la firma no necesita todos los píxeles
+    # (en frames chicos menos, para que cada bloque tenga al menos un píxel)
+    step = max(min(4, height // n, width // n), 1)
+    pixels = pixels[::step, ::step, :3].astype(np.float32)
+    gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32) if pixels.shape[2] == 3 else pixels[..., 0]
+    bh, bw = gray.shape[0] // n, gray.shape[1] // n
+    return gray[: bh * n, : bw * n].reshape(n, bh, n, bw).mean(axis=(1, 3))
+
+
+def scene_distance(a: np.ndarray, b: np.ndarray) -> tuple:
+    """(fracción de bits distintos del dHash, diferencia media absoluta) entre dos firmas."""
+    hash_a = a[:, 1:] > a[:, :-1]
+    hash_b = b[:, 1:] > b[:, :-1]
+    return float(np.mean(hash_a != hash_b)), float(np.mean(np.abs(a - b)))
+
+
+def scene_changed(a: np.ndarray | None, b: np.ndarray | None) -> bool:
+    if a is None or b is None:
+        return True
+    hash_diff, mean_diff = scene_distance(a, b)
+    return hash_diff > VISION_SCENE_HASH_THRESHOLD or mean_diff > VISION_SCENE_DIFF_THRESHOLD
+
+
+class VisionStats:
+    """Compresiones hechas y evitadas, acumuladas en el proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.encodes = 0
+        self.encode_cpu_s = 0.0
+        self.skipped_captures = 0
+        # Imágenes que no se mandaron (o no se comprimieron) porque la escena no cambió
+        self.unchanged_skipped = 0
+        # Compresiones (o firmas de escena) que fallaron
+        self.encode_errors = 0
+        self.images_sent = 0
+
+    def record_scene(self, sent: bool):
+        with self._lock:
+            if sent:
+                self.images_sent += 1
+            else:
+                self.unchanged_skipped += 1
+
+    def record_error(self):
+        with self._lock:
+            self.encode_errors += 1
+
+    def record_encode(self, cpu_s: float):
+        with self._lock:
+            self.encodes += 1
+            self.encode_cpu_s += cpu_s
+
+    def record_session(self, frames: int, skipped: int):
+        with self._lock:
+            self.frames += frames
+            self.skipped_captures += skipped
+
+    @property
+    def avg_encode_cpu_s(self) -> float | None:
+        return self.encode_cpu_s / self.encodes if self.encodes else None
+
+    def snapshot(self) -> dict:
+        avg = self.avg_encode_cpu_s
+        return {
+            "lazy": VISION_LAZY,
+            "resample": VISION_RESAMPLE.lower(),
+            "frames": self.frames,
+            "encodes": self.encodes,
+            "encode_cpu_s": round(self.encode_cpu_s, 3),
+            "avg_encode_ms": round(avg * 1000, 1) if avg is not None else None,
+            "skipped_captures": self.skipped_captures,
+            "cpu_saved_s_est": round(self.skipped_captures * avg, 3) if avg is not None else None,
+            "scene_detection": VISION_SCENE_DETECTION,
+            "images_sent": self.images_sent,
+            "unchanged_skipped": self.unchanged_skipped,
+            "encode_errors": self.encode_errors,
+        }
+
+
+vision_stats = VisionStats()
+register_route("/vision", lambda query: (200, vision_stats.snapshot()))
+
+
 class VisionCaptureProcessor(FrameProcessor):
     """
     Captura frames de video del usuario, los comprime, y los almacena
     para que puedan ser incluidos en el contexto del LLM.
     """
 
-    def __init__(self, capture_interval: float = 2.0, max_size: int = 512, quality: int = 60):
+    def __init__(
+        self,
+        capture_interval: float = 2.0,
+        max_size: int = 512,
+        quality: int = 60,
+        lazy: bool = VISION_LAZY,
+        resample: str = VISION_RESAMPLE,
+        optimize: bool = VISION_JPEG_OPTIMIZE,
+        scene_detection: bool = VISION_SCENE_DETECTION,
+    ):
         super().__init__()
-        self._last_image: bytes | None = None
+        self._last_frame: UserImageRawFrame | None = None
+        # Número del último frame y del que produjo _encoded_frame: una compresión
+        # más vieja que termina tarde no pisa a una más nueva
+        self._last_frame_seq = 0
+        self._encoded_seq = 0
         self._last_image_base64: str | None = None
+        self._encoded_frame: UserImageRawFrame | None = None
+        self._encoding: asyncio.Future | None = None
+        self._encoding_frame: UserImageRawFrame | None = None
+        self._scene_detection = scene_detection
+        self._encoded_signature: np.ndarray | None = None
+        self._sent_signature: np.ndarray | None = None
+        self._sent_at = 0.0
         self._capture_interval = capture_interval
         self._last_capture_time = 0
         self._max_size = max_size
         self._quality = quality
-        logger.info(f"📷 VisionCaptureProcessor inicializado (intervalo: {capture_interval}s, max_size: {max_size}px, quality: {quality})")
-    
+        self._lazy = lazy
+        resample = resample.upper() if resample.upper() in RESAMPLE_FILTERS else DEFAULT_RESAMPLE
+        self._resample = Image.Resampling[resample] if HAS_PIL else None
+        self._optimize = optimize
+        # Para estimar cuánta CPU se ahorra frente a comprimir cada capture_interval
+        self._frames = 0
+        self._captures = 0
+        self._encodes = 0
+        self._encode_cpu_s = 0.0
+        self._images_sent = 0
+        self._unchanged_skipped = 0
+        self._encode_errors = 0
+        self._reported = False
+        logger.info(
+            f"📷 VisionCaptureProcessor inicializado (intervalo: {capture_interval}s, max_size: {max_size}px, "
+            f"quality: {quality}, {'perezoso' if lazy else 'cada intervalo'}, resample: {resample.lower()})"
+        )
+
     def _compress_image(self, frame: UserImageRawFrame) -> str:
         """Comprime la iamgen raw y retorna base64."""
         if not HAS_PIL:
             return base64.b64encode(frame.image).decode('utf-8')
-        
+
         try:
             width, height = frame.size
-            
+
             mode = 'RGBA' if len(frame.image) == width * height * 4 else 'RGB'
             img = Image.frombytes(mode, (width, height), frame.image)
 
@@ -48,11 +237,11 @@ class VisionCaptureProcessor(FrameProcessor):
             if width > self._max_size or height > self._max_size:
                 ratio = min(self._max_size / width, self._max_size / height)
                 new_size = (int(width * ratio), int(height * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
+                img = img.resize(new_size, self._resample)
                 #logger.debug(f"Imagen redimensionada a {new_size}")
-            
+
             buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=self._quality, optimize=True)
+            img.save(buffer, format='JPEG', quality=self._quality, optimize=self._optimize)
             compressed_bytes = buffer.getvalue()
 
             #logger.debug(f"Imagen comprimida: {len(frame.image)} -> {len(compressed_bytes)} bytes")
@@ -62,25 +251,184 @@ class VisionCaptureProcessor(FrameProcessor):
         except Exception as e:
             logger.error(f"Error comprimiendo imagen: {e}")
             return None
-    
+
+    def _timed_compress(self, frame: UserImageRawFrame, reference: np.ndarray | None) -> tuple:
+        """
+        Comprime en el hilo del pool midiendo el tiempo de CPU de ese hilo.
+        Retorna (base64, firma, cpu_s, sin_cambios): si la escena es igual a
+        `reference` no comprime y sin_cambios es True; si la compresión falla
+        el base64 es None y sin_cambios es False.
+        """
+        start = time.thread_time()
+        try:
+            signature = scene_signature(frame) if self._scene_detection else None
+        except Exception as e:
+            logger.error(f"Error calculando la firma de la escena: {e}")
+            return None, None, time.thread_time() - start, False
+        if reference is not None and not scene_changed(reference, signature):
+            return None, signature, time.thread_time() - start, True
+        image_base64 = self._compress_image(frame)
+        return image_base64, signature, time.thread_time() - start, False
+
+    def _record_error(self):
+        self._encode_errors += 1
+        vision_stats.record_error()
+
+    async def _encode(self, frame: UserImageRawFrame, seq: int, skip_unchanged: bool = False) -> str | None:
+        loop = asyncio.get_running_loop()
+        reference = self._encoded_signature if skip_unchanged and self._last_image_base64 else None
+        image_base64, signature, cpu_s, unchanged = await loop.run_in_executor(
+            _get_executor(), self._timed_compress, frame, reference
+        )
+        if seq < self._encoded_seq:
+            # Terminó después de la compresión de un frame más nuevo: no la pisa
+            if image_base64 is not None:
+                self._encodes += 1
+                self._encode_cpu_s += cpu_s
+                vision_stats.record_encode(cpu_s)
+            logger.debug(f"📷 Compresión del frame {seq} descartada (ya está la del {self._encoded_seq})")
+            return image_base64 if image_base64 is not None else self._last_image_base64
+        if unchanged:
+            # Captura periódica de una escena igual: se reutiliza la imagen anterior
+            self._encoded_frame = frame
+            self._encoded_seq = seq
+            self._unchanged_skipped += 1
+            vision_stats.record_scene(sent=False)
+            return self._last_image_base64
+        if image_base64 is None:
+            # No se marca como comprimido: el próximo pedido lo vuelve a intentar
+            self._record_error()
+            return None
+        self._encoded_frame = frame
+        self._encoded_seq = seq
+        self._encodes += 1
+        self._encode_cpu_s += cpu_s
+        vision_stats.record_encode(cpu_s)
+        self._encoded_signature = signature
+        self._last_image_base64 = image_base64
+        return image_base64
+
+    def _start_encode(self, frame: UserImageRawFrame, skip_unchanged: bool = False) -> asyncio.Future:
+        """Comprime `frame`, que tiene que ser el último recibido (_last_frame)."""
+        self._encoding_frame = frame
+        self._encoding = asyncio.ensure_future(self._encode(frame, self._last_frame_seq, skip_unchanged))
+        return self._encoding
+
+    def _on_image(self, frame: UserImageRawFrame):
+        """Registra un frame de video. No comprime nada en el event loop."""
+        self._frames += 1
+        self._last_frame = frame
+        self._last_frame_seq = self._frames
+        current_time = asyncio.get_running_loop().time()
+        if current_time - self._last_capture_time >= self._capture_interval:
+            # Lo que antes disparaba una compresión en línea
+            self._captures += 1
+            self._last_capture_time = current_time
+            if not self._lazy and (self._encoding is None or self._encoding.done()):
+                self._start_encode(frame, skip_unchanged=self._scene_detection)
+
     async def process_frame(self, frame: Frame, direction: FrameDirection):
         await super().process_frame(frame, direction)
 
         if isinstance(frame, UserImageRawFrame):
-            current_time = asyncio.get_event_loop().time()
-
-            if current_time - self._last_capture_time >= self._capture_interval:
-                self._last_image = frame.image
-                self._last_image_base64 = self._compress_image(frame)
-                self._last_capture_time = current_time
-                #logger.debug(f"Frame capturado y comprimido")
-        
+            self._on_image(frame)
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            self._report()
+
         await self.push_frame(frame, direction)
-    
+
+    async def get_image_base64(self) -> str | None:
+        """
+        Retorna el último frame comprimido en base64, comprimiéndolo en el pool
+        si todavía no se hizo. Llamadas seguidas sobre el mismo frame reutilizan
+        el resultado.
+        """
+        frame = self._last_frame
+        if frame is None:
+            return None
+        if frame is self._encoded_frame:
+            return self._last_image_base64
+        if self._encoding_frame is not frame or self._encoding is None or self._encoding.done():
+            # done() sin _encoded_frame: la compresión anterior de este frame falló
+            self._start_encode(frame)
+        # shield: si se cancela quien pidió la imagen, la compresión igual termina y queda cacheada
+        return await asyncio.shield(self._encoding)
+
+    async def get_image_if_changed(self) -> tuple:
+        """
+        Imagen para mandarle al LLM: (base64, True) si la escena cambió desde
+        la última imagen enviada, o (None, False) si sigue igual y la anterior
+        todavía sirve. Al retornar una imagen la marca como enviada; si no se
+        pudo procesar el frame retorna (None, True).
+        """
+        frame = self._last_frame
+        if frame is None:
+            return None, False
+        now = time.monotonic()
+        if self._scene_detection and self._sent_signature is not None and now - self._sent_at < VISION_SCENE_MAX_AGE:
+            if frame is self._encoded_frame and self._encoded_signature is not None:
+                signature = self._encoded_signature
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    signature = await loop.run_in_executor(_get_executor(), scene_signature, frame)
+                except Exception as e:
+                    logger.error(f"Error calculando la firma de la escena: {e}")
+                    self._record_error()
+                    return None, True
+            if not scene_changed(self._sent_signature, signature):
+                hash_diff, mean_diff = scene_distance(self._sent_signature, signature)
+                logger.info(f"📷 La escena no cambió (dHash {hash_diff:.2f}, diff {mean_diff:.1f}); no se manda imagen nueva")
+                self._unchanged_skipped += 1
+                vision_stats.record_scene(sent=False)
+                return None, False
+
+        image_base64 = await self.get_image_base64()
+        if image_base64 is None:
+            return None, True
+        if self._scene_detection:
+            self._sent_signature = self._encoded_signature
+            if self._sent_signature is None:
+                loop = asyncio.get_running_loop()
+                self._sent_signature = await loop.run_in_executor(_get_executor(), scene_signature, frame)
+        self._sent_at = now
+        self._images_sent += 1
+        vision_stats.record_scene(sent=True)
+        return image_base64, True
+
     def get_last_image_base64(self) -> str | None:
-        """Retorna la última imagen capturada (comprimida) en formato base64."""
+        """Retorna la última imagen ya comprimida (puede ser de un frame anterior o None en modo perezoso)."""
         return self._last_image_base64
-    
+
     def has_image(self) -> bool:
         """Verifica si hay una imagen disponible."""
-        return self._last_image is not None
\ No newline at end of file
+        return self._last_frame is not None
+
+    def session_stats(self) -> dict:
+        avg = self._encode_cpu_s / self._encodes if self._encodes else vision_stats.avg_encode_cpu_s
+        skipped = max(self._captures - self._encodes, 0)
+        return {
+            "frames": self._frames,
+            "captures": self._captures,
+            "encodes": self._encodes,
+            "encode_cpu_s": round(self._encode_cpu_s, 3),
+            "cpu_saved_s_est": round(skipped * avg, 3) if avg is not None else None,
+            "images_sent": self._images_sent,
+            "unchanged_skipped": self._unchanged_skipped,
+            "encode_errors": self._encode_errors,
+        }
+
+    def _report(self):
+        if self._reported:
+            return
+        self._reported = True
+        stats = self.session_stats()
+        vision_stats.record_session(stats["frames"], max(stats["captures"] - stats["encodes"], 0))
+        saved = stats["cpu_saved_s_est"]
+        logger.info(
+            f"📷 Visión: {stats['frames']} frames, {stats['encodes']} compresiones "
+            f"({stats['encode_cpu_s']:.2f}s de CPU) en vez de {stats['captures']}"
+            + (f", ~{saved:.2f}s de CPU ahorrados" if saved is not None else "")
+            + (f", {stats['unchanged_skipped']} imágenes sin cambios omitidas" if stats["unchanged_skipped"] else "")
+            + (f", {stats['encode_errors']} errores de compresión" if stats["encode_errors"] else "")
+        )
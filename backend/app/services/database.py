@@ -1,21 +1,32 @@
 """
 Servicio para interactuar con Supabase y guardar el historial de chat.
+
+Asíncrono, sobre el pool de app/core/supabase_pool.py: ninguna consulta
+bloquea el event loop de la llamada de voz ni de la API de texto.
 """
+import asyncio
 import os
 from dotenv import load_dotenv
 from loguru import logger
-from supabase import create_client, Client
-from app.core.supabase_client import get_supabase
+from app.core.supabase_pool import SupabasePool, get_supabase_pool
+from app.services.memory_selection import MemorySelector, get_memory_selector
+from app.services.memory_store import MemoryStore, get_memory_store
 
 load_dotenv()
 
 class DatabaseService:
-    def __init__(self):
-        self.client: Client = get_supabase()
+    def __init__(self, pool: SupabasePool = None, memories: MemoryStore = None, selector: MemorySelector = None):
+        self.pool = pool or get_supabase_pool()
+        # Memoria persistente con caché, compartida por todas las sesiones del proceso
+        self.memories = memories or get_memory_store()
+        # Qué memorias se inyectan en cada turno (por relevancia y presupuesto de tokens)
+        self.selector = selector or get_memory_selector()
         self.conversation_id = None
         self.user_id = None
+        # Último guardado encolado con queue_message (se encadenan para conservar el orden)
+        self._pending_write: asyncio.Task | None = None
     
-    def create_conversation(self, title: str = "Nueva conversacion", user_id: str = None):
+    async def create_conversation(self, title: str = "Nueva conversacion", user_id: str = None):
         """Crea una nueva sesion de conversacion"""
         data = {
             "title": title,
@@ -25,7 +36,7 @@ class DatabaseService:
         if user_id:
             data["user_id"] = user_id
 
-        response = self.client.table("conversations").insert(data).execute()
+        response = await self.pool.execute(lambda c: c.table("conversations").insert(data), label="conversations")
 
         if response.data:
             self.conversation_id = response.data[0]['id']
@@ -34,11 +45,14 @@ class DatabaseService:
         return None
     
     
-    def add_message(self, role: str, content: str, images: list = None):
+    async def add_message(self, role: str, content: str, images: list = None):
         """Guarda un mensaje en la conversacion actual (soporta imagenes)"""
         if not self.conversation_id:
             logger.warning("⚠️ No hay conversacion activa. Creando una nueva automaticamente...")
-            self.create_conversation(title="Conversacion Automatica", user_id=self.user_id)
+            try:
+                await self.create_conversation(title="Conversacion Automatica", user_id=self.user_id)
+            except Exception as e:
+                logger.error(f"❌ error creando conversacion: {e}")
             if not self.conversation_id:
                 logger.error("No se pudo crear la conversacion")
                 return
@@ -50,25 +64,61 @@ class DatabaseService:
             "images": images if images else [] # Guardar URLs de imagenes
         }
         try:
-            self.client.table("messages").insert(data).execute()
+            await self.pool.execute(lambda c: c.table("messages").insert(data), label="messages")
             logger.debug(f"💾 mensaje guardado ({role}) - Imgs: {len(images) if images else 0}")
         except Exception as e:
             logger.error(f"❌ error guardando mensaje: {e}")
+
+    def queue_message(self, role: str, content: str, images: list = None):
+        """
+        Guarda un mensaje sin esperar a la base (para el pipeline de voz).
+        Los guardados encolados se hacen de a uno y en orden.
+        """
+        previous = self._pending_write
+
+        async def write():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await self.add_message(role, content, images=images)
+
+        self._pending_write = asyncio.get_running_loop().create_task(write())
+
+    async def flush(self):
+        """Espera los mensajes encolados con queue_message."""
+        if self._pending_write is not None:
+            await asyncio.gather(self._pending_write, return_exceptions=True)
+    
+    async def add_turn_latencies(self, records: list):
+        """Guarda un lote de latencias por turno (tabla turn_latency, migrations/0005)"""
+        try:
+            await self.pool.execute(lambda c: c.table("turn_latency").insert(records), label="turn_latency")
+            logger.debug(f"💾 {len(records)} latencias de turno guardadas")
+        except Exception as e:
+            logger.error(f"❌ error guardando latencias: {e}")
     
-    def get_history(self, limit: int = 50):
+    async def get_history(self, limit: int = 50):
         """Recupera el historial (para futuras implementaciones de 'continuar')"""
         if not self.conversation_id:
             return []
         
-        response = self.client.table("messages").select("*").eq("conversation_id", self.conversation_id).order("created_at", desc=False).limit(limit).execute()
+        conversation_id = self.conversation_id
+        response = await self.pool.execute(
+            lambda c: c.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at", desc=False).limit(limit),
+            idempotent=True,
+            label="messages",
+        )
 
         return response.data
     
-    def get_conversation_history(self, conversation_id: str):
+    async def get_conversation_history(self, conversation_id: str):
         """Recupera el historial formateado para el LLM"""
         try:
             # Ahora traemos tambien 'images'
-            response = self.client.table("messages").select("role, content, images").eq("conversation_id", conversation_id).is_("deleted_at", "null").order("created_at").execute()
+            response = await self.pool.execute(
+                lambda c: c.table("messages").select("role, content, images").eq("conversation_id", conversation_id).is_("deleted_at", "null").order("created_at"),
+                idempotent=True,
+                label="messages",
+            )
 
             formatted_history = []
             if response.data:
@@ -96,89 +146,49 @@ class DatabaseService:
             logger.error(f"❌ Error recuperando historial: {e}")
             return []
 
-    def save_memory(self, key: str, value: str, user_id: str = None):
+    async def save_memory(self, key: str, value: str, user_id: str = None):
         """
         Guarda un dato persistente.
         - Si user_id es None -> Memoria Global (shared_memory)
         - Si user_id tiene valor -> Memoria Usuario (user_memory)
+        Pasa por el MemoryStore: un solo upsert y la caché queda actualizada.
         """
         try:
+            await self.memories.save(key, value, user_id=user_id)
             if user_id:
-                # Memoria de Usuario
-                data = {
-                    "user_id": user_id,
-                    "key": key,
-                    "value": value
-                }
-                # Upsert en user_memory
-                # OJO: user_memory pkey es 'id' (autoincrement). Necesitamos unique constraint en (user_id, key) para upsert correcto.
-                # Asumimos que la tabla tiene logicamente esa unicidad. Si no, hacemos delete+insert o check.
-                # Para simplificar con Supabase:
-                # Vamos a intentar borrar previo y luego insertar, o usar upsert con on_conflict si existe el index.
-                
-                # Check if exists
-                existing = self.client.table("user_memory").select("id").eq("user_id", user_id).eq("key", key).execute()
-                if existing.data:
-                    # Update
-                    self.client.table("user_memory").update({"value": value}).eq("id", existing.data[0]['id']).execute()
-                else:
-                    # Insert
-                    self.client.table("user_memory").insert(data).execute()
-                
                 logger.info(f"🧠 Memoria USUARIO guardada: {key} = {value} ({user_id})")
             else:
-                # Memoria Global
-                data = {"key": key, "value": value}
-                self.client.table("shared_memory").upsert(data, on_conflict="key").execute()
                 logger.info(f"🌍 Memoria GLOBAL guardada: {key} = {value}")
-            
             return True
         except Exception as e:
             logger.error(f"❌ Error guardando memoria ({'user' if user_id else 'global'}): {e}")
             return False
     
-    def get_all_memories(self, user_id: str = None):
-        """Recupera todas las memorias (Globales + Usuario si existe)"""
-        memories = {}
+    async def get_all_memories(self, user_id: str = None):
+        """Recupera todas las memorias (Globales + Usuario si existe), desde la caché del MemoryStore"""
         try:
-            # 1. Globales
-            response_shared = self.client.table("shared_memory").select("key, value").execute()
-            for item in response_shared.data:
-                memories[f"GLOBAL_{item['key']}"] = item['value']
-            
-            # 2. Usuario (si aplica)
-            if user_id:
-                response_user = self.client.table("user_memory").select("key, value").eq("user_id", user_id).execute()
-                for item in response_user.data:
-                    memories[f"USER_{item['key']}"] = item['value']
-                    
-            return memories
+            return await self.memories.get_all(user_id)
         except Exception as e:
             logger.error(f"Error recuperando memorias: {e}")
             return {}
         
-    def delete_memory(self, key: str, user_id: str = None):
+    async def get_relevant_memories(self, query: str = None, user_id: str = None):
+        """
+        Memorias a inyectar en el prompt: las fijas y las más relevantes a `query`,
+        dentro del presupuesto de tokens (ver memory_selection.py)
+        """
+        try:
+            return await self.selector.select(user_id, query)
+        except Exception as e:
+            logger.error(f"Error seleccionando memorias: {e}")
+            return {}
+
+    async def delete_memory(self, key: str, user_id: str = None):
         """Borra un dato persistente (intenta en ambos si no se especifica, o prioriza usuario)"""
         try:
-            deleted = False
-            # Intentar borrar de usuario primero si hay ID
-            if user_id:
-                res = self.client.table("user_memory").delete().eq("user_id", user_id).eq("key", key).execute()
-                if res.data:
-                    logger.info(f"🗑️ Memoria USUARIO borrada: {key}")
-                    deleted = True
-            
-            # Si no se borró de usuario (o no habia user_id), intentar global
-            # PERO: si el usuario quiere borrar algo global, ¿le dejamos?
-            # Asumamos que 'borrar_dato' en BotTools maneja permisos. 
-            # Aquí la función es genérica.
-            if not deleted:
-                res = self.client.table("shared_memory").delete().eq("key", key).execute()
-                if res.data:
-                    logger.info(f"🗑️ Memoria GLOBAL borrada: {key}")
-                    deleted = True
-            
-            return deleted
+            # Si no se borró de usuario (o no habia user_id), se intenta en global.
+            # Los permisos los maneja 'borrar_dato' en BotTools; aquí la función es genérica.
+            return await self.memories.delete(key, user_id=user_id)
         except Exception as e:
             logger.error(f"❌ Error borrando memoria: {e}")
             return False
@@ -0,0 +1,286 @@
+"""
+Perfiles de embedding: dimensiones y precisión de almacenamiento.
+
+`text-embedding-3-small` admite el parámetro `dimensions` (el vector reducido
+equivale a truncar el vector completo y re-normalizarlo), y los vectores se
+pueden guardar en float16 o int8. El perfil activo (EMBEDDING_PROFILE) lo usan
+tanto la búsqueda en rag.py como la ingesta, para que consulta e índice estén
+siempre en el mismo espacio.
+
+En Supabase el perfil completo usa la columna `embedding` y la RPC
+`match_documents`; los perfiles reducidos usan `embedding_<perfil>` y
+`match_documents_<perfil>` (halfvec; pgvector no tiene tipo int8, así que los
+perfiles int8 se guardan como halfvec con valores cuantizados). En un índice
+local (LocalIndex) int8 se guarda realmente como int8.
+
+Uso:
+    uv run python -m app.services.embedding_profile migrate --profile d512_f16
+    uv run python -m app.services.embedding_profile evaluate --k 5
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+FULL_DIMENSIONS = 1536
+
+
+@dataclass(frozen=True)
+class EmbeddingProfile:
+    name: str
+    dimensions: int
+    precision: str
+
+    @property
+    def is_full(self) -> bool:
+        return self.dimensions == FULL_DIMENSIONS and self.precision == "float32"
+
+    @property
+    def column(self) -> str:
+        """Columna de `knowledge_base` donde se guarda el vector de este perfil."""
+        return "embedding" if self.is_full else f"embedding_{self.name}"
+
+    @property
+    def rpc(self) -> str:
+        """Función de búsqueda en Supabase para este perfil."""
+        return "match_documents" if self.is_full else f"match_documents_{self.name}"
+
+    def embedding_kwargs(self) -> dict:
+        """Parámetros extra para `embeddings.create`."""
+        if self.dimensions == FULL_DIMENSIONS:
+            return {}
+        return {"dimensions": self.dimensions}
+
+    def reduce(self, vector: Sequence[float]) -> np.ndarray:
+        """Trunca un vector completo a las dimensiones del perfil y lo re-normaliza."""
+        reduced = np.asarray(vector, dtype=np.float32)[: self.dimensions]
+        norm = np.linalg.norm(reduced)
+        return reduced / norm if norm else reduced
+
+    def to_storage(self, vector: Sequence[float]) -> List[float]:
+        """Vector listo para guardar en Supabase (reducido y cuantizado)."""
+        reduced = self.reduce(vector)
+        if self.precision == "float16":
+            return reduced.astype(np.float16).astype(float).tolist()
+        if self.precision == "int8":
+            return quantize_int8(reduced[None, :])[0][0].astype(float).tolist()
+        return reduced.tolist()
+
+
+PROFILES: Dict[str, EmbeddingProfile] = {
+    p.name: p
+    for p in (
+        EmbeddingProfile("full", 1536, "float32"),
+        EmbeddingProfile("d1536_f16", 1536, "float16"),
+        EmbeddingProfile("d768_f16", 768, "float16"),
+        EmbeddingProfile("d512_f16", 512, "float16"),
+        EmbeddingProfile("d512_i8", 512, "int8"),
+        EmbeddingProfile("d256_i8", 256, "int8"),
+    )
+}
+
+
+def get_profile(name: str | None = None) -> EmbeddingProfile:
+    """Perfil por nombre, o el configurado en EMBEDDING_PROFILE (por defecto 'full')."""
+    name = name or os.getenv("EMBEDDING_PROFILE", "full")
+    if name not in PROFILES:
+        raise ValueError(f"Perfil de embedding desconocido: {name}. Opciones: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Cuantización simétrica por fila. Retorna (valores int8, escala por fila)."""
+    max_abs = np.abs(matrix).max(axis=1, keepdims=True)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    return np.round(matrix / scale).astype(np.int8), scale
+
+
+class LocalIndex:
+    """Índice en memoria con el almacenamiento del perfil (búsqueda exacta por coseno)."""
+
+    def __init__(self, profile: EmbeddingProfile, full_vectors: np.ndarray):
+        self.profile = profile
+        reduced = full_vectors[:, : profile.dimensions].astype(np.float32)
+        reduced /= np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+
+        if profile.precision == "int8":
+            self._matrix, _ = quantize_int8(reduced)
+            # La escala por fila no cambia el orden del coseno si re-normalizamos
+            self._norms = np.linalg.norm(self._matrix.astype(np.float32), axis=1)
+        elif profile.precision == "float16":
+            self._matrix = reduced.astype(np.float16)
+            self._norms = None
+        else:
+            self._matrix = reduced
+            self._norms = None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._matrix.nbytes)
+
+    def search(self, query_full: Sequence[float], k: int) -> np.ndarray:
+        query = self.profile.reduce(query_full)
+        if self.profile.precision == "int8":
+            q8, _ = quantize_int8(query[None, :])
+            scores = (self._matrix.astype(np.int32) @ q8[0].astype(np.int32)) / self._norms
+        elif self.profile.precision == "float16":
+            scores = self._matrix @ query.astype(np.float16)
+        else:
+            scores = self._matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+
+def parse_vector(value) -> List[float]:
+    """PostgREST devuelve los vectores de pgvector como texto '[0.1,0.2,...]'."""
+    return json.loads(value) if isinstance(value, str) else list(value)
+
+
+def _fetch_rows(columns: str, page_size: int = 500) -> List[dict]:
+    from app.core.supabase_client import get_supabase
+
+    client = get_supabase()
+    rows, start = [], 0
+    while True:
+        response = (
+            client.table("knowledge_base")
+            .select(columns)
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        rows.extend(response.data or [])
+        if len(response.data or []) < page_size:
+            return rows
+        start += page_size
+
+
+def migrate(profile: EmbeddingProfile, workers: int = 8):
+    """
+    Re-indexa `knowledge_base` al perfil dado a partir de los vectores completos
+    ya guardados (sin volver a llamar a OpenAI).
+    """
+    from app.core.supabase_client import get_supabase
+
+    if profile.is_full:
+        print("El perfil 'full' usa la columna 'embedding'; no hay nada que migrar.")
+        return
+
+    client = get_supabase()
+    rows = _fetch_rows("id, embedding")
+    print(f"🔄 Migrando {len(rows)} chunks a '{profile.name}' ({profile.column})...")
+
+    def update(row):
+        vector = profile.to_storage(parse_vector(row["embedding"]))
+        client.table("knowledge_base").update({profile.column: vector}).eq("id", row["id"]).execute()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(update, rows))
+    elapsed = time.perf_counter() - start
+    print(f"✅ {len(rows)} chunks migrados en {elapsed:.1f}s")
+
+
+# Consultas de ejemplo para la evaluación si no se pasa un archivo
+DEFAULT_QUERIES = [
+    "¿Cuáles son las obligaciones del adherido?",
+    "¿Qué pasa si quiero dar de baja mi ficha?",
+    "¿Qué jurisdicción aplica al contrato?",
+    "¿Cómo usan mis datos personales?",
+    "¿Qué cookies utiliza la plataforma?",
+    "¿Quiénes son 14/11 S.A.S. y Red Futura?",
+    "¿Qué comisiones cobra un asesor?",
+    "¿Pueden usar mis fotos en redes sociales?",
+    "¿Los servicios extras son reembolsables?",
+    "¿Tu Guía garantiza ventas o contactos?",
+]
+
+
+def evaluate(profile_names: List[str], queries: List[str], k: int = 5, repeats: int = 20) -> dict:
+    """
+    Compara cada perfil contra el baseline de precisión completa sobre los
+    chunks reales: recall@k (coincidencia con el top-k completo), latencia de
+    búsqueda y memoria del índice.
+    """
+    from openai import OpenAI
+
+    rows = _fetch_rows("id, embedding")
+    if not rows:
+        raise RuntimeError("knowledge_base está vacía; indexa documentos primero")
+    vectors = np.array([parse_vector(r["embedding"]) for r in rows], dtype=np.float32)
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=queries)
+    query_vectors = [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    baseline = LocalIndex(PROFILES["full"], vectors)
+    expected = [set(baseline.search(q, k).tolist()) for q in query_vectors]
+
+    report = {"k": k, "chunks": len(rows), "queries": len(queries), "profiles": {}}
+    for name in ["full", *[n for n in profile_names if n != "full"]]:
+        index = LocalIndex(PROFILES[name], vectors)
+        recalls, latencies = [], []
+        for query, truth in zip(query_vectors, expected):
+            found = set(index.search(query, k).tolist())
+            recalls.append(len(found & truth) / len(truth))
+            start = time.perf_counter()
+            for _ in range(repeats):
+                index.search(query, k)
+            latencies.append((time.perf_counter() - start) / repeats * 1000)
+        report["profiles"][name] = {
+            "dimensions": index.profile.dimensions,
+            "precision": index.profile.precision,
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+            "index_bytes": index.nbytes,
+            "memory_ratio": round(index.nbytes / baseline.nbytes, 3),
+        }
+    return report
+
+
+def _print_report(report: dict):
+    print(f"\n📊 recall@{report['k']} vs full-precision ({report['chunks']} chunks, {report['queries']} consultas)")
+    print(f"{'perfil':<12} {'dims':>5} {'precisión':>9} {'recall':>7} {'p50 ms':>8} {'memoria':>8}")
+    for name, r in report["profiles"].items():
+        print(
+            f"{name:<12} {r['dimensions']:>5} {r['precision']:>9} {r['recall_at_k']:>7.3f} "
+            f"{r['latency_ms_p50']:>8.3f} {r['memory_ratio']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfiles de embedding")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = sub.add_parser("migrate", help="Re-indexar knowledge_base a un perfil")
+    migrate_parser.add_argument("--profile", default=None, help="Perfil (por defecto EMBEDDING_PROFILE)")
+
+    eval_parser = sub.add_parser("evaluate", help="Comparar recall y latencia de los perfiles")
+    eval_parser.add_argument("--profiles", nargs="*", default=list(PROFILES))
+    eval_parser.add_argument("--queries", help="JSON con una lista de consultas")
+    eval_parser.add_argument("--k", type=int, default=5)
+    eval_parser.add_argument("--output", help="Guardar el reporte en este archivo JSON")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(get_profile(args.profile))
+    else:
+        queries = DEFAULT_QUERIES
+        if args.queries:
+            with open(args.queries, encoding="utf-8") as f:
+                queries = json.load(f)
+        report = evaluate(args.profiles, queries, k=args.k)
+        _print_report(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,294 @@
+"""
+Ingesta de documentos en la base de conocimiento (tabla `knowledge_base`).
+
+Divide los documentos en chunks con tiktoken, genera los embeddings en lotes
+concurrentes y escribe las filas con inserts masivos. Cada chunk guarda un
+hash de su contenido en `metadata.content_hash`, así al re-indexar un
+documento editado solo se embeben los chunks que cambiaron.
+
+Uso:
+    uv run python -m app.services.ingestion --builtin
+    uv run python -m app.services.ingestion docs/manual.md docs/faq.txt
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List
+
+import tiktoken
+from dotenv import load_dotenv
+from loguru import logger
+from openai import AsyncOpenAI
+
+from app.core import knowledge_base
+from app.core.supabase_client import get_supabase
+from app.services.embedding_profile import EMBEDDING_MODEL, EmbeddingProfile, get_profile
+
+load_dotenv()
+
+# Configuración (mismos valores que la ruta upload-knowledge del frontend)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMBEDDING_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", 64))
+EMBEDDING_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", 4))
+INSERT_BATCH_SIZE = 100
+
+TABLE = "knowledge_base"
+
+# Textos legales definidos en app/core/knowledge_base.py
+BUILTIN_DOCUMENTS: Dict[str, str] = {
+    "CONTRATO_TU_GUIA_AR": knowledge_base.CONTRATO_TU_GUIA_AR,
+    "CONTRATO_ASESORES_TU_GUIA_AR": knowledge_base.CONTRATO_ASESORES_TU_GUIA_AR,
+    "TERMINOS_Y_CONDICIONES_ECOSISTEMA": knowledge_base.TERMINOS_Y_CONDICIONES_ECOSISTEMA,
+    "POLITICA_PRIVACIDAD": knowledge_base.POLITICA_PRIVACIDAD,
+    "POLITICA_COOKIES": knowledge_base.POLITICA_COOKIES,
+    "SOBRE_NOSOTROS": knowledge_base.SOBRE_NOSOTROS,
+}
+
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> tiktoken.Encoding:
+    """Carga el tokenizer la primera vez que se usa (descarga el BPE si no está en caché)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    hash: str
+
+
+def content_hash(text: str) -> str:
+    """Hash estable del contenido de un chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _split_long(text: str, chunk_size: int, overlap: int, encoding=None) -> List[str]:
+    """Ventana deslizante de tokens para párrafos más largos que un chunk."""
+    encoding = encoding or _get_encoding()
+    tokens = encoding.encode(text)
+    parts = []
+    start = 0
+    while start < len(tokens):
+        end = start + chunk_size
+        parts.append(encoding.decode(tokens[start:end]))
+        if end >= len(tokens):
+            break
+        start = end - overlap
+    return parts
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP, encoding=None) -> List[Chunk]:
+    """
+    Divide el texto en chunks de hasta `chunk_size` tokens.
+
+    Agrupa párrafos completos en vez de cortar cada N tokens: así una edición
+    en una sección solo cambia el chunk que la contiene y el resto conserva
+    su hash (con cortes fijos, insertar una línea desplaza todos los chunks
+    siguientes). `encoding` reemplaza al tokenizer de la ingesta (el
+    benchmark de RAG lo usa para correr sin tiktoken).
+    """
+    encoding = encoding or _get_encoding()
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        n_tokens = len(encoding.encode(paragraph))
+        if n_tokens > chunk_size:
+            if current:
+                pieces.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            pieces.extend(_split_long(paragraph, chunk_size, overlap, encoding))
+            continue
+        if current and current_tokens + n_tokens > chunk_size:
+            pieces.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += n_tokens
+    if current:
+        pieces.append("\n\n".join(current))
+
+    return [Chunk(index=i, text=piece, hash=content_hash(piece)) for i, piece in enumerate(pieces)]
+
+
+async def embed_texts(
+    texts: List[str],
+    client: AsyncOpenAI,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+) -> List[List[float]]:
+    """Genera embeddings en lotes de `batch_size`, con hasta `concurrency` llamadas a la vez."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            response = await client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+            return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return [embedding for batch in results for embedding in batch]
+
+
+class KnowledgeIngestor:
+    """Indexa documentos en `knowledge_base` de forma incremental."""
+
+    def __init__(self, openai_client: AsyncOpenAI | None = None, profile: EmbeddingProfile | None = None):
+        self.client = get_supabase()
+        self.openai = openai_client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.profile = profile or get_profile()
+
+    def _existing_rows(self, document_name: str) -> List[dict]:
+        response = (
+            self.client.table(TABLE)
+            .select("id, chunk_index, metadata")
+            .eq("document_name", document_name)
+            .execute()
+        )
+        return response.data or []
+
+    def _insert_rows(self, rows: List[dict]):
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            self.client.table(TABLE).insert(rows[i:i + INSERT_BATCH_SIZE]).execute()
+
+    def _delete_rows(self, ids: List):
+        for i in range(0, len(ids), INSERT_BATCH_SIZE):
+            self.client.table(TABLE).delete().in_("id", ids[i:i + INSERT_BATCH_SIZE]).execute()
+
+    def _update_index(self, row_id, chunk_index: int):
+        self.client.table(TABLE).update({"chunk_index": chunk_index}).eq("id", row_id).execute()
+
+    async def ingest(
+        self,
+        document_name: str,
+        text: str,
+        document_type: str = "text/plain",
+        force: bool = False,
+    ) -> dict:
+        """
+        Indexa un documento. Solo embebe los chunks cuyo hash no está ya guardado;
+        con `force` embebe todos y reemplaza todas las filas anteriores.
+
+        Returns:
+            Dict con chunks totales, embebidos, reutilizados, borrados y chunks/s.
+        """
+        start = time.perf_counter()
+        chunks = chunk_text(text)
+
+        existing = await asyncio.to_thread(self._existing_rows, document_name)
+
+        # hash -> filas existentes con ese contenido (puede repetirse un párrafo)
+        existing_by_hash: Dict[str, List[dict]] = {}
+        for row in existing:
+            row_hash = (row.get("metadata") or {}).get("content_hash")
+            existing_by_hash.setdefault(row_hash, []).append(row)
+
+        to_embed: List[Chunk] = []
+        reindex: List[tuple] = []
+        for chunk in chunks:
+            # Con force no se reutiliza ninguna: todas se borran después de insertar
+            matches = None if force else existing_by_hash.get(chunk.hash)
+            if matches:
+                row = matches.pop(0)
+                if row["chunk_index"] != chunk.index:
+                    reindex.append((row["id"], chunk.index))
+            else:
+                to_embed.append(chunk)
+
+        # Lo que sobró ya no está en el documento
+        stale_ids = [row["id"] for rows in existing_by_hash.values() for row in rows]
+
+        embeddings = await embed_texts([c.text for c in to_embed], self.openai) if to_embed else []
+        rows = []
+        for chunk, embedding in zip(to_embed, embeddings):
+            row = {
+                "document_name": document_name,
+                "document_type": document_type,
+                "chunk_text": chunk.text,
+                "chunk_index": chunk.index,
+                # Siempre guardamos el vector completo: es la base para migrar de perfil
+                "embedding": embedding,
+                "metadata": {
+                    "original_file": document_name,
+                    "content_hash": chunk.hash,
+                    "source": "backend_ingestion",
+                },
+            }
+            if not self.profile.is_full:
+                row[self.profile.column] = self.profile.to_storage(embedding)
+            rows.append(row)
+
+        # Insertar antes de borrar: si algo falla, el documento anterior sigue indexado
+        if rows:
+            await asyncio.to_thread(self._insert_rows, rows)
+        if stale_ids:
+            await asyncio.to_thread(self._delete_rows, stale_ids)
+        if reindex:
+            await asyncio.gather(*(asyncio.to_thread(self._update_index, row_id, idx) for row_id, idx in reindex))
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "document_name": document_name,
+            "chunks": len(chunks),
+            "embedded": len(to_embed),
+            "unchanged": len(chunks) - len(to_embed),
+            "deleted": len(stale_ids),
+            "seconds": round(elapsed, 2),
+            "chunks_per_second": round(len(chunks) / elapsed, 1) if elapsed else 0.0,
+        }
+        logger.info(
+            f"📚 {document_name}: {stats['embedded']} embebidos, {stats['unchanged']} sin cambios, "
+            f"{stats['deleted']} borrados ({stats['chunks_per_second']} chunks/s)"
+        )
+        return stats
+
+    async def ingest_many(self, documents: Dict[str, str], force: bool = False) -> List[dict]:
+        """Indexa varios documentos en paralelo."""
+        return list(await asyncio.gather(*(
+            self.ingest(name, text, force=force) for name, text in documents.items()
+        )))
+
+
+def _load_files(paths: List[str]) -> Dict[str, str]:
+    documents = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            documents[os.path.basename(path)] = f.read()
+    return documents
+
+
+async def _main(args):
+    documents: Dict[str, str] = {}
+    if args.builtin:
+        documents.update(BUILTIN_DOCUMENTS)
+    documents.update(_load_files(args.paths))
+
+    if not documents:
+        print("Nada que indexar. Usa --builtin o pasa rutas de archivos .txt/.md")
+        return
+
+    start = time.perf_counter()
+    results = await KnowledgeIngestor().ingest_many(documents, force=args.force)
+    elapsed = time.perf_counter() - start
+
+    total = sum(r["chunks"] for r in results)
+    embedded = sum(r["embedded"] for r in results)
+    print(f"\n✅ {len(results)} documentos, {total} chunks ({embedded} embebidos) en {elapsed:.1f}s")
+    print(f"⚡ Throughput: {total / elapsed:.1f} chunks/s" if elapsed else "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa documentos en la base de conocimiento")
+    parser.add_argument("paths", nargs="*", help="Archivos de texto (.txt, .md) a indexar")
+    parser.add_argument("--builtin", action="store_true", help="Indexar los textos de app/core/knowledge_base.py")
+    parser.add_argument("--force", action="store_true", help="Re-embeber todo el documento y reemplazar sus filas")
+    asyncio.run(_main(parser.parse_args()))
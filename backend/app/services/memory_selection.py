@@ -0,0 +1,220 @@
+"""
+Selección de las memorias que se inyectan en el prompt.
+
+`shared_memory` la escribe cualquier usuario (`guardar_dato` con
+scope=public), así que crece sin límite; inyectarla entera en cada turno
+agranda el prompt de todos. `MemorySelector` arma la lista con un
+presupuesto de tokens (MEMORY_TOKEN_BUDGET):
+
+  - Si todas las memorias entran en el presupuesto, se inyectan todas (sin
+    llamar a OpenAI).
+  - Si no, primero las fijas: las marcadas `pinned` en la base y las de
+    MEMORY_PINNED_KEYS (como mucho MEMORY_PINNED_MAX).
+  - Después las MEMORY_TOP_K más parecidas al mensaje actual (coseno contra
+    el embedding guardado con cada dato, ver memory_store.py), descartando
+    las que no llegan a MEMORY_MIN_SIMILARITY.
+  - Sin mensaje (una sesión de voz nueva) van primero las del usuario y
+    después las globales, hasta el presupuesto.
+
+Las filas viejas sin embedding se embeben en lote la primera vez que hacen
+falta y quedan solo en memoria del proceso; se guardan con su embedding la
+próxima vez que se escriban.
+
+/memory/selection muestra cuántos tokens de memoria había, cuántos se
+inyectaron y cuántos se evitaron.
+"""
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.core.ops_server import register_route
+from app.core.tokens import count_tokens
+from app.services.memory_store import Memory, MemoryStore, embed_texts, get_memory_store, memory_text
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", 400))
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", 8))
+MEMORY_MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", 0.2))
+# Claves que se inyectan siempre, sin prefijo (ej: "nombre,idioma_preferido")
+MEMORY_PINNED_KEYS = {k.strip() for k in os.getenv("MEMORY_PINNED_KEYS", "").split(",") if k.strip()}
+MEMORY_PINNED_MAX = int(os.getenv("MEMORY_PINNED_MAX", 5))
+# Embeddings calculados en el momento para filas sin embedding
+LAZY_EMBEDDINGS_MAX = 5000
+
+
+def memory_line(label: str, value: str) -> str:
+    return f"- {label}: {value}"
+
+
+@lru_cache(maxsize=4096)
+def _line_tokens(line: str) -> int:
+    return count_tokens(line)
+
+
+def _key(label: str) -> str:
+    """"USER_nombre" -> "nombre"."""
+    return label.split("_", 1)[1] if label.startswith(("GLOBAL_", "USER_")) else label
+
+
+class MemorySelector:
+    """Elige las memorias relevantes al mensaje dentro de un presupuesto de tokens."""
+
+    def __init__(
+        self,
+        store: MemoryStore | None = None,
+        budget: int = MEMORY_TOKEN_BUDGET,
+        top_k: int = MEMORY_TOP_K,
+        min_similarity: float = MEMORY_MIN_SIMILARITY,
+        pinned_keys: set | None = None,
+        embed=embed_texts,
+    ):
+        self.store = store or get_memory_store()
+        self._budget = budget
+        self._top_k = top_k
+        self._min_similarity = min_similarity
+        self._pinned_keys = MEMORY_PINNED_KEYS if pinned_keys is None else pinned_keys
+        self._embed = embed
+        self._lazy: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "selections": 0, "full": 0, "ranked": 0, "unranked": 0,
+            "memories_available": 0, "memories_injected": 0,
+            "tokens_available": 0, "tokens_injected": 0,
+            "query_embeddings": 0, "lazy_embedded": 0, "errors": 0,
+        }
+
+    def _count(self, **deltas):
+        with self._lock:
+            for stat, n in deltas.items():
+                self.stats[stat] += n
+
+    def _is_pinned(self, label: str, memory: Memory) -> bool:
+        return memory.pinned or _key(label) in self._pinned_keys
+
+    async def _query_embedding(self, query: str) -> np.ndarray:
+        from app.services.rag import generate_query_embedding_cached
+
+        self._count(query_embeddings=1)
+        return np.asarray(await asyncio.to_thread(generate_query_embedding_cached, query), dtype=np.float32)
+
+    async def _embeddings(self, items: List[Tuple[str, Memory]], dimensions: int) -> np.ndarray:
+        """Matriz de embeddings de `items`; embebe en un lote los que no tienen uno utilizable."""
+        texts = [memory_text(_key(label), memory.value) for label, memory in items]
+        with self._lock:
+            missing = [
+                text for (_, memory), text in zip(items, texts)
+                if (memory.embedding is None or len(memory.embedding) != dimensions) and text not in self._lazy
+            ]
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            vectors = await asyncio.to_thread(self._embed, missing)
+            self._count(lazy_embedded=len(missing))
+            with self._lock:
+                for text, vector in zip(missing, vectors):
+                    self._lazy[text] = tuple(vector)
+                while len(self._lazy) > LAZY_EMBEDDINGS_MAX:
+                    self._lazy.popitem(last=False)
+
+        rows = []
+        with self._lock:
+            for (_, memory), text in zip(items, texts):
+                if memory.embedding is not None and len(memory.embedding) == dimensions:
+                    rows.append(memory.embedding)
+                else:
+                    rows.append(self._lazy[text])
+        return np.asarray(rows, dtype=np.float32)
+
+    async def _rank(self, items: List[Tuple[str, Memory]], query: str) -> List[Tuple[str, Memory]]:
+        """Memorias por similitud con el mensaje, las que pasan MEMORY_MIN_SIMILARITY."""
+        query_vector = await self._query_embedding(query)
+        matrix = await self._embeddings(items, len(query_vector))
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = matrix @ query_vector / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)
+        return [items[i] for i in order if scores[i] >= self._min_similarity]
+
+    async def select(self, user_id: str | None = None, query: str | None = None) -> Dict[str, str]:
+        """{etiqueta: valor} de las memorias a inyectar para este mensaje."""
+        memories = await self.store.get_items(user_id)
+        tokens = {label: _line_tokens(memory_line(label, m.value)) for label, m in memories.items()}
+        available = sum(tokens.values())
+        self._count(selections=1, memories_available=len(memories), tokens_available=available)
+
+        if available <= self._budget:
+            self._count(full=1, memories_injected=len(memories), tokens_injected=available)
+            return {label: m.value for label, m in memories.items()}
+
+        # Las del usuario antes que las globales, en los fijos y en el orden sin mensaje
+        items = sorted(memories.items(), key=lambda item: not item[0].startswith("USER_"))
+        pinned = [item for item in items if self._is_pinned(*item)][:MEMORY_PINNED_MAX]
+        pinned_labels = {label for label, _ in pinned}
+        rest = [item for item in items if item[0] not in pinned_labels]
+
+        ranked = None
+        if query and query.strip() and rest:
+            try:
+                ranked = await self._rank(rest, query.strip())
+            except Exception as e:
+                self._count(errors=1)
+                logger.warning(f"⚠️ No se pudieron rankear las memorias, se usan las del usuario primero: {e}")
+        self._count(**({"ranked": 1} if ranked is not None else {"unranked": 1}))
+        candidates = ranked if ranked is not None else rest
+
+        selected, used = {}, 0
+        for label, memory in pinned:
+            if used + tokens[label] <= self._budget:
+                selected[label] = memory.value
+                used += tokens[label]
+        chosen = 0
+        for label, memory in candidates:
+            if chosen >= self._top_k:
+                break
+            # Una memoria larga que no entra no corta la lista: se prueba la siguiente
+            if used + tokens[label] <= self._budget:
+                selected[label] = memory.value
+                used += tokens[label]
+                chosen += 1
+
+        self._count(memories_injected=len(selected), tokens_injected=used)
+        logger.debug(
+            f"🧠 Memorias: {len(selected)}/{len(memories)} inyectadas, "
+            f"{used}/{available} tokens ({available - used} evitados)"
+        )
+        return selected
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            lazy = len(self._lazy)
+        selections = stats["selections"]
+        avoided = stats["tokens_available"] - stats["tokens_injected"]
+        return {
+            "token_budget": self._budget,
+            "top_k": self._top_k,
+            "min_similarity": self._min_similarity,
+            "pinned_keys": sorted(self._pinned_keys),
+            "tokens_avoided": avoided,
+            "avg_tokens_injected": round(stats["tokens_injected"] / selections, 1) if selections else None,
+            "avg_tokens_avoided": round(avoided / selections, 1) if selections else None,
+            "lazy_cached": lazy,
+            **stats,
+        }
+
+
+_selector: MemorySelector | None = None
+
+
+def get_memory_selector() -> MemorySelector:
+    """Selector del proceso (compartido por todas las sesiones)."""
+    global _selector
+    if _selector is None:
+        _selector = MemorySelector()
+    return _selector
+
+
+register_route("/memory/selection", lambda query: (200, get_memory_selector().report()))
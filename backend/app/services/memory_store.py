@@ -0,0 +1,386 @@
+"""
+Memoria persistente (shared_memory y user_memory) con caché write-through.
+
+`get_all_memories` se llama en cada turno del chat y al empezar cada sesión de
+voz, y antes releía toda `shared_memory` más las filas del usuario cada vez.
+`MemoryStore` guarda en memoria un "scope" por usuario más el global:
+
+  - Dentro de MEMORY_CACHE_TTL segundos se responde sin ir a la base.
+  - Pasado el TTL se valida con una sola consulta chica a `memory_versions`
+    (migrations/0006, la mantienen triggers en las dos tablas): si la versión
+    del scope no cambió, se sigue usando lo cacheado; solo se relee el scope
+    que cambió (por ejemplo, un dato guardado desde el otro proceso).
+  - Las escrituras pasan por acá y actualizan la caché en el momento, así que
+    el propio proceso ve sus datos enseguida.
+  - Cada escritura sube una generación local del scope; una lectura que
+    empezó antes no pisa la caché con datos viejos.
+
+`save` es un único upsert sobre (user_id, key) (índice único de la misma
+migración). Sin la migración aplicada cae al select + update/insert anterior
+y a una caché solo con TTL.
+
+Cada dato se guarda con su embedding, calculado una sola vez al escribirlo
+(migrations/0007), y con la marca `pinned`. Los usa memory_selection.py para
+inyectar solo las memorias relevantes al mensaje. Sin esas columnas se guarda
+y se lee solo key y value.
+
+Los contadores (/memory/cache) muestran la tasa de aciertos y las consultas
+ahorradas.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.ops_server import register_route
+from app.core.supabase_pool import SupabasePool, get_supabase_pool
+from app.services.embedding_profile import EMBEDDING_MODEL, parse_vector
+
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", 30))
+# Usuarios con memoria en caché (se descartan los menos usados)
+MEMORY_CACHE_MAX_USERS = int(os.getenv("MEMORY_CACHE_MAX_USERS", 1000))
+
+GLOBAL_SCOPE = "global"
+# Postgres: no hay índice único para el ON CONFLICT
+NO_UNIQUE_INDEX = "42P10"
+# PostgREST: la tabla no existe (según la versión de PostgREST)
+MISSING_TABLE = {"PGRST205", "42P01"}
+# La columna no existe (PostgREST al escribir, Postgres al leer)
+MISSING_COLUMN = {"PGRST204", "42703"}
+
+
+def memory_text(key: str, value: str) -> str:
+    """Texto que se embebe por cada dato ("nombre_mascota" -> "nombre mascota: Toby")."""
+    return f"{key.replace('_', ' ')}: {value}"
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embeddings de varios textos en una sola llamada (con las dimensiones del perfil activo)."""
+    # Import tardío: rag crea el cliente de OpenAI al importarse
+    from app.services.rag import EMBEDDING_PROFILE, OPENAI_CLIENT
+
+    response = OPENAI_CLIENT.embeddings.create(model=EMBEDDING_MODEL, input=texts, **EMBEDDING_PROFILE.embedding_kwargs())
+    return [item.embedding for item in response.data]
+
+
+@dataclass(frozen=True)
+class Memory:
+    value: str
+    embedding: Optional[Tuple[float, ...]] = None
+    pinned: bool = False
+
+
+@dataclass
+class _Scope:
+    values: Dict[str, Memory]
+    checked_at: float  # time.monotonic() de la última carga o validación
+    version: Optional[int]  # versión de memory_versions al cargar (None = desconocida)
+
+
+class MemoryStore:
+    """Memorias global y por usuario con caché TTL, validación por versión y escrituras write-through."""
+
+    def __init__(self, pool: SupabasePool | None = None, ttl: float = MEMORY_CACHE_TTL, max_users: int = MEMORY_CACHE_MAX_USERS):
+        self.pool = pool or get_supabase_pool()
+        self._ttl = ttl
+        self._max_users = max_users
+        self._scopes: "OrderedDict[str, _Scope]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Se descubren con el primer error y no se vuelven a intentar
+        self._versions_available = True
+        self._upsert_available = True
+        self._embeddings_available = True
+        self.stats = {
+            "lookups": 0, "hits": 0, "revalidated": 0, "reloads": 0, "misses": 0,
+            "version_checks": 0, "db_reads": 0, "writes": 0, "user_upserts": 0,
+            "embedded_on_write": 0, "embedding_errors": 0,
+        }
+
+    # --- caché ---
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def _generation(self, scope: str) -> int:
+        with self._lock:
+            return self._generations.get(scope, 0)
+
+    def _cached(self, scope: str) -> Optional[_Scope]:
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is not None:
+                self._scopes.move_to_end(scope)
+            return entry
+
+    def _store(self, scope: str, entry: _Scope, generation: int):
+        with self._lock:
+            # Hubo una escritura mientras leíamos: lo leído puede ser viejo
+            if self._generations.get(scope, 0) != generation:
+                return
+            self._scopes[scope] = entry
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self._max_users + 1:
+                oldest = next(s for s in self._scopes if s != GLOBAL_SCOPE)
+                del self._scopes[oldest]
+
+    def _write_through(self, scope: str, key: str, value: Optional[str], embedding: Optional[List[float]] = None):
+        """Aplica una escritura propia a la caché (value None = borrado)."""
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            entry = self._scopes.get(scope)
+            if entry is None:
+                return
+            values = dict(entry.values)
+            if value is None:
+                values.pop(key, None)
+            else:
+                # El guardado no toca `pinned`: se conserva el que tenía
+                previous = values.get(key, Memory(value))
+                values[key] = replace(previous, value=value, embedding=tuple(embedding) if embedding else None)
+            # La versión de la base subió con esta escritura: la próxima validación relee una vez
+            self._scopes[scope] = _Scope(values=values, checked_at=entry.checked_at, version=entry.version)
+
+    def invalidate(self, user_id: str | None = None):
+        """Descarta la caché de un usuario (o la global)."""
+        scope = user_id or GLOBAL_SCOPE
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            self._scopes.pop(scope, None)
+
+    # --- lectura ---
+
+    async def _versions(self, scopes: List[str]) -> Optional[Dict[str, int]]:
+        """{scope: versión} (0 si nunca se escribió), o None sin la tabla de versiones."""
+        if not self._versions_available:
+            return None
+        self._count("version_checks")
+        try:
+            response = await self.pool.execute(
+                lambda c: c.table("memory_versions").select("scope, version").in_("scope", scopes),
+                idempotent=True,
+                label="memory_versions",
+            )
+        except Exception as e:
+            if getattr(e, "code", None) in MISSING_TABLE:
+                self._versions_available = False
+                logger.warning("⚠️ Falta memory_versions (migrations/0006): la caché de memoria solo usa el TTL")
+                return None
+            raise
+        versions = {row["scope"]: row["version"] for row in response.data or []}
+        return {scope: versions.get(scope, 0) for scope in scopes}
+
+    async def _select(self, scope: str, columns: str):
+        if scope == GLOBAL_SCOPE:
+            query = lambda c: c.table("shared_memory").select(columns)
+        else:
+            query = lambda c: c.table("user_memory").select(columns).eq("user_id", scope)
+        return await self.pool.execute(query, idempotent=True, label="memories")
+
+    def _missing_embedding_columns(self, error: Exception) -> bool:
+        if getattr(error, "code", None) not in MISSING_COLUMN:
+            return False
+        self._embeddings_available = False
+        logger.warning("⚠️ Las tablas de memoria no tienen embedding/pinned (migrations/0007): los embeddings se calculan al seleccionar y no se guardan")
+        return True
+
+    async def _load(self, scope: str, version: Optional[int]) -> Dict[str, Memory]:
+        generation = self._generation(scope)
+        self._count("db_reads")
+        response = None
+        if self._embeddings_available:
+            try:
+                response = await self._select(scope, "key, value, embedding, pinned")
+            except Exception as e:
+                if not self._missing_embedding_columns(e):
+                    raise
+        if response is None:
+            response = await self._select(scope, "key, value")
+        values = {
+            row["key"]: Memory(
+                value=row["value"],
+                embedding=tuple(parse_vector(row["embedding"])) if row.get("embedding") else None,
+                pinned=bool(row.get("pinned")),
+            )
+            for row in response.data or []
+        }
+        self._store(scope, _Scope(values=values, checked_at=time.monotonic(), version=version), generation)
+        return values
+
+    async def _get_scopes(self, scopes: List[str]) -> Dict[str, Dict[str, Memory]]:
+        now = time.monotonic()
+        result, stale, missing = {}, {}, []
+        for scope in scopes:
+            self._count("lookups")
+            entry = self._cached(scope)
+            if entry is None:
+                missing.append(scope)
+            elif now - entry.checked_at < self._ttl:
+                self._count("hits")
+                result[scope] = entry.values
+            else:
+                stale[scope] = entry
+
+        # Una consulta de versiones para todo lo que hay que cargar o validar
+        versions = await self._versions([*missing, *stale]) if missing or stale else None
+        reload = list(missing)
+        self._count("misses", len(missing))
+        for scope, entry in stale.items():
+            current = versions.get(scope) if versions is not None else None
+            if current is not None and current == entry.version:
+                self._count("revalidated")
+                with self._lock:
+                    entry.checked_at = time.monotonic()
+                result[scope] = entry.values
+            else:
+                self._count("reloads")
+                reload.append(scope)
+
+        loaded = await asyncio.gather(*(self._load(s, versions.get(s) if versions else None) for s in reload))
+        result.update(zip(reload, loaded))
+        return result
+
+    async def get_items(self, user_id: str | None = None) -> Dict[str, Memory]:
+        """Memorias globales y del usuario (con embedding y pinned) con los prefijos GLOBAL_ y USER_."""
+        scopes = [GLOBAL_SCOPE, user_id] if user_id else [GLOBAL_SCOPE]
+        values = await self._get_scopes(scopes)
+        memories = {f"GLOBAL_{k}": m for k, m in values[GLOBAL_SCOPE].items()}
+        if user_id:
+            memories.update({f"USER_{k}": m for k, m in values[user_id].items()})
+        return memories
+
+    async def get_all(self, user_id: str | None = None) -> Dict[str, str]:
+        """Memorias globales y del usuario con los prefijos GLOBAL_ y USER_."""
+        return {label: memory.value for label, memory in (await self.get_items(user_id)).items()}
+
+    # --- escritura ---
+
+    async def _embed(self, key: str, value: str) -> Optional[List[float]]:
+        """Embedding del dato, calculado una vez al guardarlo. Si falla se guarda sin él."""
+        if not self._embeddings_available:
+            return None
+        try:
+            embedding = (await asyncio.to_thread(embed_texts, [memory_text(key, value)]))[0]
+        except Exception as e:
+            self._count("embedding_errors")
+            logger.warning(f"⚠️ No se pudo calcular el embedding de la memoria '{key}': {e}")
+            return None
+        self._count("embedded_on_write")
+        return embedding
+
+    async def _write(self, data: dict, write):
+        """Ejecuta `write(data)`; si falta la columna embedding, la quita y reintenta."""
+        try:
+            return await write(data)
+        except Exception as e:
+            if "embedding" not in data or not self._missing_embedding_columns(e):
+                raise
+        return await write({k: v for k, v in data.items() if k != "embedding"})
+
+    async def _save_user(self, key: str, value: str, user_id: str, embedding: Optional[List[float]]):
+        data = {"user_id": user_id, "key": key, "value": value}
+        if embedding is not None:
+            data["embedding"] = embedding
+        if self._upsert_available:
+            try:
+                # Un solo round trip; repetirlo deja el mismo resultado
+                await self._write(data, lambda row: self.pool.execute(
+                    lambda c: c.table("user_memory").upsert(row, on_conflict="user_id,key"),
+                    idempotent=True,
+                    label="user_memory",
+                ))
+                self._count("user_upserts")
+                return
+            except Exception as e:
+                if getattr(e, "code", None) != NO_UNIQUE_INDEX:
+                    raise
+                self._upsert_available = False
+                logger.warning("⚠️ user_memory no tiene el índice único (user_id, key) (migrations/0006): se usa select + update/insert")
+
+        existing = await self.pool.execute(
+            lambda c: c.table("user_memory").select("id").eq("user_id", user_id).eq("key", key),
+            idempotent=True,
+            label="user_memory",
+        )
+        if existing.data:
+            memory_id = existing.data[0]['id']
+            changes = {k: v for k, v in data.items() if k in ("value", "embedding")}
+            await self._write(changes, lambda row: self.pool.execute(
+                lambda c: c.table("user_memory").update(row).eq("id", memory_id), label="user_memory"
+            ))
+        else:
+            await self._write(data, lambda row: self.pool.execute(lambda c: c.table("user_memory").insert(row), label="user_memory"))
+
+    async def save(self, key: str, value: str, user_id: str | None = None):
+        """Guarda un dato (del usuario, o global si user_id es None) con su embedding. Las excepciones se propagan."""
+        self._count("writes")
+        embedding = await self._embed(key, value)
+        if user_id:
+            await self._save_user(key, value, user_id, embedding)
+        else:
+            data = {"key": key, "value": value}
+            if embedding is not None:
+                data["embedding"] = embedding
+            await self._write(data, lambda row: self.pool.execute(
+                lambda c: c.table("shared_memory").upsert(row, on_conflict="key"), idempotent=True, label="shared_memory"
+            ))
+        self._write_through(user_id or GLOBAL_SCOPE, key, value, embedding if self._embeddings_available else None)
+
+    async def delete(self, key: str, user_id: str | None = None) -> bool:
+        """Borra un dato. Con user_id prueba primero en el usuario y después en el global."""
+        self._count("writes")
+        if user_id:
+            response = await self.pool.execute(
+                lambda c: c.table("user_memory").delete().eq("user_id", user_id).eq("key", key),
+                idempotent=True,
+                label="user_memory",
+            )
+            if response.data:
+                self._write_through(user_id, key, None)
+                logger.info(f"🗑️ Memoria USUARIO borrada: {key}")
+                return True
+
+        response = await self.pool.execute(lambda c: c.table("shared_memory").delete().eq("key", key), idempotent=True, label="shared_memory")
+        if response.data:
+            self._write_through(GLOBAL_SCOPE, key, None)
+            logger.info(f"🗑️ Memoria GLOBAL borrada: {key}")
+            return True
+        return False
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            cached = len(self._scopes)
+        served = stats["hits"] + stats["revalidated"]
+        # Sin caché cada lookup es una lectura completa; con upsert, cada guardado de usuario ahorra el select previo
+        reads_saved = stats["lookups"] - stats["db_reads"] - stats["version_checks"]
+        return {
+            "ttl_s": self._ttl,
+            "scopes_cached": cached,
+            "version_checks_enabled": self._versions_available,
+            "single_upsert": self._upsert_available,
+            "embeddings_enabled": self._embeddings_available,
+            "hit_rate": round(served / stats["lookups"], 3) if stats["lookups"] else None,
+            "db_calls_saved": reads_saved + stats["user_upserts"],
+            **stats,
+        }
+
+
+_store: MemoryStore | None = None
+
+
+def get_memory_store() -> MemoryStore:
+    """Memoria del proceso (compartida por todas las sesiones)."""
+    global _store
+    if _store is None:
+        _store = MemoryStore()
+    return _store
+
+
+register_route("/memory/cache", lambda query: (200, get_memory_store().report()))
@@ -0,0 +1,163 @@
+"""
+Aplicador de migraciones SQL versionadas (backend/migrations/*.sql).
+
+Cada archivo `NNNN_nombre.sql` se aplica una sola vez, en orden, dentro de
+una transacción, y queda registrado en la tabla `schema_migrations` con el
+checksum de su contenido. Si un archivo ya aplicado cambió, se avisa en vez
+de re-aplicarlo: los cambios van en una migración nueva.
+
+Se conecta directo a Postgres (DATABASE_URL, la "connection string" de
+Supabase), no por PostgREST, así que necesita psycopg:
+    uv sync --extra migrations
+
+Uso:
+    uv run python -m app.services.migrations             # aplicar pendientes
+    uv run python -m app.services.migrations --status    # ver estado
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+MIGRATION_FILE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    path: Path
+
+    @property
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+
+def _connect(database_url: str | None):
+    try:
+        import psycopg
+    except ImportError:
+        raise RuntimeError(
+            "Las migraciones necesitan psycopg: uv sync --extra migrations"
+        ) from None
+
+    database_url = database_url or os.getenv("DATABASE_URL")
+    if not database_url:
+        raise RuntimeError("Falta DATABASE_URL (connection string de Postgres/Supabase)")
+    return psycopg.connect(database_url, autocommit=True)
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Migraciones del directorio ordenadas por versión."""
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = MIGRATION_FILE.match(path.name)
+        if not match:
+            logger.warning(f"⚠️ Ignorando {path.name}: el nombre debe ser NNNN_nombre.sql")
+            continue
+        migrations.append(Migration(version=match.group(1), name=match.group(2), path=path))
+    return migrations
+
+
+def _ensure_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version TEXT PRIMARY KEY,
+          name TEXT NOT NULL,
+          checksum TEXT NOT NULL,
+          applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def _applied(conn) -> dict:
+    rows = conn.execute("SELECT version, checksum FROM schema_migrations").fetchall()
+    return {version: checksum for version, checksum in rows}
+
+
+def status(database_url: str | None = None, directory: Path = MIGRATIONS_DIR) -> List[dict]:
+    """Estado de cada migración: applied, pending o changed."""
+    with _connect(database_url) as conn:
+        _ensure_table(conn)
+        applied = _applied(conn)
+
+    result = []
+    for migration in load_migrations(directory):
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            state = "pending"
+        elif checksum != migration.checksum:
+            state = "changed"
+        else:
+            state = "applied"
+        result.append({"version": migration.version, "name": migration.name, "state": state})
+    return result
+
+
+def apply(database_url: str | None = None, directory: Path = MIGRATIONS_DIR) -> List[str]:
+    """
+    Aplica las migraciones pendientes en orden.
+
+    Returns:
+        Versiones aplicadas en esta corrida.
+    """
+    applied_now = []
+    with _connect(database_url) as conn:
+        _ensure_table(conn)
+        applied = _applied(conn)
+
+        for migration in load_migrations(directory):
+            checksum = applied.get(migration.version)
+            if checksum is not None:
+                if checksum != migration.checksum:
+                    logger.warning(
+                        f"⚠️ {migration.path.name} cambió después de aplicarse; "
+                        "crea una migración nueva en vez de editarla"
+                    )
+                continue
+
+            logger.info(f"🗄️ Aplicando {migration.path.name}...")
+            with conn.transaction():
+                conn.execute(migration.sql)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                    (migration.version, migration.name, migration.checksum),
+                )
+            applied_now.append(migration.version)
+
+    logger.info(f"✅ {len(applied_now)} migraciones aplicadas")
+    return applied_now
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones SQL del backend")
+    parser.add_argument("--database-url", help="Por defecto DATABASE_URL")
+    parser.add_argument("--dir", default=str(MIGRATIONS_DIR), help="Directorio de migraciones")
+    parser.add_argument("--status", action="store_true", help="Mostrar estado sin aplicar nada")
+    args = parser.parse_args()
+
+    try:
+        if args.status:
+            for item in status(args.database_url, Path(args.dir)):
+                print(f"{item['version']}  {item['state']:<8} {item['name']}")
+        else:
+            apply(args.database_url, Path(args.dir))
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -1,26 +1,55 @@
 """
 Servicio RAG para búsqueda semántica en la base de conocimiento.
+
+El bot y la API usan `aget_relevant_context`, que consulta por el pool
+asíncrono de Supabase; las funciones síncronas quedan para scripts y
+benchmarks.
+
+Si EMBEDDING_PROFILE pide un perfil reducido y la base todavía no tiene su
+columna o su RPC (migrations/0004 sin aplicar), la primera búsqueda avisa y el
+proceso vuelve al perfil completo.
 """
 
+import asyncio
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from functools import lru_cache
 from dotenv import load_dotenv
+from loguru import logger
 from openai import OpenAI
 #from supabase import create_client, Client
 from app.core.supabase_client import get_supabase
+from app.core.supabase_pool import get_supabase_pool
+from app.core.tracing import span
+from app.services.embedding_profile import EMBEDDING_MODEL, get_profile
 
 load_dotenv()
 
 # Configuración
 OPENAI_CLIENT = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+EMBEDDING_PROFILE = get_profile()
+DEFAULT_PROFILE = get_profile("full")
+# Errores de una base sin el esquema del perfil: RPC inexistente (PostgREST y
+# Postgres) o columna inexistente
+MISSING_PROFILE_SCHEMA = {"PGRST202", "42883", "42703"}
+
+# Parámetros de búsqueda usados por get_relevant_context.
+# BAJAMOS EL UMBRAL A 0.3 PARA MAYOR RECALL (antes 0.78 / 3 resultados).
+# Medir cualquier cambio con: uv run python -m benchmarks.rag.run
+MATCH_THRESHOLD = float(os.getenv("RAG_MATCH_THRESHOLD", 0.3))
+MATCH_COUNT = int(os.getenv("RAG_MATCH_COUNT", 6))
+
+# hnsw.ef_search por consulta (migrations/0003). Sin definir, usa el de la base.
+EF_SEARCH = int(os.getenv("RAG_EF_SEARCH")) if os.getenv("RAG_EF_SEARCH") else None
 
 def generate_query_embedding(query: str) -> List[float]:
-    """Genera embedding para la consulta del usuario"""
-    response = OPENAI_CLIENT.embeddings.create(
-        model="text-embedding-3-small",
-        input=query
-    )
+    """Genera embedding para la consulta del usuario (con las dimensiones del perfil activo)"""
+    with span("openai.embeddings", kind="client", **{"llm.model": EMBEDDING_MODEL, "embedding.profile": EMBEDDING_PROFILE.name}):
+        response = OPENAI_CLIENT.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=query,
+            **EMBEDDING_PROFILE.embedding_kwargs()
+        )
     return response.data[0].embedding
 
 @lru_cache(maxsize=100)
@@ -32,10 +61,26 @@ def generate_query_embedding_cached(query: str) -> tuple:
     embedding = generate_query_embedding(query)
     return tuple(embedding)
 
+def _fall_back_to_default_profile(error: Exception) -> bool:
+    """Pasa al perfil completo si `error` es por falta del esquema del perfil reducido."""
+    global EMBEDDING_PROFILE
+    if EMBEDDING_PROFILE.is_full or getattr(error, "code", None) not in MISSING_PROFILE_SCHEMA:
+        return False
+    logger.warning(
+        f"⚠️ La base no tiene {EMBEDDING_PROFILE.rpc}/{EMBEDDING_PROFILE.column} (falta migrations/0004); "
+        f"se usa el perfil de embedding completo en vez de '{EMBEDDING_PROFILE.name}'"
+    )
+    EMBEDDING_PROFILE = DEFAULT_PROFILE
+    # Los embeddings en caché tienen las dimensiones del perfil anterior
+    generate_query_embedding_cached.cache_clear()
+    return True
+
 def search_knowledge_base(
     query: str, 
     match_threshold: float = 0.78,
-    match_count: int = 3
+    match_count: int = 3,
+    documents: Optional[List[str]] = None,
+    metadata: Optional[Dict] = None
 ) -> List[Dict]:
     """
     Busca en la base de conocimiento usando similitud semántica.
@@ -44,25 +89,73 @@ def search_knowledge_base(
         query: Pregunta del usuario
         match_threshold: Umbral mínimo de similitud (0-1)
         match_count: Número máximo de resultados
+        documents: Limitar la búsqueda a estos document_name
+        metadata: Limitar a chunks cuya metadata contenga este dict
     
     Returns:
         Lista de chunks relevantes con metadata
     """
-    supabase = get_supabase()
     query_embedding = list(generate_query_embedding_cached(query))
+    try:
+        return match_documents(query_embedding, match_threshold, match_count, documents, metadata)
+    except Exception as e:
+        if not _fall_back_to_default_profile(e):
+            raise
+    query_embedding = list(generate_query_embedding_cached(query))
+    return match_documents(query_embedding, match_threshold, match_count, documents, metadata)
+
+def match_documents(
+    query_embedding: List[float],
+    match_threshold: float,
+    match_count: int,
+    documents: Optional[List[str]] = None,
+    metadata: Optional[Dict] = None
+) -> List[Dict]:
+    """Llama a la función match_documents (del perfil activo) en Supabase."""
+    params = _match_params(query_embedding, match_threshold, match_count, documents, metadata)
+    supabase = get_supabase()
+    response = supabase.rpc(EMBEDDING_PROFILE.rpc, params).execute()
     
-    # Buscar en Supabase usando la función match_documents
-    response = supabase.rpc(
-        'match_documents',
-        {
-            'query_embedding': query_embedding,
-            'match_threshold': match_threshold,
-            'match_count': match_count
-        }
-    ).execute()
-    
     return response.data
 
+async def amatch_documents(
+    query_embedding: List[float],
+    match_threshold: float,
+    match_count: int,
+    documents: Optional[List[str]] = None,
+    metadata: Optional[Dict] = None
+) -> List[Dict]:
+    """match_documents por el pool asíncrono (sin bloquear el event loop; se reintenta si falla la red)."""
+    params = _match_params(query_embedding, match_threshold, match_count, documents, metadata)
+    response = await get_supabase_pool().execute(
+        lambda c: c.rpc(EMBEDDING_PROFILE.rpc, params),
+        idempotent=True,
+        label=EMBEDDING_PROFILE.rpc,
+    )
+    return response.data
+
+def _match_params(
+    query_embedding: List[float],
+    match_threshold: float,
+    match_count: int,
+    documents: Optional[List[str]] = None,
+    metadata: Optional[Dict] = None
+) -> Dict:
+    params = {
+        'query_embedding': query_embedding,
+        'match_threshold': match_threshold,
+        'match_count': match_count
+    }
+    # Los parámetros opcionales solo se mandan si se usan, así la llamada
+    # sigue funcionando contra una base sin la migración 0003 aplicada
+    if documents:
+        params['filter_documents'] = documents
+    if metadata:
+        params['filter_metadata'] = metadata
+    if EF_SEARCH:
+        params['ef_search'] = EF_SEARCH
+    return params
+
 def format_context_for_llm(search_results: List[Dict]) -> str:
     """
     Formatea los resultados de búsqueda para el LLM.
@@ -94,13 +187,30 @@ def get_relevant_context(query: str) -> str:
     Función principal para obtener contexto relevante.
     """
     # Buscar documentos relevantes
-    # BAJAMOS EL UMBRAL A 0.3 PARA MAYOR RECALL
-    results = search_knowledge_base(query, match_threshold=0.3, match_count=6)
+    results = search_knowledge_base(query, match_threshold=MATCH_THRESHOLD, match_count=MATCH_COUNT)
     
     # Formatear para el LLM
     context = format_context_for_llm(results)
     
     return context
+
+async def aget_relevant_context(query: str) -> str:
+    """Versión asíncrona de get_relevant_context (la que usan el bot y la API)."""
+    with span("rag.retrieve", **{"rag.query_chars": len(query), "rag.match_count": MATCH_COUNT}) as rag_span:
+        # El embedding sale de la caché o de OpenAI (cliente síncrono): en un hilo
+        # (sin span de openai.embeddings si vino de la caché)
+        query_embedding = list(await asyncio.to_thread(generate_query_embedding_cached, query))
+        try:
+            results = await amatch_documents(query_embedding, MATCH_THRESHOLD, MATCH_COUNT)
+        except Exception as e:
+            if not _fall_back_to_default_profile(e):
+                raise
+            query_embedding = list(await asyncio.to_thread(generate_query_embedding_cached, query))
+            results = await amatch_documents(query_embedding, MATCH_THRESHOLD, MATCH_COUNT)
+        rag_span.set_attribute("embedding.profile", EMBEDDING_PROFILE.name)
+        rag_span.set_attribute("rag.results", len(results or []))
+        return format_context_for_llm(results)
+
 # Función de prueba
 if __name__ == "__main__":
     # Prueba el servicio RAG
@@ -0,0 +1,292 @@
+"""
+Catálogo local de subcategorías de Tu Guía con búsqueda difusa.
+
+Los nombres llegan hablados (Deepgram): "plomeros", "electricistas",
+"albañil" sin tilde... Un `ilike('%nombre%')` remoto no encuentra los
+plurales ni las variantes y toma la primera fila que coincida.
+`SubcategoryCatalog` guarda `subcategories` en memoria y resuelve el nombre
+localmente, en microsegundos y sin red:
+
+  - Cada nombre se normaliza (minúsculas, sin tildes ni signos) y cada
+    palabra se reduce a una raíz simple (plural y género: "plomeros",
+    "plomera" y "plomero" -> "plomer").
+  - Un índice invertido de trigramas de esas raíces da los candidatos; se
+    ordenan por similitud de Jaccard (como pg_trgm), tomando la mejor entre
+    el nombre completo y palabra por palabra.
+
+El catálogo se recarga cada SUBCATEGORY_CATALOG_TTL segundos en segundo
+plano; mientras tanto se sigue usando el anterior.
+"""
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Set
+
+from loguru import logger
+
+from app.core.ops_server import register_route
+from app.core.supabase_client import get_tuguia_supabase
+
+SUBCATEGORY_CATALOG_TTL = float(os.getenv("SUBCATEGORY_CATALOG_TTL", 600))
+# Similitud mínima (0-1) para dar un nombre por encontrado
+SUBCATEGORY_MATCH_THRESHOLD = float(os.getenv("SUBCATEGORY_MATCH_THRESHOLD", 0.45))
+PAGE_SIZE = 1000
+# Tras un fallo de carga, no reintentar en cada consulta
+RETRY_AFTER_S = 30
+# Candidatos que se puntúan en detalle por búsqueda
+SHORTLIST = 24
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Palabras que no aportan al nombre de un oficio
+STOPWORDS = {"de", "del", "la", "las", "el", "los", "y", "e", "en", "para", "por", "a", "con"}
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes ("Albañil" -> "albanil")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Raíz aproximada en español: quita plural y vocal final de género."""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ces"):
+        word = word[:-3] + "z"  # luces -> luz
+    elif word.endswith("es") and len(word) > 4 and word[-3] not in "aeiou":
+        word = word[:-2]  # pintores -> pintor, albaniles -> albanil
+    elif word.endswith("s"):
+        word = word[:-1]  # plomeros -> plomero
+    if len(word) > 4 and word[-1] in "aoe":
+        word = word[:-1]  # plomero / plomera -> plomer
+    return word
+
+
+def stems(text: str) -> List[str]:
+    return [stem(w) for w in _WORD.findall(fold(text)) if w not in STOPWORDS]
+
+
+def trigrams(word: str) -> FrozenSet[str]:
+    """Trigramas al estilo pg_trgm (dos espacios al principio, uno al final)."""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+@dataclass(frozen=True)
+class SubcategoryMatch:
+    id: object
+    name: str
+    score: float
+
+
+@dataclass
+class _Entry:
+    id: object
+    name: str
+    key: str  # raíces unidas, para coincidencia exacta
+    grams: FrozenSet[str]
+    word_grams: List[FrozenSet[str]]
+
+
+class SubcategoryIndex:
+    """Índice inmutable de un catálogo; se reemplaza entero al recargar."""
+
+    def __init__(self, rows: List[dict]):
+        self.entries: List[_Entry] = []
+        self._postings: Dict[str, Set[int]] = {}
+        for row in rows:
+            words = stems(row["name"] or "")
+            if not words:
+                continue
+            entry = _Entry(
+                id=row["id"],
+                name=row["name"],
+                key=" ".join(words),
+                grams=trigrams(" ".join(words)),
+                word_grams=[trigrams(w) for w in words],
+            )
+            position = len(self.entries)
+            self.entries.append(entry)
+            for gram in entry.grams:
+                # "  p" lo comparten todas las palabras con esa inicial: no sirve para preseleccionar
+                if not gram.startswith("  "):
+                    self._postings.setdefault(gram, set()).add(position)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, query: str, limit: int = 5) -> List[SubcategoryMatch]:
+        """Candidatos ordenados por similitud (el primero es el mejor)."""
+        words = stems(query)
+        if not words:
+            return []
+        key = " ".join(words)
+        grams = trigrams(key)
+        word_grams = [trigrams(w) for w in words]
+
+        # Preselección por trigramas compartidos; solo esos se puntúan en detalle
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        candidates = heapq.nlargest(SHORTLIST, shared, key=shared.__getitem__)
+
+        matches = []
+        for position in candidates:
+            entry = self.entries[position]
+            if entry.key == key:
+                score = 1.0
+            else:
+                # Palabra por palabra: "gasista" contra "Gasista matriculado"
+                per_word = sum(max(jaccard(q, e) for e in entry.word_grams) for q in word_grams) / len(word_grams)
+                extra_words = max(len(entry.word_grams) - len(word_grams), 0)
+                score = max(jaccard(grams, entry.grams), per_word * (0.9 ** extra_words))
+            matches.append(SubcategoryMatch(id=entry.id, name=entry.name, score=round(score, 3)))
+        matches.sort(key=lambda m: (-m.score, len(m.name)))
+        return matches[:limit]
+
+
+class SubcategoryCatalog:
+    """Subcategorías de Tu Guía en memoria, recargadas periódicamente."""
+
+    def __init__(self, ttl: float = SUBCATEGORY_CATALOG_TTL, threshold: float = SUBCATEGORY_MATCH_THRESHOLD, client=None):
+        self._ttl = ttl
+        self._threshold = threshold
+        self._client = client
+        self._index: Optional[SubcategoryIndex] = None
+        self._loaded_at = 0.0
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self.stats = {"refreshes": 0, "errors": 0, "lookups": 0, "misses": 0, "lookup_us_total": 0.0, "load_s": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_tuguia_supabase()
+        return self._client
+
+    def _fetch(self) -> List[dict]:
+        rows, start = [], 0
+        while True:
+            page = self.client.table("subcategories").select("id", "name").range(start, start + PAGE_SIZE - 1).execute().data
+            rows.extend(page or [])
+            if not page or len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def refresh(self) -> Optional[SubcategoryIndex]:
+        """Recarga el catálogo ahora. Si falla se conserva el anterior."""
+        with self._refresh_lock:
+            if self._index is not None and time.monotonic() - self._loaded_at < self._ttl:
+                return self._index
+            start = time.perf_counter()
+            try:
+                index = SubcategoryIndex(self._fetch())
+            except Exception as e:
+                with self._lock:
+                    self._failed_at = time.monotonic()
+                    self.stats["errors"] += 1
+                logger.error(f"❌ No se pudo cargar el catálogo de subcategorías: {e}")
+                return self._index
+            load_s = round(time.perf_counter() - start, 3)
+            with self._lock:
+                self._index = index
+                self._loaded_at = time.monotonic()
+                self._failed_at = None
+                self.stats["refreshes"] += 1
+                self.stats["load_s"] = load_s
+            logger.debug(f"📚 Catálogo de subcategorías: {len(index)} entradas en {load_s}s")
+            return index
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="subcategory-catalog", daemon=True).start()
+
+    @property
+    def loaded(self) -> bool:
+        """Hay un índice en memoria (index() no va a esperar la red)."""
+        return self._index is not None
+
+    def index(self) -> Optional[SubcategoryIndex]:
+        """
+        Índice vigente. Solo espera la carga si todavía no hay ninguno; None si
+        no se pudo cargar (quien llama resuelve los nombres en la base).
+        """
+        index = self._index
+        failed_recently = self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_AFTER_S
+        if index is None:
+            return None if failed_recently else self.refresh()
+        if time.monotonic() - self._loaded_at >= self._ttl and not failed_recently:
+            self.refresh_in_background()
+        return index
+
+    def search(self, name: str, limit: int = 5) -> Optional[List[SubcategoryMatch]]:
+        """Candidatos rankeados, o None si el catálogo no está disponible."""
+        index = self.index()
+        if index is None:
+            return None
+        start = time.perf_counter()
+        matches = index.search(name, limit)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["lookup_us_total"] += elapsed_us
+            if not matches or matches[0].score < self._threshold:
+                self.stats["misses"] += 1
+        return matches
+
+    def is_match(self, match: SubcategoryMatch) -> bool:
+        return match.score >= self._threshold
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats.pop("lookups")
+        lookup_us = stats.pop("lookup_us_total")
+        return {
+            "entries": len(self._index) if self._index else None,
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if self._index else None,
+            "ttl_s": self._ttl,
+            "threshold": self._threshold,
+            "lookups": lookups,
+            "avg_lookup_us": round(lookup_us / lookups, 1) if lookups else None,
+            **stats,
+        }
+
+
+_catalog: SubcategoryCatalog | None = None
+
+
+def get_subcategory_catalog() -> SubcategoryCatalog:
+    """Catálogo del proceso (compartido por todas las sesiones)."""
+    global _catalog
+    if _catalog is None:
+        _catalog = SubcategoryCatalog()
+    return _catalog
+
+
+register_route("/tuguia/subcategories", lambda query: (200, get_subcategory_catalog().report()))
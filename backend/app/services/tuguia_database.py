@@ -1,32 +1,57 @@
 #import os
 #from supabase import create_client, Client
 #from dotenv import load_dotenv
-from app.core.supabase_client import get_tuguia_supabase
+import asyncio
+import os
+
+from loguru import logger
+
+from app.core.supabase_pool import SupabasePool, get_tuguia_pool
+from app.services.subcategory_catalog import SubcategoryCatalog, get_subcategory_catalog
+from app.services.tuguia_user_count import MISSING_FUNCTION, get_user_counter
+
+# Consultas simultáneas cuando no está la RPC de conteo por subcategoría
+TUGUIA_SUBCATEGORY_WORKERS = int(os.getenv("TUGUIA_SUBCATEGORY_WORKERS", 5))
+SUBCATEGORY_CATALOG_ENABLED = os.getenv("SUBCATEGORY_CATALOG_ENABLED", "true").lower() == "true"
+SUBCATEGORY_COUNT_RPC = "count_users_by_subcategories"
+SUBCATEGORY_IDS_COUNT_RPC = "count_users_by_subcategory_ids"
+# Candidatos por debajo del umbral que se ofrecen como sugerencia
+SUGGESTION_MIN_SCORE = 0.25
+
+# RPCs que PostgREST dijo que no existen (no se vuelven a intentar)
+_missing_rpcs = set()
+
+
+async def _gather_limited(coroutines, limit: int = TUGUIA_SUBCATEGORY_WORKERS):
+    """asyncio.gather con a lo sumo `limit` corrutinas a la vez (mismo orden)."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
+
 
 class TuGuiaDatabase:
-    """Servicio para interactuar con la base de datos de Tu Guia"""
+    """Servicio para interactuar con la base de datos de Tu Guia (asíncrono, por el pool de Supabase)"""
 
-    def __init__(self):
-        self.client = get_tuguia_supabase()
+    def __init__(self, catalog: SubcategoryCatalog | None = None, pool: SupabasePool | None = None):
+        self.pool = pool or get_tuguia_pool()
+        # Resuelve nombres de subcategoría en memoria (None = siempre por la base)
+        self.catalog = catalog or (get_subcategory_catalog() if SUBCATEGORY_CATALOG_ENABLED else None)
     
-    def count_users(self):
-        """Cuenta usuarios en la base de datos de Tu Guia"""
-        try:
-            # Asumiendo que la tabla se llama 'users' o 'usuarios
-            # Ajusta el nombre segun tu esquema
-            response = self.client.auth.admin.list_users()
-
-            if hasattr(response, 'users'):
-                return len(response.users)
-            elif isinstance(response, list):
-                return len(response)
-            else:
-                return 0
-        except Exception as e:
-            print(f"Error contando usuarios de Tu Guia: {e}")
-            return None
+    async def count_users(self):
+        """
+        Cuenta usuarios en la base de datos de Tu Guia.
+        Sale del snapshot de `UserCounter` (RPC o conteo de todas las páginas),
+        así responde enseguida y cuenta bien a cualquier escala.
+        """
+        # Solo espera una consulta si todavía no hay snapshot; por las dudas, fuera del event loop
+        snapshot = await asyncio.to_thread(get_user_counter().get)
+        return snapshot.value if snapshot is not None else None
     
-    def create_user(self, email: str, password: str, first_name: str, last_name: str, phone: str, account_type: str):
+    async def create_user(self, email: str, password: str, first_name: str, last_name: str, phone: str, account_type: str):
         """
         Crea un usuario en Tu Guía usando Supabase Auth
     
@@ -39,7 +64,7 @@ class TuGuiaDatabase:
             account_type: Tipo de cuenta (ej: "cliente", "proveedor")
         """
         try:
-            response = self.client.auth.admin.create_user({
+            attributes = {
                 "email": email,
                 "password": password,
                 "email_confirm": True,
@@ -48,7 +73,9 @@ class TuGuiaDatabase:
                 "phone": phone,
                 "account_type": account_type
             }
-            })
+            }
+            # Escritura: solo se reintenta si la petición no llegó a salir
+            response = await self.pool.execute(lambda c: c.auth.admin.create_user(attributes), label="auth.create_user")
 
             if hasattr(response, 'user') and response.user:
                 return {
@@ -70,10 +97,15 @@ class TuGuiaDatabase:
                 "error": str(e)
             }
 
-    def count_users_by_subcategory(self, subcategory_names):
+    async def count_users_by_subcategory(self, subcategory_names):
         """
         Cuenta usuarios por subcategorias especificas
 
+        Los nombres se resuelven en el catálogo local (búsqueda difusa, sin
+        red) y a la base solo se le piden los conteos, en una llamada. Sin
+        catálogo se usa la RPC `count_users_by_subcategories`, que resuelve y
+        cuenta a la vez; sin ninguna de las dos RPC, cada consulta va en paralelo.
+
         Args:
             subcategory_names: Lista de nombres de subcategorias o un solo nombre (string)
 
@@ -84,32 +116,19 @@ class TuGuiaDatabase:
             # Convertir a lista si es un solo string
             if isinstance(subcategory_names, str):
                 subcategory_names = [subcategory_names]
-            
+
+            if await self._catalog_index() is not None:
+                return {"success": True, "results": await self._count_with_catalog(subcategory_names)}
+
+            rows = await self._try_rpc(SUBCATEGORY_COUNT_RPC, {"names": list(subcategory_names)})
+            if rows is not None:
+                return {"success": True, "results": self._results_from_rpc(rows)}
+
+            # Mismo orden que los nombres pedidos
+            counted = await _gather_limited([self._count_one_subcategory(name) for name in subcategory_names])
             results = {}
-            
-            for subcategory_name in subcategory_names:
-                # buscar subcategoria por nombre
-                subcategory_response = self.client.table('subcategories').select('id', 'name').ilike('name', f'%{subcategory_name}%').execute()
-
-                if not subcategory_response.data:
-                    results[subcategory_name] = {
-                        "found": False,
-                        "count": 0,
-                        "error": "No encontrada"
-                    }
-                    continue
-
-                # Tomar la primera coincidencia
-                subcat = subcategory_response.data[0]
-
-                # contar perfiles en esa subcategoria
-                count_response = self.client.table('profile_subcategories').select('profile_id', count='exact').eq('subcategory_id', subcat['id']).execute()
-
-                results[subcat['name']] = {
-                    "found": True,
-                    "count": count_response.count or 0
-                }
-            
+            for name, result in counted:
+                results[name] = result
             return {
                     "success": True,
                     "results": results
@@ -121,3 +140,98 @@ class TuGuiaDatabase:
                 "success": False,
                 "error": str(e)
             }
+
+    async def _catalog_index(self):
+        if self.catalog is None:
+            return None
+        if self.catalog.loaded:
+            return self.catalog.index()
+        # La primera carga es una consulta síncrona: fuera del event loop
+        return await asyncio.to_thread(self.catalog.index)
+
+    async def _try_rpc(self, function, params):
+        """Filas de la RPC, o None si no está en la base (se recuerda) o falló."""
+        if function in _missing_rpcs:
+            return None
+        try:
+            response = await self.pool.execute(lambda c: c.rpc(function, params), idempotent=True, label=function)
+            return response.data or []
+        except Exception as e:
+            if getattr(e, "code", None) == MISSING_FUNCTION:
+                _missing_rpcs.add(function)
+                logger.warning(f"⚠️ Falta la función {function} en Tu Guía (migrations/tuguia); se consulta por separado")
+            else:
+                logger.warning(f"⚠️ Falló {function}, se consulta por separado: {e}")
+            return None
+
+    async def _count_with_catalog(self, subcategory_names):
+        # Mismo orden que los nombres pedidos: (nombre pedido, match o None, candidatos)
+        lookups = []
+        for name in subcategory_names:
+            matches = self.catalog.search(name, limit=3) or []
+            match = matches[0] if matches and self.catalog.is_match(matches[0]) else None
+            lookups.append((name, match, matches))
+
+        ids = [match.id for _, match, _ in lookups if match is not None]
+        counts = await self._count_subcategory_ids(ids) if ids else {}
+        results = {}
+        for name, match, matches in lookups:
+            if match is not None:
+                results[match.name] = {"found": True, "count": counts.get(str(match.id), 0)}
+                continue
+            results[name] = {"found": False, "count": 0, "error": "No encontrada"}
+            suggestions = [m.name for m in matches if m.score >= SUGGESTION_MIN_SCORE]
+            if suggestions:
+                results[name]["sugerencias"] = suggestions
+        return results
+
+    async def _count_subcategory_ids(self, ids):
+        """{id como texto: perfiles}, en una llamada o en paralelo si no está la RPC."""
+        ids = list(dict.fromkeys(str(i) for i in ids))
+        rows = await self._try_rpc(SUBCATEGORY_IDS_COUNT_RPC, {"ids": ids})
+        if rows is not None:
+            return {row["subcategory_id"]: row["user_count"] or 0 for row in rows}
+        return dict(zip(ids, await _gather_limited([self._count_profiles(i) for i in ids])))
+
+    async def _count_profiles(self, subcategory_id):
+        response = await self.pool.execute(
+            lambda c: c.table('profile_subcategories').select('profile_id', count='exact', head=True).eq('subcategory_id', subcategory_id),
+            idempotent=True,
+            label="profile_subcategories",
+        )
+        return response.count or 0
+
+    @staticmethod
+    def _results_from_rpc(rows):
+        results = {}
+        for row in rows:
+            if row["subcategory_id"] is None:
+                results[row["requested"]] = {"found": False, "count": 0, "error": "No encontrada"}
+            else:
+                results[row["subcategory_name"]] = {"found": True, "count": row["user_count"] or 0}
+        return results
+
+    async def _count_one_subcategory(self, subcategory_name):
+        """(nombre, resultado) de una subcategoría: un ilike y un count."""
+        # buscar subcategoria por nombre
+        subcategory_response = await self.pool.execute(
+            lambda c: c.table('subcategories').select('id', 'name').ilike('name', f'%{subcategory_name}%'),
+            idempotent=True,
+            label="subcategories",
+        )
+
+        if not subcategory_response.data:
+            return subcategory_name, {
+                "found": False,
+                "count": 0,
+                "error": "No encontrada"
+            }
+
+        # Tomar la primera coincidencia
+        subcat = subcategory_response.data[0]
+
+        # contar perfiles en esa subcategoria
+        return subcat['name'], {
+            "found": True,
+            "count": await self._count_profiles(subcat['id'])
+        }
@@ -0,0 +1,225 @@
+"""
+Conteo de usuarios de Tu Guía.
+
+`auth.admin.list_users()` baja los objetos completos de los usuarios y solo
+la primera página, así que contarlos con `len()` era lento y además
+incorrecto pasado el tamaño de página. `UserCounter` obtiene el total con la
+primera fuente que funcione (TUGUIA_COUNT_SOURCE):
+
+  - rpc:      `tuguia_user_count()` (migrations/tuguia/0001_user_count.sql),
+              un count(*) sobre auth.users hecho en la base
+  - profiles: count-only (HEAD, count=exact) sobre TUGUIA_PROFILES_TABLE
+  - auth:     recorre todas las páginas de la API de administración, varias
+              a la vez (último recurso)
+
+Con `auto` (por defecto) prueba rpc y, si la función no existe, auth.
+
+El resultado queda en un snapshot con TTL corto (TUGUIA_COUNT_TTL). Pasado el
+TTL se sigue respondiendo con el valor anterior mientras se refresca en
+segundo plano; solo si no hay ninguno o es muy viejo (TUGUIA_COUNT_MAX_STALE)
+la consulta espera al refresco.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+
+from app.core.ops_server import register_route
+from app.core.supabase_client import get_tuguia_supabase
+
+TUGUIA_COUNT_SOURCE = os.getenv("TUGUIA_COUNT_SOURCE", "auto")
+TUGUIA_COUNT_TTL = float(os.getenv("TUGUIA_COUNT_TTL", 60))
+TUGUIA_COUNT_MAX_STALE = float(os.getenv("TUGUIA_COUNT_MAX_STALE", 3600))
+TUGUIA_PROFILES_TABLE = os.getenv("TUGUIA_PROFILES_TABLE", "profiles")
+# La API de administración de GoTrue devuelve como máximo 1000 usuarios por página
+TUGUIA_COUNT_PAGE_SIZE = int(os.getenv("TUGUIA_COUNT_PAGE_SIZE", 1000))
+TUGUIA_COUNT_PAGE_WORKERS = int(os.getenv("TUGUIA_COUNT_PAGE_WORKERS", 4))
+
+USER_COUNT_RPC = "tuguia_user_count"
+# PostgREST: la función no existe en el schema cache
+MISSING_FUNCTION = "PGRST202"
+
+
+@dataclass
+class UserCount:
+    value: int
+    source: str
+    taken_at: float  # time.monotonic()
+    taken_at_iso: str
+    query_seconds: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.taken_at
+
+
+class UserCounter:
+    """Total de usuarios de Tu Guía con snapshot y refresco en segundo plano."""
+
+    def __init__(
+        self,
+        source: str = TUGUIA_COUNT_SOURCE,
+        ttl: float = TUGUIA_COUNT_TTL,
+        max_stale: float = TUGUIA_COUNT_MAX_STALE,
+        client=None,
+    ):
+        self._source = source
+        self._ttl = ttl
+        self._max_stale = max_stale
+        self._client = client
+        self._snapshot: Optional[UserCount] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._rpc_missing = False
+        self.stats = {"reads": 0, "reads_stale": 0, "reads_blocking": 0, "refreshes": 0, "errors": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_tuguia_supabase()
+        return self._client
+
+    # --- fuentes ---
+
+    def _count_rpc(self) -> int:
+        return int(self.client.rpc(USER_COUNT_RPC).execute().data)
+
+    def _count_profiles(self) -> int:
+        response = self.client.table(TUGUIA_PROFILES_TABLE).select("id", count="exact", head=True).execute()
+        return response.count or 0
+
+    def _page_size(self, page: int) -> int:
+        return len(self.client.auth.admin.list_users(page=page, per_page=TUGUIA_COUNT_PAGE_SIZE))
+
+    def _count_auth_pages(self) -> int:
+        """Suma todas las páginas de la API de administración, TUGUIA_COUNT_PAGE_WORKERS a la vez."""
+        total = self._page_size(1)
+        if total < TUGUIA_COUNT_PAGE_SIZE:
+            return total
+        page = 2
+        with ThreadPoolExecutor(max_workers=TUGUIA_COUNT_PAGE_WORKERS, thread_name_prefix="tuguia-count") as pool:
+            while True:
+                sizes = list(pool.map(self._page_size, range(page, page + TUGUIA_COUNT_PAGE_WORKERS)))
+                total += sum(sizes)
+                if any(size < TUGUIA_COUNT_PAGE_SIZE for size in sizes):
+                    return total
+                page += TUGUIA_COUNT_PAGE_WORKERS
+
+    def _query(self) -> tuple:
+        """(total, fuente)."""
+        if self._source == "profiles":
+            return self._count_profiles(), "profiles"
+        if self._source == "auth":
+            return self._count_auth_pages(), "auth"
+        if not self._rpc_missing:
+            try:
+                return self._count_rpc(), "rpc"
+            except Exception as e:
+                if self._source == "rpc":
+                    raise
+                if getattr(e, "code", None) == MISSING_FUNCTION:
+                    self._rpc_missing = True
+                    logger.warning(
+                        f"⚠️ Falta la función {USER_COUNT_RPC} en Tu Guía (migrations/tuguia); "
+                        "se cuentan usuarios recorriendo la API de administración"
+                    )
+                else:
+                    logger.warning(f"⚠️ Falló {USER_COUNT_RPC}, se usa la API de administración: {e}")
+        return self._count_auth_pages(), "auth"
+
+    # --- snapshot ---
+
+    def refresh(self) -> Optional[UserCount]:
+        """Consulta el total ahora. Si falla se conserva el snapshot anterior."""
+        with self._refresh_lock:
+            # Otro hilo pudo haberlo refrescado mientras esperábamos
+            current = self._snapshot
+            if current is not None and current.age < self._ttl:
+                return current
+            start = time.perf_counter()
+            try:
+                value, source = self._query()
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"❌ Error contando usuarios de Tu Guía: {e}")
+                return current
+            snapshot = UserCount(
+                value=value,
+                source=source,
+                taken_at=time.monotonic(),
+                taken_at_iso=datetime.now().isoformat(timespec="seconds"),
+                query_seconds=time.perf_counter() - start,
+            )
+            with self._lock:
+                self._snapshot = snapshot
+                self.stats["refreshes"] += 1
+            logger.debug(f"📊 Usuarios de Tu Guía: {value} ({source}, {snapshot.query_seconds:.2f}s)")
+            return snapshot
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="tuguia-user-count", daemon=True).start()
+
+    def get(self) -> Optional[UserCount]:
+        """Snapshot vigente; espera una consulta solo si no hay uno utilizable."""
+        with self._lock:
+            snapshot = self._snapshot
+            self.stats["reads"] += 1
+        if snapshot is not None and snapshot.age < self._ttl:
+            return snapshot
+        if snapshot is not None and snapshot.age < self._max_stale:
+            self._count("reads_stale")
+            self.refresh_in_background()
+            return snapshot
+        self._count("reads_blocking")
+        return self.refresh()
+
+    def report(self) -> dict:
+        with self._lock:
+            snapshot = self._snapshot
+            stats = dict(self.stats)
+        return {
+            "source_config": self._source,
+            "ttl_s": self._ttl,
+            "users": snapshot.value if snapshot else None,
+            "source": snapshot.source if snapshot else None,
+            "taken_at": snapshot.taken_at_iso if snapshot else None,
+            "age_s": round(snapshot.age, 1) if snapshot else None,
+            "query_s": round(snapshot.query_seconds, 3) if snapshot else None,
+            **stats,
+        }
+
+
+_counter: UserCounter | None = None
+
+
+def get_user_counter() -> UserCounter:
+    """Contador del proceso (compartido por todas las sesiones)."""
+    global _counter
+    if _counter is None:
+        _counter = UserCounter()
+    return _counter
+
+
+register_route("/tuguia/users", lambda query: (200, get_user_counter().report()))
@@ -1,27 +1,30 @@
 from app.services.database import DatabaseService
-from app.core.supabase_client import get_supabase
 from app.services.tuguia_database import TuGuiaDatabase
-from app.pipeline.vision_processor import VisionCaptureProcessor
-from supabase import create_client, Client
+from app.pipeline.vision_processor import VISION_UNCHANGED_MODE, VisionCaptureProcessor
+from app.pipeline.speculative_rag import SpeculativeRAGProcessor
 from pipecat.services.llm_service import FunctionCallParams
 from loguru import logger
 import secrets
 import string
 from app.utils.security import generar_password_segura
-from app.services.rag import get_relevant_context
+from app.services.rag import aget_relevant_context
 from app.context import current_user_id
 from pipecat.processors.aggregators.llm_context import LLMContext
 
-# Cliente Supabase para operaciones administrativas (crear usuarios, contar)
-supabase: Client = get_supabase()
-
 class BotTools:
-    def __init__(self, db_service: DatabaseService, vision_processor: VisionCaptureProcessor = None):
+    def __init__(
+        self,
+        db_service: DatabaseService,
+        vision_processor: VisionCaptureProcessor = None,
+        speculative_rag: SpeculativeRAGProcessor = None,
+    ):
         """
         Inicializa las herramientas con el servicio de base de datos de la sesión actual.
+        Supabase y Tu Guía se consultan por el pool asíncrono (app/core/supabase_pool.py).
         """
         self.db_service = db_service
         self.vision_processor = vision_processor
+        self.speculative_rag = speculative_rag
         self.context: LLMContext | None = None
     
     def set_context(self, context: LLMContext):
@@ -42,7 +45,12 @@ class BotTools:
                 }
             else:
                 logger.info(f"🔍 Buscando en RAG: {query}")
-                context = get_relevant_context(query)
+                context = None
+                # Usar la búsqueda adelantada durante la transcripción si coincide
+                if self.speculative_rag:
+                    context = await self.speculative_rag.tomar_resultado(query)
+                if context is None:
+                    context = await aget_relevant_context(query)
                 
                 resultado = {
                     "success": True,
@@ -64,7 +72,7 @@ class BotTools:
         try:
             logger.info("📊 Contando usuarios de Tu Guia...")
             tuguia_db = TuGuiaDatabase()
-            count = tuguia_db.count_users()
+            count = await tuguia_db.count_users()
 
             if count is not None:
                 respuesta = {
@@ -106,7 +114,7 @@ class BotTools:
                 return
             
             tuguia_db = TuGuiaDatabase()
-            result = tuguia_db.create_user(
+            result = await tuguia_db.create_user(
                 email=email,
                 password=password,
                 first_name=first_name,
@@ -146,7 +154,7 @@ class BotTools:
                 return
 
             tuguia_db = TuGuiaDatabase()
-            result = tuguia_db.count_users_by_subcategory(subcategory_names)
+            result = await tuguia_db.count_users_by_subcategory(subcategory_names)
 
             if result["success"]:
                 mensajes = []
@@ -203,7 +211,7 @@ class BotTools:
                     target_user_id = current_user_id.get()
             
             # Llamar al servicio DB actualizado
-            success = self.db_service.save_memory(key, value, user_id=target_user_id)
+            success = await self.db_service.save_memory(key, value, user_id=target_user_id)
 
             if success:
                 msg_tipo = "PERSONAL" if target_user_id else "PÚBLICA/COMUNITARIA"
@@ -238,7 +246,7 @@ class BotTools:
             # Intentar borrar usando el contexto del usuario actual
             user_id = self.db_service.user_id
             
-            success = self.db_service.delete_memory(key, user_id=user_id)
+            success = await self.db_service.delete_memory(key, user_id=user_id)
             
             if success:
                 await params.result_callback({
@@ -274,7 +282,24 @@ class BotTools:
                 })
                 return
             
-            image_base64 = self.vision_processor.get_last_image_base64()
+            # La compresión se hace recién ahora, fuera del event loop, y solo si la escena cambió
+            image_base64, changed = await self.vision_processor.get_image_if_changed()
+            if not changed:
+                if VISION_UNCHANGED_MODE == "reuse" and self.vision_processor.get_last_image_base64():
+                    image_base64 = self.vision_processor.get_last_image_base64()
+                else:
+                    await params.result_callback({
+                        "success": True,
+                        "sin_cambios": True,
+                        "mensaje": "La camara muestra lo mismo que la ultima vez que la miraste. Responde con lo que viste en esa captura (la imagen anterior o su descripcion)."
+                    })
+                    return
+            if not image_base64:
+                await params.result_callback({
+                    "success": False,
+                    "mensaje": "No pude procesar la imagen de la camara. Intenta de nuevo."
+                })
+                return
 
             if self.context:
                 logger.info("Inyectando imagen al contexto del LLM")
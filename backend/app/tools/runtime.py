@@ -0,0 +1,236 @@
+"""
+Runtime de ejecución de herramientas (bot de voz y API de texto).
+
+Las herramientas esperan servicios externos (Supabase, la API de
+administración de Tu Guía, el RAG), que ya se consultan de forma asíncrona
+(app/core/supabase_pool.py), pero sin timeout una petición colgada congela el
+turno para siempre. `ToolRuntime` centraliza:
+
+  - Un deadline por herramienta (TOOL_TIMEOUTS). Al vencer, la herramienta
+    devuelve un error estructurado (`"error": "timeout"`) en vez de colgar
+    el turno.
+  - Un límite de llamadas simultáneas por herramienta (TOOL_CONCURRENCY).
+    La espera por un lugar cuenta dentro del deadline.
+  - Histogramas de latencia y de errores por herramienta (ruta /tools del
+    servidor de operaciones).
+  - Un span por llamada (`tool <nombre>`, con el atributo tool.name).
+
+En el bot de voz cada handler se registra con `runtime.wrap(nombre, handler)`;
+la API de texto usa `runtime.call`.
+"""
+import asyncio
+import os
+import threading
+import time
+from dataclasses import replace
+from typing import Any, Awaitable, Callable, Dict
+
+from loguru import logger
+
+from app.core.metrics import LatencyHistogram
+from app.core.ops_server import register_route
+from app.core.tracing import span
+
+TOOL_DEFAULT_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", 10))
+TOOL_DEFAULT_CONCURRENCY = int(os.getenv("TOOL_DEFAULT_CONCURRENCY", 4))
+
+# Segundos máximos por herramienta. Las de Tu Guía dependen de la API de administración
+DEFAULT_TIMEOUTS = {
+    "buscar_informacion": 8.0,
+    "contar_usuarios_tuguia": 8.0,
+    "contar_usuarios_por_subcategoria": 10.0,
+    "crear_usuario_tuguia": 12.0,
+    "guardar_dato": 5.0,
+    "borrar_dato": 5.0,
+    "ver_camara": 5.0,
+}
+
+# Llamadas simultáneas por herramienta (en todo el proceso)
+DEFAULT_CONCURRENCY = {
+    "contar_usuarios_tuguia": 2,
+    "contar_usuarios_por_subcategoria": 2,
+    "crear_usuario_tuguia": 2,
+}
+
+
+def parse_tool_values(value: str, cast: Callable[[str], Any] = float, env: str = "") -> Dict[str, Any]:
+    """"herramienta=valor,herramienta=valor" -> dict. Ignora entradas mal formadas."""
+    values = {}
+    for item in value.split(","):
+        name, _, raw = item.partition("=")
+        try:
+            values[name.strip()] = cast(raw)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"⚠️ {env}: entrada inválida '{item.strip()}'")
+    return values
+
+
+TOOL_TIMEOUTS = {**DEFAULT_TIMEOUTS, **parse_tool_values(os.getenv("TOOL_TIMEOUTS", ""), float, "TOOL_TIMEOUTS")}
+TOOL_CONCURRENCY = {
+    **DEFAULT_CONCURRENCY,
+    **parse_tool_values(os.getenv("TOOL_CONCURRENCY", ""), int, "TOOL_CONCURRENCY"),
+}
+
+
+class ToolTimeout(Exception):
+    pass
+
+
+class ToolStats:
+    """Contadores e histogramas de una herramienta."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency = LatencyHistogram()
+        # Latencia de las llamadas que terminaron en error (incluye timeouts)
+        self.error_latency = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "error_rate": round(self.errors / self.calls, 3) if self.calls else None,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency": self.latency.to_dict(),
+            "error_latency": self.error_latency.to_dict(),
+            "queue_wait": self.queue_wait.to_dict(),
+        }
+
+
+class ToolRuntime:
+    """Ejecuta herramientas con deadline, límite de concurrencia y métricas."""
+
+    def __init__(
+        self,
+        timeouts: Dict[str, float] | None = None,
+        concurrency: Dict[str, int] | None = None,
+    ):
+        self._timeouts = timeouts if timeouts is not None else TOOL_TIMEOUTS
+        self._concurrency = concurrency if concurrency is not None else TOOL_CONCURRENCY
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, ToolStats] = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, name: str) -> float:
+        return self._timeouts.get(name, TOOL_DEFAULT_TIMEOUT)
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(self._concurrency.get(name, TOOL_DEFAULT_CONCURRENCY))
+        return self._semaphores[name]
+
+    def _tool_stats(self, name: str) -> ToolStats:
+        with self._lock:
+            return self._stats.setdefault(name, ToolStats())
+
+    async def call(self, name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Ejecuta `await fn(*args, **kwargs)` como la herramienta `name`.
+        Levanta ToolTimeout si pasa el deadline; las demás excepciones se propagan.
+        """
+        stats = self._tool_stats(name)
+        deadline = self.timeout(name)
+        start = time.perf_counter()
+        with self._lock:
+            stats.calls += 1
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+
+        async def _run():
+            async with self._semaphore(name):
+                with self._lock:
+                    stats.queue_wait.observe((time.perf_counter() - start) * 1000)
+                return await fn(*args, **kwargs)
+
+        failed = True
+        with span(f"tool {name}", **{"tool.name": name, "tool.timeout_s": deadline}) as tool_span:
+            try:
+                result = await asyncio.wait_for(_run(), timeout=deadline)
+                failed = isinstance(result, dict) and result.get("success") is False
+                if failed:
+                    tool_span.set_error(result.get("error") or "success=false")
+                return result
+            except asyncio.TimeoutError:
+                with self._lock:
+                    stats.timeouts += 1
+                logger.warning(f"⏱️ La herramienta {name} pasó su deadline de {deadline:g}s")
+                tool_span.set_error("timeout")
+                raise ToolTimeout(name)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    stats.in_flight -= 1
+                    stats.latency.observe(elapsed_ms)
+                    if failed:
+                        stats.errors += 1
+                        stats.error_latency.observe(elapsed_ms)
+
+    def timeout_result(self, name: str) -> dict:
+        return {
+            "success": False,
+            "error": "timeout",
+            "mensaje": f"La herramienta {name} tardó más de {self.timeout(name):g} segundos y se canceló. "
+                       "Avisa al usuario que el servicio no respondió y que puede intentarlo de nuevo.",
+        }
+
+    def wrap(self, name: str, handler: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+        """
+        Envuelve un handler de Pipecat (recibe FunctionCallParams y responde con
+        result_callback). Si vence el deadline o el handler falla sin responder,
+        el LLM recibe igual un resultado de error.
+        """
+        async def wrapped(params):
+            original_callback = params.result_callback
+            delivered = {}
+
+            async def result_callback(result, **kwargs):
+                delivered["result"] = result
+                await original_callback(result, **kwargs)
+
+            async def run():
+                await handler(replace(params, result_callback=result_callback))
+                return delivered.get("result")
+
+            try:
+                await self.call(name, run)
+            except ToolTimeout:
+                if "result" not in delivered:
+                    await original_callback(self.timeout_result(name))
+            except Exception as e:
+                logger.error(f"❌ Error en la herramienta {name}: {e}")
+                if "result" not in delivered:
+                    await original_callback({"success": False, "error": str(e)})
+
+        wrapped.__name__ = getattr(handler, "__name__", name)
+        return wrapped
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tools = {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+        return {
+            "timeouts_s": self._timeouts,
+            "default_timeout_s": TOOL_DEFAULT_TIMEOUT,
+            "tools": tools,
+        }
+
+
+_runtime: ToolRuntime | None = None
+
+
+def get_tool_runtime() -> ToolRuntime:
+    """Runtime del proceso (compartido por todas las sesiones)."""
+    global _runtime
+    if _runtime is None:
+        _runtime = ToolRuntime()
+    return _runtime
+
+
+register_route("/tools", lambda query: (200, get_tool_runtime().snapshot()))
@@ -0,0 +1,170 @@
+"""
+Memoria y latencia de arranque por sesión de los modelos de voz.
+
+Compara crear analizadores como lo hace Pipecat (un modelo ONNX por sesión)
+contra el runtime compartido de app/pipeline/model_runtime.py. Cada modo
+corre en un subproceso aparte para que el RSS de uno no afecte al otro.
+
+Reporta:
+  - rss_per_session_mb: RSS adicional por sesión (pendiente entre 1 y N sesiones)
+  - create_ms_p50:      tiempo de crear el analizador de una sesión
+  - max_abs_diff:       diferencia de salida contra un analizador propio
+                        (debe ser 0: el estado de cada sesión es independiente)
+
+Uso:
+    uv run python -m benchmarks.models.run --sessions 20
+    uv run python -m benchmarks.models.run --sessions 20 --smart-turn
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).parent
+SAMPLE_RATE = 16000
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _audio_chunks(n: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    t = np.arange(512) / SAMPLE_RATE
+    chunks = []
+    for i in range(n):
+        tone = 0.3 * np.sin(2 * np.pi * (180 + 20 * i) * t) + 0.05 * rng.standard_normal(512)
+        chunks.append((tone * 32767).astype(np.int16).tobytes())
+    return chunks
+
+
+def _make_vad(mode: str):
+    if mode == "shared":
+        from app.pipeline.model_runtime import create_vad_analyzer
+
+        analyzer = create_vad_analyzer()
+    else:
+        from pipecat.audio.vad.silero import SileroVADAnalyzer
+
+        analyzer = SileroVADAnalyzer()
+    analyzer.set_sample_rate(SAMPLE_RATE)
+    return analyzer
+
+
+def _make_turn(mode: str):
+    if mode == "shared":
+        from app.pipeline.model_runtime import create_turn_analyzer
+
+        analyzer = create_turn_analyzer()
+    else:
+        from pipecat.audio.turn.smart_turn.local_smart_turn_v3 import LocalSmartTurnAnalyzerV3
+
+        analyzer = LocalSmartTurnAnalyzerV3()
+    analyzer.set_sample_rate(SAMPLE_RATE)
+    return analyzer
+
+
+def worker(mode: str, sessions: int, smart_turn: bool) -> dict:
+    """Crea `sessions` sesiones en este proceso y mide RSS y latencia."""
+    # Importar antes de medir: el costo de import no es por sesión
+    import pipecat.audio.vad.silero  # noqa: F401
+    from app.pipeline import model_runtime  # noqa: F401
+
+    if smart_turn:
+        import pipecat.audio.turn.smart_turn.local_smart_turn_v3  # noqa: F401
+
+    chunks = _audio_chunks(20, seed=1)
+    turn_audio = np.concatenate([np.frombuffer(c, np.int16) for c in chunks * 10]).astype(np.float32) / 32768
+
+    baseline_rss = _rss_mb()
+    rss, create_ms, analyzers = [], [], []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        vad = _make_vad(mode)
+        turn = _make_turn(mode) if smart_turn else None
+        create_ms.append((time.perf_counter() - start) * 1000)
+
+        # Una inferencia por sesión: onnxruntime reserva memoria en la primera corrida
+        for chunk in chunks[:3]:
+            vad.voice_confidence(chunk)
+        if turn is not None:
+            turn._predict_endpoint(turn_audio)
+        analyzers.append((vad, turn))
+        rss.append(_rss_mb())
+
+    # Las sesiones intercaladas deben dar lo mismo que un analizador solo
+    reference = _make_vad("per_session")
+    expected = [reference.voice_confidence(c) for c in chunks]
+    a, b = _make_vad(mode), _make_vad(mode)
+    got_a, got_b = [], []
+    for chunk in chunks:
+        got_a.append(a.voice_confidence(chunk))
+        got_b.append(b.voice_confidence(chunk))
+    max_abs_diff = float(max(np.max(np.abs(np.array(expected) - np.array(got_a))),
+                             np.max(np.abs(np.array(expected) - np.array(got_b)))))
+
+    slope = float(np.polyfit(np.arange(1, sessions + 1), rss, 1)[0]) if sessions > 1 else rss[0] - baseline_rss
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "smart_turn": smart_turn,
+        "rss_baseline_mb": round(baseline_rss, 1),
+        "rss_final_mb": round(rss[-1], 1),
+        "rss_per_session_mb": round(slope, 2),
+        "create_ms_p50": round(float(np.percentile(create_ms, 50)), 2),
+        "create_ms_first": round(create_ms[0], 2),
+        "max_abs_diff": max_abs_diff,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS y latencia por sesión de VAD/Smart Turn")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--smart-turn", action="store_true", help="Incluir Smart Turn V3 (requiere transformers)")
+    parser.add_argument("--output", help="Ruta del JSON de salida")
+    parser.add_argument("--worker", choices=["per_session", "shared"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.sessions, args.smart_turn)))
+        return
+
+    results = {}
+    for mode in ("per_session", "shared"):
+        command = [sys.executable, "-m", "benchmarks.models.run", "--worker", mode, "--sessions", str(args.sessions)]
+        if args.smart_turn:
+            command.append("--smart-turn")
+        output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=HERE.parents[1]).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"\n📊 Modelos de voz por sesión ({args.sessions} sesiones, smart turn: {args.smart_turn})")
+    print(f"{'modo':<12} {'MB/sesión':>10} {'RSS final':>10} {'crear ms':>9} {'1ra ms':>8} {'diff':>8}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<12} {r['rss_per_session_mb']:>10.2f} {r['rss_final_mb']:>10.1f} "
+            f"{r['create_ms_p50']:>9.2f} {r['create_ms_first']:>8.2f} {r['max_abs_diff']:>8.1e}"
+        )
+
+    report = {"created_at": datetime.now().isoformat(timespec="seconds"), "results": results}
+    path = Path(args.output) if args.output else HERE / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n💾 Resultado guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Benchmark de recuperación para app/services/rag.py.
+
+Corre sin red: el corpus son los textos de app/core/knowledge_base.py
+divididos con el mismo chunker de la ingesta, los embeddings salen de
+benchmarks/rag/embeddings/ (grabados una vez con --record-embeddings) y
+`match_documents` se reemplaza por una búsqueda local equivalente.
+
+El archivo grabado guarda también los chunks, así una corrida con embeddings
+no necesita el tokenizer de la ingesta; si los documentos cambiaron se vuelven
+a dividir (el BPE de tiktoken queda en .cache/tiktoken después de la primera
+descarga; sin red y sin caché se estima ~4 caracteres por token, como
+app/core/tokens.py) y los embeddings que falten hay que volver a grabarlos.
+
+Sin embeddings grabados solo corre con --allow-hashing, con un embedder
+determinista por hashing: sirve para probar el benchmark, no para juzgar
+umbrales (las similitudes no se parecen a las de OpenAI) ni perfiles recortados.
+
+Para cada configuración (umbral, cantidad de resultados, perfil de embedding)
+reporta recall@k, MRR, tokens de contexto generados y latencia p50/p99, y
+guarda el resultado en benchmarks/rag/results/ para comparar entre commits.
+
+Uso:
+    uv run python -m benchmarks.rag.run
+    uv run python -m benchmarks.rag.run --config 0.78:3:full --config 0.3:6:d512_f16
+    uv run python -m benchmarks.rag.run --compare benchmarks/rag/results/baseline.json
+    uv run python -m benchmarks.rag.run --record-embeddings   # requiere OPENAI_API_KEY
+    uv run python -m benchmarks.rag.run --allow-hashing       # sin embeddings grabados
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+HERE = Path(__file__).parent
+
+# rag.py crea el cliente de OpenAI al importarse; el benchmark nunca lo usa
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+# El BPE de tiktoken se descarga una vez y queda al lado del proyecto (no en /tmp)
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(HERE.parent.parent / ".cache" / "tiktoken"))
+
+from app.core.tokens import count_tokens  # noqa: E402
+from app.services import rag  # noqa: E402
+from app.services.embedding_profile import EMBEDDING_MODEL, FULL_DIMENSIONS, get_profile  # noqa: E402
+from app.services.ingestion import BUILTIN_DOCUMENTS, CHUNK_OVERLAP, CHUNK_SIZE, _get_encoding, chunk_text  # noqa: E402
+
+QUERIES_FILE = HERE / "queries_v1.json"
+EMBEDDINGS_FILE = HERE / "embeddings" / f"{EMBEDDING_MODEL}.json"
+RESULTS_DIR = HERE / "results"
+
+DEFAULT_CONFIGS = ["0.78:3:full", "0.5:4:full", "0.3:6:full", "0.3:6:d512_f16", "0.3:6:d256_i8"]
+
+# Tolerancia para --compare: caídas mayores se reportan como regresión
+RECALL_TOLERANCE = 0.02
+
+
+@dataclass(frozen=True)
+class Config:
+    match_threshold: float
+    match_count: int
+    profile: str
+
+    @classmethod
+    def parse(cls, value: str) -> "Config":
+        threshold, count, profile = value.split(":")
+        return cls(float(threshold), int(count), profile)
+
+    @property
+    def name(self) -> str:
+        return f"t{self.match_threshold}_k{self.match_count}_{self.profile}"
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def documents_key() -> str:
+    """Hash de los documentos y del chunking: si cambia, los chunks grabados ya no sirven."""
+    return _text_key(json.dumps([sorted(BUILTIN_DOCUMENTS.items()), CHUNK_SIZE, CHUNK_OVERLAP], ensure_ascii=False))
+
+
+def hashing_embedding(text: str, dimensions: int = FULL_DIMENSIONS) -> List[float]:
+    """
+    Embedding determinista por feature hashing de raíces de palabras.
+    No es semántico como el de OpenAI, pero es estable entre máquinas y
+    commits, que es lo que necesita una regresión.
+    """
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"[a-z0-9ñ]{3,}", folded):
+        digest = hashlib.blake2b(word[:6].encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class EmbeddingStore:
+    """
+    Embeddings guardados en disco por hash de texto, con respaldo por hashing.
+    El archivo guarda además los chunks del corpus con el que se grabó.
+    """
+
+    def __init__(self, path: Path = EMBEDDINGS_FILE):
+        self.path = path
+        self.vectors: Dict[str, List[float]] = {}
+        self.chunks: List[dict] = []
+        self.documents = None
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            self.vectors = data["vectors"]
+            self.chunks = data.get("chunks", [])
+            self.documents = data.get("documents")
+        self.misses = 0
+
+    @property
+    def source(self) -> str:
+        if not self.vectors:
+            return "hashing"
+        return "stored" if not self.misses else "stored+hashing"
+
+    def get(self, text: str) -> List[float]:
+        vector = self.vectors.get(_text_key(text))
+        if vector is None:
+            self.misses += 1
+            return hashing_embedding(text)
+        return vector
+
+    def record(self, chunks: List[dict], queries: List[str]):
+        """Genera con OpenAI los embeddings que falten y los guarda junto con los chunks."""
+        from openai import OpenAI
+
+        texts = [c["chunk_text"] for c in chunks] + queries
+        missing = [t for t in dict.fromkeys(texts) if _text_key(t) not in self.vectors]
+        self.chunks, self.documents = chunks, documents_key()
+        if not missing and self.path.exists():
+            return
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        for i in range(0, len(missing), 64):
+            batch = missing[i:i + 64]
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+            for item in sorted(response.data, key=lambda d: d.index):
+                self.vectors[_text_key(batch[item.index])] = [round(x, 6) for x in item.embedding]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"model": EMBEDDING_MODEL, "documents": self.documents, "chunks": self.chunks, "vectors": self.vectors}
+        self.path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        print(f"💾 {len(missing)} embeddings guardados en {self.path}")
+
+
+class _ApproxEncoding:
+    """~4 caracteres por token, para dividir el corpus sin tiktoken (como app/core/tokens.py)."""
+
+    def encode(self, text: str) -> List[str]:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+def _chunk_encoding():
+    try:
+        return _get_encoding()
+    except Exception as e:
+        print(f"⚠️ Tokenizer de la ingesta no disponible ({type(e).__name__}); se estiman tokens por caracteres")
+        return _ApproxEncoding()
+
+
+class LocalMatcher:
+    """Sustituto local de la RPC match_documents (coseno + umbral + límite)."""
+
+    def __init__(self, chunks: List[dict], vectors: np.ndarray, profile_name: str):
+        self.chunks = chunks
+        self.profile = get_profile(profile_name)
+        # Los mismos valores que la ingesta escribe en la columna del perfil
+        stored = np.array([self.profile.to_storage(v) for v in vectors], dtype=np.float32)
+        self.matrix = stored / np.maximum(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12)
+
+    def __call__(self, query_embedding: List[float], match_threshold: float, match_count: int) -> List[dict]:
+        query = self.profile.reduce(query_embedding)
+        scores = self.matrix @ query
+        order = np.argsort(-scores)[:match_count]
+        return [
+            {**self.chunks[i], "similarity": float(scores[i])}
+            for i in order
+            if scores[i] >= match_threshold
+        ]
+
+
+def build_corpus(store: EmbeddingStore | None = None) -> List[dict]:
+    """Chunks de los documentos; los grabados si los documentos no cambiaron (no hace falta tiktoken)."""
+    if store is not None and store.chunks and store.documents == documents_key():
+        return store.chunks
+    chunks = []
+    encoding = _chunk_encoding()
+    for name, text in BUILTIN_DOCUMENTS.items():
+        for chunk in chunk_text(text, encoding=encoding):
+            chunks.append({"document_name": name, "chunk_index": chunk.index, "chunk_text": chunk.text})
+    return chunks
+
+
+def _is_relevant(result: dict, expected: dict) -> bool:
+    return result["document_name"] == expected["document"] and expected["contains"] in result["chunk_text"]
+
+
+def run_config(config: Config, queries: List[dict], corpus: List[dict], store: EmbeddingStore, repeats: int) -> dict:
+    vectors = np.array([store.get(c["chunk_text"]) for c in corpus], dtype=np.float32)
+    matcher = LocalMatcher(corpus, vectors, config.profile)
+
+    recalls, reciprocal_ranks, context_tokens, latencies = [], [], [], []
+    per_query = {}
+    for item in queries:
+        query_embedding = store.get(item["query"])
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results = matcher(query_embedding, config.match_threshold, config.match_count)
+            context = rag.format_context_for_llm(results)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        expected = item["expected"]
+        found = sum(1 for e in expected if any(_is_relevant(r, e) for r in results))
+        first = next(
+            (rank for rank, r in enumerate(results, 1) if any(_is_relevant(r, e) for e in expected)),
+            None,
+        )
+        recalls.append(found / len(expected))
+        reciprocal_ranks.append(1 / first if first else 0.0)
+        context_tokens.append(count_tokens(context))
+        per_query[item["id"]] = {"recall": found / len(expected), "rank": first, "results": len(results)}
+
+    return {
+        "match_threshold": config.match_threshold,
+        "match_count": config.match_count,
+        "profile": config.profile,
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "context_tokens_mean": round(float(np.mean(context_tokens)), 1),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+        "queries": per_query,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, cwd=HERE).strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """Lista de regresiones de recall/MRR respecto a un resultado anterior."""
+    regressions = []
+    for name, result in current["configs"].items():
+        previous = baseline.get("configs", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("recall_at_k", "mrr"):
+            delta = result[metric] - previous[metric]
+            if delta < -RECALL_TOLERANCE:
+                regressions.append(f"{name}: {metric} {previous[metric]:.3f} -> {result[metric]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación RAG (offline)")
+    parser.add_argument("--config", action="append", help="umbral:cantidad:perfil (repetible)")
+    parser.add_argument("--repeats", type=int, default=20, help="Repeticiones por consulta para la latencia")
+    parser.add_argument("--compare", help="Resultado JSON anterior contra el que comparar")
+    parser.add_argument("--output", help="Ruta del JSON de salida (por defecto results/<fecha>_<commit>.json)")
+    parser.add_argument("--record-embeddings", action="store_true", help="Guardar embeddings reales de OpenAI")
+    parser.add_argument(
+        "--allow-hashing", action="store_true",
+        help="Sin embeddings grabados, correr igual con el embedder por hashing (solo prueba el benchmark)",
+    )
+    args = parser.parse_args()
+
+    suite = json.loads(QUERIES_FILE.read_text(encoding="utf-8"))
+    queries = suite["queries"]
+    store = EmbeddingStore()
+    corpus = build_corpus(store)
+
+    if args.record_embeddings:
+        store.record(corpus, [q["query"] for q in queries])
+
+    configs = [Config.parse(c) for c in (args.config or DEFAULT_CONFIGS)]
+    if not store.vectors:
+        if not args.allow_hashing:
+            sys.exit(
+                f"❌ No hay embeddings grabados en {EMBEDDINGS_FILE}. Grabalos con --record-embeddings "
+                "(requiere OPENAI_API_KEY) o corré con --allow-hashing para solo probar el benchmark."
+            )
+        print(
+            "⚠️ Embedder por hashing: recall y MRR no sirven para elegir umbrales; "
+            "los perfiles recortados se omiten."
+        )
+        configs = [c for c in configs if c.profile == "full"]
+    elif store.documents != documents_key():
+        print("⚠️ Los documentos cambiaron desde que se grabaron los embeddings; los chunks nuevos usan hashing.")
+
+    report = {
+        "suite_version": suite["version"],
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "chunks": len(corpus),
+        "configs": {},
+    }
+    for config in configs:
+        report["configs"][config.name] = run_config(config, queries, corpus, store, args.repeats)
+    report["embeddings"] = store.source
+
+    print(f"\n📊 RAG benchmark v{suite['version']} ({len(queries)} consultas, {len(corpus)} chunks, embeddings: {store.source})")
+    print(f"{'config':<22} {'recall':>7} {'MRR':>6} {'tokens':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, r in report["configs"].items():
+        print(
+            f"{name:<22} {r['recall_at_k']:>7.3f} {r['mrr']:>6.3f} {r['context_tokens_mean']:>7.0f} "
+            f"{r['latency_ms_p50']:>8.3f} {r['latency_ms_p99']:>8.3f}"
+        )
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{report['commit'] or 'local'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Resultado guardado en {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline)
+        if regressions:
+            print("\n❌ Regresiones detectadas:")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto a", args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark de arranque en frío de bot.py.
+
+Lanza el bot varias veces y mide, desde el lanzamiento del proceso:
+  - ops_s:    el servidor de operaciones responde /live
+  - http_s:   el servidor de Pipecat acepta conexiones
+  - ready_s:  /ready devuelve 200 (precarga terminada)
+junto con los tiempos por fase que reporta /startup.
+
+Uso:
+    uv run python -m benchmarks.startup.run --runs 5
+    uv run python -m benchmarks.startup.run --no-prewarm   # imports en la primera sesión
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).parent
+BACKEND = HERE.parents[1]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except Exception:
+        return None, None
+
+
+def _port_open(port: int) -> bool:
+    with socket.socket() as s:
+        s.settimeout(0.2)
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+
+def run_once(prewarm: bool, timeout: float) -> dict:
+    http_port, ops_port = _free_port(), _free_port()
+    launched_at = time.time()
+    env = {
+        **os.environ,
+        "OPS_PORT": str(ops_port),
+        "STARTUP_PREWARM": "true" if prewarm else "false",
+        "STARTUP_LAUNCHED_AT": str(launched_at),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "bot.py", "--port", str(http_port)],
+        cwd=BACKEND,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    result = {"ops_s": None, "http_s": None, "ready_s": None, "phases": {}}
+    try:
+        while time.time() - launched_at < timeout:
+            elapsed = round(time.time() - launched_at, 3)
+            if result["ops_s"] is None and _get(f"http://127.0.0.1:{ops_port}/live")[0] == 200:
+                result["ops_s"] = elapsed
+            if result["http_s"] is None and _port_open(http_port):
+                result["http_s"] = elapsed
+            if result["ready_s"] is None and _get(f"http://127.0.0.1:{ops_port}/ready")[0] == 200:
+                result["ready_s"] = elapsed
+            if all(result[k] is not None for k in ("ops_s", "http_s", "ready_s")):
+                break
+            if process.poll() is not None:
+                raise RuntimeError(f"bot.py terminó con código {process.returncode}")
+            time.sleep(0.05)
+        status, report = _get(f"http://127.0.0.1:{ops_port}/startup")
+        if report:
+            result["phases"] = report.get("phases", {})
+            result["interpreter_s"] = report.get("interpreter_s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def _p50(values):
+    values = [v for v in values if v is not None]
+    return round(float(np.percentile(values, 50)), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío del bot de voz")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--no-prewarm", action="store_true", help="Medir sin precarga en segundo plano")
+    parser.add_argument("--output", help="Ruta del JSON de salida")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        result = run_once(prewarm=not args.no_prewarm, timeout=args.timeout)
+        runs.append(result)
+        print(f"  run {i + 1}: ops {result['ops_s']}s, http {result['http_s']}s, ready {result['ready_s']}s")
+
+    phase_names = sorted({name for r in runs for name in r["phases"]})
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "prewarm": not args.no_prewarm,
+        "runs": args.runs,
+        "p50": {
+            "ops_s": _p50([r["ops_s"] for r in runs]),
+            "http_s": _p50([r["http_s"] for r in runs]),
+            "ready_s": _p50([r["ready_s"] for r in runs]),
+            "phases": {name: _p50([r["phases"].get(name) for r in runs]) for name in phase_names},
+        },
+        "raw": runs,
+    }
+
+    print(f"\n📊 Arranque en frío (p50 de {args.runs} corridas, precarga: {report['prewarm']})")
+    print(f"   /live responde:    {report['p50']['ops_s']}s")
+    print(f"   HTTP de Pipecat:   {report['p50']['http_s']}s")
+    print(f"   /ready (listo):    {report['p50']['ready_s']}s")
+    for name, value in report["p50"]["phases"].items():
+        print(f"   fase {name:<18} {value}s")
+
+    output = Path(args.output) if args.output else HERE / "results" / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}{'_noprewarm' if args.no_prewarm else ''}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n💾 Resultado guardado en {output}")
+
+
+if __name__ == "__main__":
+    main()
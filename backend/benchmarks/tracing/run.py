@@ -0,0 +1,136 @@
+"""
+Costo de las trazas (app/core/tracing.py) por span y por petición.
+
+Mide el mismo trabajo con y sin spans en cada configuración:
+
+  - baseline:  sin spans
+  - disabled:  TRACING_ENABLED=false (los spans existen pero no se registran)
+  - unsampled: traza no muestreada (lo que paga el 1 - TRACE_SAMPLE_RATE de las peticiones)
+  - sampled:   muestreada, exportador que descarta (solo el costo en el camino de la petición)
+  - file:      muestreada y escrita en JSONL por el hilo exportador
+
+Cada "petición" abre los spans de una petición de chat típica: el span de
+servidor y, dentro, OpenAI, RAG (embedding + RPC), una herramienta y dos
+consultas a la base, cada uno con sus atributos. Reporta:
+
+  - ns_per_span:        costo extra por span respecto de baseline
+  - us_per_request:     costo extra por petición
+  - pct_of_request:     ese costo sobre una petición de --request-ms (por defecto 800 ms)
+
+Uso:
+    uv run python -m benchmarks.tracing.run
+    uv run python -m benchmarks.tracing.run --requests 50000 --request-ms 300
+"""
+import argparse
+import json
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.core.tracing import FileExporter, NullExporter, Tracer
+
+HERE = Path(__file__).parent
+
+# (nombre, atributos) de los spans anidados dentro del span de servidor
+REQUEST_SPANS = [
+    ("openai.chat.completions", {"llm.model": "gpt-4o-mini", "llm.stream": False}),
+    ("rag.retrieve", {"rag.query_chars": 42, "rag.match_count": 6}),
+    ("openai.embeddings", {"llm.model": "text-embedding-3-small"}),
+    ("db match_documents", {"db.system": "postgrest", "db.pool": "main"}),
+    ("tool buscar_informacion", {"tool.name": "buscar_informacion"}),
+    ("db messages", {"db.system": "postgrest", "db.pool": "main"}),
+]
+SPANS_PER_REQUEST = len(REQUEST_SPANS) + 1
+
+
+def _work():
+    # Un poco de trabajo de Python para que el loop no sea vacío
+    return sum(range(20))
+
+
+def request_baseline():
+    for _ in REQUEST_SPANS:
+        _work()
+    _work()
+
+
+def request_traced(tracer: Tracer):
+    with tracer.span("POST /api/chat", kind="server", conversation_id="c-1", user_id="u-1") as root:
+        for name, attributes in REQUEST_SPANS:
+            with tracer.span(name, **attributes) as child:
+                _work()
+                child.set_attribute("result", 1)
+        root.set_attribute("http.status_code", 200)
+        _work()
+
+
+def time_requests(fn, requests: int, repeats: int) -> float:
+    """Mejor tiempo por petición (ns) de `repeats` corridas."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(requests):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / requests)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo de las trazas por span")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--request-ms", type=float, default=800, help="Duración de una petición real, para el porcentaje")
+    parser.add_argument("--output", help="Ruta del JSON de salida")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_exporter = FileExporter(str(Path(tmp) / "spans.jsonl"))
+        tracers = {
+            "disabled": Tracer(enabled=False, exporter=NullExporter()),
+            "unsampled": Tracer(sample_rate=0.0, exporter=NullExporter()),
+            "sampled": Tracer(sample_rate=1.0, exporter=NullExporter(), queue_size=10 ** 7),
+            "file": Tracer(sample_rate=1.0, exporter=file_exporter, queue_size=10 ** 7),
+        }
+        baseline = time_requests(request_baseline, args.requests, args.repeats)
+        results = {"baseline": {"ns_per_request": round(baseline)}}
+        for mode, tracer in tracers.items():
+            ns = time_requests(lambda: request_traced(tracer), args.requests, args.repeats)
+            extra = max(ns - baseline, 0.0)
+            tracer.shutdown()
+            results[mode] = {
+                "ns_per_request": round(ns),
+                "ns_per_span": round(extra / SPANS_PER_REQUEST),
+                "us_per_request": round(extra / 1000, 2),
+                "pct_of_request": round(extra / (args.request_ms * 1e6) * 100, 4),
+                "exported": tracer.stats["exported"],
+                "dropped": tracer.stats["dropped"],
+            }
+        file_lines = sum(1 for _ in open(file_exporter.path, encoding="utf-8")) if file_exporter.path.exists() else 0
+
+    print(f"\n📊 {SPANS_PER_REQUEST} spans por petición, {args.requests} peticiones, mejor de {args.repeats}")
+    print(f"{'modo':<10} {'ns/span':>8} {'µs/petición':>12} {f'% de {args.request_ms:.0f} ms':>12}")
+    for mode, r in results.items():
+        if mode == "baseline":
+            continue
+        print(f"{mode:<10} {r['ns_per_span']:>8} {r['us_per_request']:>12.2f} {r['pct_of_request']:>12.4f}")
+    print(f"\n💾 Exportador a archivo: {file_lines} spans escritos, {results['file']['dropped']} descartados")
+
+    spans = np.array([r["ns_per_span"] for m, r in results.items() if m != "baseline"])
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "args": vars(args),
+        "spans_per_request": SPANS_PER_REQUEST,
+        "max_ns_per_span": int(spans.max()),
+        "results": results,
+    }
+    path = Path(args.output) if args.output else HERE / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"💾 Resultado guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
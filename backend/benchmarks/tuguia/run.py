@@ -0,0 +1,250 @@
+"""
+Conteo de usuarios por subcategoría en Tu Guía: loop anterior vs por lotes.
+
+Compara cuatro formas de responder `contar_usuarios_por_subcategoria` con N
+nombres:
+
+  - sequential: el loop anterior (un ilike y un count por nombre, en serie)
+  - concurrent: el respaldo actual sin la RPC (cada nombre en paralelo)
+  - rpc:        `count_users_by_subcategories(names)`, una sola llamada
+  - catalog:    nombres resueltos en el catálogo local (sin red) y conteos
+                con `count_users_by_subcategory_ids(ids)`, una sola llamada
+
+Sin --live usa un cliente simulado con una latencia fija por petición
+(--rtt-ms), que es lo que domina en una llamada real. Con --live usa la base
+de Tu Guía de TUGUIA_SUPABASE_URL (las RPC tienen que estar aplicadas). El
+catálogo se carga antes de medir, como en el proceso de voz.
+
+Reporta por modo:
+  - requests:       peticiones HTTP hechas por consulta
+  - ms_p50 / ms_p95: latencia de una consulta completa
+
+Uso:
+    uv run python -m benchmarks.tuguia.run --names plomero,electricista,gasista,pintor,carpintero
+    uv run python -m benchmarks.tuguia.run --rtt-ms 120 --runs 20
+    uv run python -m benchmarks.tuguia.run --live --runs 5
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from app.core.supabase_client import get_tuguia_supabase
+from app.core.supabase_pool import get_tuguia_pool
+from app.services import tuguia_database
+from app.services.subcategory_catalog import SubcategoryCatalog
+from app.services.tuguia_database import TuGuiaDatabase
+
+HERE = Path(__file__).parent
+
+CATALOG = [
+    "Plomero", "Electricista", "Gasista matriculado", "Pintor", "Carpintero", "Albañil",
+    "Cerrajero", "Jardinero", "Herrero", "Techista", "Vidriero", "Mecánico",
+]
+
+
+class _Response:
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._filters = []
+        self._count = None
+        self._range = None
+
+    def select(self, *columns, count=None, head=False):
+        self._count = count
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def ilike(self, column, pattern):
+        needle = pattern.strip("%").lower()
+        self._filters.append(lambda row: needle in row[column].lower())
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row[column] == value)
+        return self
+
+    def execute(self, blocking=True):
+        self._client.request(blocking)
+        rows = [row for row in self._client.tables[self._table] if all(f(row) for f in self._filters)]
+        if self._count:
+            return _Response(data=[], count=len(rows))
+        if self._range:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        return _Response(data=rows)
+
+
+class _RPC:
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def _count(self, subcategory_id):
+        return sum(1 for r in self._client.tables["profile_subcategories"] if r["subcategory_id"] == subcategory_id)
+
+    def execute(self, blocking=True):
+        self._client.request(blocking)
+        if self._name == "count_users_by_subcategory_ids":
+            ids = {int(i) for i in self._params["ids"]}
+            return _Response(data=[{"subcategory_id": str(i), "user_count": self._count(i)} for i in ids])
+        rows = []
+        for name in self._params["names"]:
+            matches = [s for s in self._client.tables["subcategories"] if name.lower() in s["name"].lower()]
+            matches.sort(key=lambda s: (s["name"].lower() != name.lower(), len(s["name"])))
+            if not matches:
+                rows.append({"requested": name, "subcategory_id": None, "subcategory_name": None, "user_count": 0})
+                continue
+            sub = matches[0]
+            rows.append({"requested": name, "subcategory_id": sub["id"], "subcategory_name": sub["name"],
+                         "user_count": self._count(sub["id"])})
+        return _Response(data=rows)
+
+
+class SimulatedClient:
+    """Lo mínimo del cliente de Supabase que usa el conteo, con latencia fija por petición."""
+
+    def __init__(self, rtt_ms: float, profiles: int = 5000):
+        self._rtt = rtt_ms / 1000
+        self._lock = threading.Lock()
+        self.requests = 0
+        rng = np.random.default_rng(0)
+        self.tables = {
+            "subcategories": [{"id": i + 1, "name": name} for i, name in enumerate(CATALOG)],
+            "profile_subcategories": [
+                {"profile_id": p, "subcategory_id": int(s)} for p, s in enumerate(rng.integers(1, len(CATALOG) + 1, profiles))
+            ],
+        }
+
+    def request(self, blocking=True):
+        with self._lock:
+            self.requests += 1
+        if blocking:
+            time.sleep(self._rtt)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _RPC(self, name, params or {})
+
+
+class SimulatedPool:
+    """Lo que usa TuGuiaDatabase de SupabasePool: cada consulta espera la latencia sin bloquear el loop."""
+
+    def __init__(self, client: SimulatedClient):
+        self.client = client
+
+    async def execute(self, build, idempotent=False, label=""):
+        await asyncio.sleep(self.client._rtt)
+        return build(self.client).execute(blocking=False)
+
+
+def count_sequential(client, names: list) -> dict:
+    """El loop anterior a los lotes, tal cual (cliente síncrono)."""
+    results = {}
+    for subcategory_name in names:
+        subcategory_response = client.table('subcategories').select('id', 'name').ilike('name', f'%{subcategory_name}%').execute()
+        if not subcategory_response.data:
+            results[subcategory_name] = {"found": False, "count": 0, "error": "No encontrada"}
+            continue
+        subcat = subcategory_response.data[0]
+        count_response = client.table('profile_subcategories').select('profile_id', count='exact').eq('subcategory_id', subcat['id']).execute()
+        results[subcat['name']] = {"found": True, "count": count_response.count or 0}
+    return {"success": True, "results": results}
+
+
+async def time_runs(mode: str, db: TuGuiaDatabase, client, names: list, runs: int):
+    timings, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        if mode == "sequential":
+            result = count_sequential(client, names)
+        else:
+            result = await db.count_users_by_subcategory(names)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, result
+
+
+def run_mode(mode: str, db: TuGuiaDatabase, client, names: list, runs: int) -> dict:
+    if mode == "catalog":
+        db.catalog = SubcategoryCatalog(client=client)
+        db.catalog.refresh()
+    else:
+        db.catalog = None
+    # En modo concurrente se simula que las RPC no existen
+    if mode == "concurrent":
+        tuguia_database._missing_rpcs.update({tuguia_database.SUBCATEGORY_COUNT_RPC, tuguia_database.SUBCATEGORY_IDS_COUNT_RPC})
+    requests_before = getattr(client, "requests", 0)
+    timings, result = asyncio.run(time_runs(mode, db, client, names, runs))
+    tuguia_database._missing_rpcs.clear()
+
+    timings = np.array(timings)
+    requests = getattr(client, "requests", None)
+    return {
+        "mode": mode,
+        "requests": (requests - requests_before) / runs if requests is not None else None,
+        "ms_p50": round(float(np.percentile(timings, 50)), 1),
+        "ms_p95": round(float(np.percentile(timings, 95)), 1),
+        "results": result["results"] if result and result.get("success") else result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conteo por subcategoría: loop vs lotes")
+    parser.add_argument("--names", default="plomero,electricista,gasista,pintor,carpintero")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=80, help="Latencia simulada por petición")
+    parser.add_argument("--live", action="store_true", help="Usar la base real de Tu Guía")
+    parser.add_argument("--modes", default="sequential,concurrent,rpc,catalog")
+    parser.add_argument("--output", help="Ruta del JSON de salida")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.names.split(",") if n.strip()]
+    if args.live:
+        client, pool = get_tuguia_supabase(), get_tuguia_pool()
+    else:
+        client = SimulatedClient(args.rtt_ms)
+        pool = SimulatedPool(client)
+    db = TuGuiaDatabase(pool=pool)
+
+    results = {mode: run_mode(mode, db, client, names, args.runs) for mode in args.modes.split(",")}
+    # El catálogo además resuelve plurales y variantes, así que puede encontrar más
+    counts = [r["results"] for mode, r in results.items() if mode != "catalog"]
+    same = all(c == counts[0] for c in counts)
+
+    target = "Tu Guía (live)" if args.live else f"simulado, {args.rtt_ms:.0f} ms por petición"
+    print(f"\n📊 {len(names)} subcategorías, {args.runs} corridas, {target}")
+    print(f"{'modo':<11} {'peticiones':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, r in results.items():
+        requests = f"{r['requests']:.0f}" if r["requests"] is not None else "-"
+        print(f"{mode:<11} {requests:>10} {r['ms_p50']:>8.1f} {r['ms_p95']:>8.1f}")
+    print(f"\n{'✅' if same else '⚠️'} Mismos conteos en los modos con ilike: {same}")
+    if "catalog" in results:
+        found = [name for name, r in results["catalog"]["results"].items() if r.get("found")]
+        print(f"📚 Catálogo: {len(found)}/{len(names)} encontradas ({', '.join(found)})")
+
+    report = {"created_at": datetime.now().isoformat(timespec="seconds"), "args": vars(args), "results": results}
+    path = Path(args.output) if args.output else HERE / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Resultado guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
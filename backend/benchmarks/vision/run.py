@@ -0,0 +1,152 @@
+"""
+Costo de la captura de video sobre el event loop de una sesión de voz.
+
+Simula una sesión: frames de cámara a --fps mientras una tarea "de audio"
+se despierta cada 20 ms (el ritmo de los chunks de audio) y mide cuánto
+tarda en despertarse de más. Compara tres modos:
+
+  - inline: el comportamiento anterior (frombytes + resize + JPEG en el
+            event loop cada capture_interval)
+  - eager:  la misma compresión cada capture_interval, pero en el pool
+  - lazy:   solo se guarda el último frame; se comprime cuando se pide
+            (--tool-calls veces durante la sesión, como ver_camara)
+
+Reporta:
+  - tick_late_ms_p50/p99/max: retraso del tick de audio (picos = audio entrecortado)
+  - encodes / encode_cpu_s:   compresiones hechas y su tiempo de CPU
+  - process_cpu_s:            CPU total del proceso durante la sesión
+
+Uso:
+    uv run python -m benchmarks.vision.run --seconds 30 --fps 15
+    uv run python -m benchmarks.vision.run --width 1920 --height 1080 --resample bilinear
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from pipecat.frames.frames import UserImageRawFrame
+
+from app.pipeline.vision_processor import VisionCaptureProcessor
+
+HERE = Path(__file__).parent
+TICK_S = 0.02
+
+
+def _frames(width: int, height: int, n: int = 8) -> list:
+    """Algunos frames RGB distintos para que el JPEG no sea trivial."""
+    rng = np.random.default_rng(0)
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    frames = []
+    for i in range(n):
+        noise = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+        image = (np.broadcast_to(base + 10 * i, (height, width, 3)) % 256).astype(np.uint8) + noise
+        frames.append(UserImageRawFrame(image=image.tobytes(), size=(width, height), format="RGB"))
+    return frames
+
+
+async def _audio_ticker(stop: asyncio.Event, lateness: list):
+    loop = asyncio.get_running_loop()
+    expected = loop.time() + TICK_S
+    while not stop.is_set():
+        await asyncio.sleep(max(expected - loop.time(), 0))
+        lateness.append((loop.time() - expected) * 1000)
+        expected += TICK_S
+
+
+async def run_mode(mode: str, args) -> dict:
+    processor = VisionCaptureProcessor(
+        capture_interval=args.capture_interval,
+        lazy=(mode == "lazy"),
+        resample=args.resample,
+    )
+    frames = _frames(args.width, args.height)
+    total_frames = int(args.seconds * args.fps)
+    tool_at = set(np.linspace(0, total_frames - 1, args.tool_calls + 2, dtype=int)[1:-1]) if args.tool_calls else set()
+
+    stop = asyncio.Event()
+    lateness: list = []
+    ticker = asyncio.create_task(_audio_ticker(stop, lateness))
+    inline_encodes, inline_cpu = 0, 0.0
+    last_capture = 0.0
+
+    loop = asyncio.get_running_loop()
+    cpu_start = time.process_time()
+    for i in range(total_frames):
+        frame = frames[i % len(frames)]
+        if mode == "inline":
+            now = loop.time()
+            if now - last_capture >= args.capture_interval:
+                start = time.thread_time()
+                processor._compress_image(frame)
+                inline_cpu += time.thread_time() - start
+                inline_encodes += 1
+                last_capture = now
+        else:
+            processor._on_image(frame)
+        if i in tool_at:
+            if mode == "inline":
+                processor._compress_image(frame)
+            else:
+                await processor.get_image_base64()
+        await asyncio.sleep(1 / args.fps)
+
+    if processor._encoding is not None:
+        await processor._encoding
+    stop.set()
+    await ticker
+    process_cpu = time.process_time() - cpu_start
+
+    stats = processor.session_stats()
+    late = np.array(lateness)
+    return {
+        "mode": mode,
+        "frames": total_frames,
+        "ticks": len(late),
+        "tick_late_ms_p50": round(float(np.percentile(late, 50)), 2),
+        "tick_late_ms_p99": round(float(np.percentile(late, 99)), 2),
+        "tick_late_ms_max": round(float(late.max()), 2),
+        "encodes": inline_encodes if mode == "inline" else stats["encodes"],
+        "encode_cpu_s": round(inline_cpu, 3) if mode == "inline" else stats["encode_cpu_s"],
+        "process_cpu_s": round(process_cpu, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Impacto de la captura de video en el event loop")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--capture-interval", type=float, default=2.0)
+    parser.add_argument("--tool-calls", type=int, default=1, help="Veces que se pide la imagen (ver_camara)")
+    parser.add_argument("--resample", default="lanczos")
+    parser.add_argument("--modes", default="inline,eager,lazy")
+    parser.add_argument("--output", help="Ruta del JSON de salida")
+    args = parser.parse_args()
+
+    results = {mode: asyncio.run(run_mode(mode, args)) for mode in args.modes.split(",")}
+
+    print(
+        f"\n📊 Visión {args.width}x{args.height} @ {args.fps} fps, {args.seconds:.0f}s, "
+        f"intervalo {args.capture_interval}s, {args.tool_calls} pedidos, resample {args.resample}"
+    )
+    print(f"{'modo':<8} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'compresiones':>13} {'CPU comp s':>11} {'CPU proc s':>11}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<8} {r['tick_late_ms_p50']:>7.2f} {r['tick_late_ms_p99']:>7.2f} {r['tick_late_ms_max']:>7.2f} "
+            f"{r['encodes']:>13} {r['encode_cpu_s']:>11.3f} {r['process_cpu_s']:>11.3f}"
+        )
+
+    report = {"created_at": datetime.now().isoformat(timespec="seconds"), "args": vars(args), "results": results}
+    path = Path(args.output) if args.output else HERE / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n💾 Resultado guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,71 +19,180 @@ Run the bot using::
     uv run bot.py
 """
 
-import aiohttp
 import datetime
+import importlib
 import os
-import time
-
-from app.actions.conversation_handler import ConversationActionHandler
-from app.tools.bot_tools import BotTools
-from app.context import current_user_id
-from app.prompts import SYSTEM_PROMPT
-from app.pipeline.loggers import UserLogger, AssistantLogger
-from app.pipeline.vision_processor import VisionCaptureProcessor
+import sys
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
 from dotenv import load_dotenv
-from app.services.database import DatabaseService
 from loguru import logger
-import sys
+
+from app.core import profiler, tracing
+from app.core.session_manager import session_manager
+from app.core.startup import startup
 
 logger.remove()
 logger.add(sys.stderr, level="INFO", format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>")
 
 print("🚀 Starting Pipecat bot...")
-print("⏳ Loading models and imports (20 seconds, first run only)\n")
-
-logger.info("Loading Local Smart Turn Analyzer V3...")
-from pipecat.audio.turn.smart_turn.local_smart_turn_v3 import LocalSmartTurnAnalyzerV3
-
-logger.info("✅ Local Smart Turn Analyzer V3 loaded")
-logger.info("Loading Silero VAD model...")
-from pipecat.audio.vad.silero import SileroVADAnalyzer
-
-logger.info("✅ Silero VAD model loaded")
-
-from pipecat.audio.vad.vad_analyzer import VADParams
-from pipecat.frames.frames import LLMRunFrame, TextFrame, TranscriptionFrame, UserStartedSpeakingFrame, UserStoppedSpeakingFrame, StartInterruptionFrame
-
-logger.info("Loading pipeline components...")
-
-from pipecat.adapters.schemas.tools_schema import ToolsSchema
-from pipecat.pipeline.pipeline import Pipeline
-from pipecat.pipeline.runner import PipelineRunner
-from pipecat.pipeline.task import PipelineParams, PipelineTask
-from pipecat.processors.aggregators.llm_context import LLMContext
-from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair
-from pipecat.processors.frameworks.rtvi import RTVIConfig, RTVIObserver, RTVIProcessor, RTVIAction
-from pipecat.runner.types import RunnerArguments
-from pipecat.runner.utils import create_transport
-from pipecat.services.cartesia.tts import CartesiaTTSService, GenerationConfig
-from pipecat.services.deepgram.stt import DeepgramSTTService, LiveOptions
-from pipecat.services.llm_service import FunctionCallParams
-from pipecat.services.openai.llm import OpenAILLMService
-from pipecat.services.openai.tts import OpenAITTSService
-from pipecat.transcriptions.language import Language
-from pipecat.transports.base_transport import BaseTransport, TransportParams
-
-logger.info("✅ All components loaded successfully!")
 
 load_dotenv(override=True)
 
+if TYPE_CHECKING:
+    from pipecat.runner.types import RunnerArguments
+    from pipecat.transports.base_transport import BaseTransport
 
+# Módulos que usa cada sesión. No se importan al cargar bot.py (tardan varios
+# segundos entre onnxruntime, aiortc y los SDKs de cada servicio): el servidor
+# arranca primero y estos se precargan en segundo plano (ver PREWARM_TASKS).
+PIPELINE_MODULES = [
+    "pipecat.audio.vad.silero",
+    "pipecat.frames.frames",
+    "pipecat.pipeline.pipeline",
+    "pipecat.pipeline.runner",
+    "pipecat.pipeline.task",
+    "pipecat.processors.aggregators.llm_response_universal",
+    "pipecat.processors.frameworks.rtvi",
+    "pipecat.runner.utils",
+    "pipecat.services.cartesia.tts",
+    "pipecat.services.deepgram.stt",
+    "pipecat.services.openai.llm",
+    "pipecat.transports.base_transport",
+    "app.actions.conversation_handler",
+    "app.tools.bot_tools",
+    "app.tools.runtime",
+    "app.pipeline.loggers",
+    "app.pipeline.vision_processor",
+    "app.pipeline.context_hooks",
+    "app.pipeline.context_images",
+    "app.pipeline.context_compactor",
+    "app.pipeline.speculative_rag",
+    "app.pipeline.latency",
+    "app.pipeline.tts_cache",
+    "app.pipeline.tool_filler",
+    "app.pipeline.model_runtime",
+    "app.services.database",
+]
+
+
+def _import_pipeline_modules():
+    for name in PIPELINE_MODULES:
+        importlib.import_module(name)
+
+
+# Smart Turn V3 decide el fin de turno con un modelo además del silencio del VAD
+SMART_TURN_ENABLED = os.getenv("SMART_TURN_ENABLED", "false").lower() == "true"
+
+
+def _load_vad_model():
+    """Carga el modelo ONNX de Silero en el runtime compartido (una vez por proceso)."""
+    from app.pipeline.model_runtime import get_model_runtime
+
+    get_model_runtime().silero_session()
+
+
+def _load_smart_turn_model():
+    from app.pipeline.model_runtime import get_model_runtime
+
+    get_model_runtime().smart_turn()
+
+
+def _load_tokenizer():
+    """Tokenizer del compactador de contexto y de las memorias (puede descargar el BPE la primera vez)."""
+    from app.core.tokens import get_encoding
+
+    get_encoding()
+
+
+def _load_tts_cache():
+    """Índice de la caché de audio en disco (evita recorrer el directorio en la primera llamada)."""
+    from app.pipeline.tts_cache import get_tts_cache
+
+    get_tts_cache()
+
+
+def _refresh_tuguia_user_count():
+    """Primer conteo de usuarios de Tu Guía en segundo plano (no demora la readiness)."""
+    from app.services.tuguia_user_count import get_user_counter
+
+    get_user_counter().refresh_in_background()
+
+
+def _refresh_subcategory_catalog():
+    """Carga el catálogo de subcategorías en segundo plano (la primera búsqueda no espera la red)."""
+    from app.services.subcategory_catalog import get_subcategory_catalog
+
+    get_subcategory_catalog().refresh_in_background()
+
+
+PREWARM_TASKS = [
+    ("imports.pipeline", _import_pipeline_modules),
+    ("models.silero_vad", _load_vad_model),
+    ("models.tokenizer", _load_tokenizer),
+    ("tts.cache", _load_tts_cache),
+    ("tuguia.user_count", _refresh_tuguia_user_count),
+    ("tuguia.subcategories", _refresh_subcategory_catalog),
+]
+if SMART_TURN_ENABLED:
+    PREWARM_TASKS.append(("models.smart_turn", _load_smart_turn_model))
+
+
+async def reject_busy(runner_args: "RunnerArguments"):
+    """Corta enseguida una conexión que no entra por capacidad."""
+    connection = getattr(runner_args, "webrtc_connection", None)
+    if connection is None:
+        return
+    # Llega al cliente solo si el data channel ya está abierto; si no, ve la conexión cerrada
+    connection.send_app_message({
+        "label": "rtvi-ai",
+        "type": "server-message",
+        "data": {"type": "busy", "message": "El servidor está ocupado, intenta de nuevo en unos segundos."},
+    })
+    await connection.disconnect()
+
+
+async def run_bot(transport: "BaseTransport", runner_args: "RunnerArguments", session=None):
+    from pipecat.adapters.schemas.tools_schema import ToolsSchema
+    from pipecat.frames.frames import StartInterruptionFrame, TranscriptionFrame, UserStartedSpeakingFrame, UserStoppedSpeakingFrame
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.pipeline.task import PipelineParams, PipelineTask
+    from pipecat.processors.aggregators.llm_context import LLMContext
+    from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair
+    from pipecat.processors.frameworks.rtvi import RTVIAction, RTVIConfig, RTVIObserver, RTVIProcessor
+    from pipecat.services.cartesia.tts import GenerationConfig
+    from pipecat.services.deepgram.stt import DeepgramSTTService, LiveOptions
+    from pipecat.services.openai.llm import OpenAILLMService
+    from pipecat.transcriptions.language import Language
 
-async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
+    from app.actions.conversation_handler import ConversationActionHandler
+    from app.pipeline.context_compactor import ContextCompactor
+    from app.pipeline.context_hooks import ContextHookProcessor
+    from app.pipeline.context_images import ContextImageManager
+    from app.pipeline.latency import LatencyObserver
+    from app.pipeline.loggers import AssistantLogger, UserLogger
+    from app.pipeline.speculative_rag import SpeculativeRAGProcessor
+    from app.pipeline.tool_filler import ToolFillerProcessor
+    from app.pipeline.tts_cache import CachedCartesiaTTSService
+    from app.pipeline.vision_processor import VisionCaptureProcessor
+    from app.prompts import SYSTEM_PROMPT
+    from app.services.database import DatabaseService
+    from app.tools.bot_tools import BotTools
+    from app.tools.runtime import get_tool_runtime
 
     logger.info(f"Starting bot")
+    # Span de toda la llamada: padre de los turnos, las herramientas y las consultas
+    session_span = tracing.start_span("voice.session", kind="server", **{"session.transport": type(transport).__name__})
     db_service = DatabaseService()
     vision_processor = VisionCaptureProcessor(capture_interval=2.0)
-    bot_tools = BotTools(db_service, vision_processor)
+    speculative_rag = None
+    if os.getenv("SPECULATIVE_RAG_ENABLED", "true").lower() == "true":
+        speculative_rag = SpeculativeRAGProcessor()
+    # Deadline y concurrencia de las herramientas (ver /tools)
+    tool_runtime = get_tool_runtime()
+    bot_tools = BotTools(db_service, vision_processor, speculative_rag=speculative_rag)
     user_logger = UserLogger(db_service)
     assistant_logger = AssistantLogger(db_service)
     
@@ -101,11 +210,12 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
         live_options=live_options,
     )
 
-    tts = CartesiaTTSService(
+    # Las frases repetidas (saludos, confirmaciones) se reproducen desde la caché
+    tts = CachedCartesiaTTSService(
         api_key=os.getenv("CARTESIA_API_KEY"),
         voice_id="5c5ad5e7-1020-476b-8b91-fdcbe9cc313c", # Voz: Daniela (Mexicana/Latina)
         model="sonic-multilingual",
-        params=CartesiaTTSService.InputParams(
+        params=CachedCartesiaTTSService.InputParams(
             generation_config=GenerationConfig(
                 emotion="positivity:high",
                 speed=1.0
@@ -135,7 +245,7 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     # registrar la funcion de busqueda 
     llm.register_function(
         "buscar_informacion",
-        bot_tools.buscar_informacion,
+        tool_runtime.wrap("buscar_informacion", bot_tools.buscar_informacion),
         start_callback=None,
         cancel_on_interruption=False
     )
@@ -143,7 +253,7 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     # registrar la funcion de contar usuarios de Tu Guia
     llm.register_function(
         "contar_usuarios_tuguia",
-        bot_tools.contar_usuarios_tuguia,
+        tool_runtime.wrap("contar_usuarios_tuguia", bot_tools.contar_usuarios_tuguia),
         start_callback=None,
         cancel_on_interruption=False
     )
@@ -151,7 +261,7 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     # registrar la funcion de crear usuarios en Tu Guía
     llm.register_function(
         "crear_usuario_tuguia",
-        bot_tools.crear_usuario_tuguia,
+        tool_runtime.wrap("crear_usuario_tuguia", bot_tools.crear_usuario_tuguia),
         start_callback=None,
         cancel_on_interruption=False
     )
@@ -159,21 +269,21 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     # registrar la funcion de contar usuarios por subcategoria
     llm.register_function(
         "contar_usuarios_por_subcategoria",
-        bot_tools.contar_usuarios_por_subcategoria,
+        tool_runtime.wrap("contar_usuarios_por_subcategoria", bot_tools.contar_usuarios_por_subcategoria),
         start_callback=None,
         cancel_on_interruption=False
     )
 
     # guardar en memoria
-    llm.register_function("guardar_dato", bot_tools.guardar_dato)
+    llm.register_function("guardar_dato", tool_runtime.wrap("guardar_dato", bot_tools.guardar_dato))
 
     # borrar de memoria
-    llm.register_function("borrar_dato", bot_tools.borrar_dato)
+    llm.register_function("borrar_dato", tool_runtime.wrap("borrar_dato", bot_tools.borrar_dato))
 
     # registrar la funcion de ver camara
     llm.register_function(
         "ver_camara",
-        bot_tools.ver_camara,
+        tool_runtime.wrap("ver_camara", bot_tools.ver_camara),
         start_callback=None,
         cancel_on_interruption=False
     )
@@ -188,7 +298,12 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
     context = LLMContext(messages, tools=tools)
     context_aggregator = LLMContextAggregatorPair(context)
     bot_tools.set_context(context)
-    conversation_handler = ConversationActionHandler(db_service, context)
+    conversation_handler = ConversationActionHandler(db_service, context, trace_span=session_span)
+    # Solo las últimas imágenes quedan en línea; las anteriores pasan a descripción
+    context_images = ContextImageManager(context)
+    # Los turnos viejos se resumen en segundo plano cuando el contexto crece
+    context_compactor = ContextCompactor(context)
+    context_hooks = [context_images, context_compactor]
     rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
     
     action = RTVIAction(
@@ -201,20 +316,41 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
 
     rtvi.register_action(action)
 
-    pipeline = Pipeline(
-        [
-            transport.input(),  # Microfono
-            vision_processor, # frames de video
-            rtvi,  # RTVI processor
-            stt, # Audio -> Texto (User)
-            user_logger, # capturar user
-            context_aggregator.user(),  # Agregar user al contexto
-            llm,  # Contexto -> Texto (Assistant)
-            assistant_logger, # capturar asistente
-            tts,  # Texto -> Audio
-            transport.output(),  # Altavoz
-            context_aggregator.assistant(),  # Agrega assistant al contexto
-        ]
+    transport_output = transport.output()
+    # Frase corta mientras una herramienta lenta trabaja (ver /tools/fillers)
+    tool_filler = ToolFillerProcessor(tts)
+    processors = [
+        transport.input(),  # Microfono
+        vision_processor, # frames de video
+        rtvi,  # RTVI processor
+        stt, # Audio -> Texto (User)
+    ]
+    if speculative_rag:
+        processors.append(speculative_rag) # RAG adelantado con transcripciones parciales
+    processors += [
+        user_logger, # capturar user
+        context_aggregator.user(),  # Agregar user al contexto
+        ContextHookProcessor(context_hooks),  # Ajustes del contexto (turnos del usuario)
+        llm,  # Contexto -> Texto (Assistant)
+        ContextHookProcessor(context_hooks, turn_events=True),  # Contexto tras herramientas (va hacia arriba) y fin de turno
+        assistant_logger, # capturar asistente
+        tts,  # Texto -> Audio
+        tool_filler,  # Relleno de audio durante herramientas lentas
+        transport_output,  # Altavoz
+        context_aggregator.assistant(),  # Agrega assistant al contexto
+    ]
+
+    pipeline = Pipeline(processors)
+
+    # Latencia voz a voz por turno (ver /latency en el servidor de operaciones)
+    latency_observer = LatencyObserver(
+        stt=stt,
+        llm=llm,
+        tts=tts,
+        transport_output=transport_output,
+        filler=tool_filler,
+        db_service=db_service,
+        trace_span=session_span,
     )
 
     task = PipelineTask(
@@ -224,10 +360,12 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
             enable_metrics=True,
             enable_usage_metrics=True,
         ),
-        observers=[RTVIObserver(rtvi)],
+        observers=[RTVIObserver(rtvi), latency_observer],
     )
 
     conversation_handler.set_task(task)
+    if session is not None:
+        session_manager.register_task(session, task)
 
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, client):
@@ -309,23 +447,58 @@ async def run_bot(transport: BaseTransport, runner_args: RunnerArguments):
 
     runner = PipelineRunner(handle_sigint=runner_args.handle_sigint)
 
-    await runner.run(task)
+    try:
+        with tracing.use_span(session_span):
+            await runner.run(task)
+            # Mensajes del transcript que quedaron encolados para la base
+            await db_service.flush()
+    finally:
+        session_span.set_attribute("conversation_id", db_service.conversation_id)
+        session_span.end()
 
 
-async def bot(runner_args: RunnerArguments):
+async def bot(runner_args: "RunnerArguments"):
     """Main bot entry point for the bot starter."""
+    # Normalmente ya lo registró el arranque del runner; no hace nada si es el mismo loop
+    profiler.register_loop()
+
+    # Admisión: si el proceso ya tiene MAX_CONCURRENT_SESSIONS llamadas, cortar enseguida
+    connection = getattr(runner_args, "webrtc_connection", None)
+    session = session_manager.try_acquire(getattr(connection, "pc_id", None))
+    if session is None:
+        await reject_busy(runner_args)
+        return
+
+    try:
+        await _start_session(runner_args, session)
+    finally:
+        session_manager.release(session)
+
+
+async def _start_session(runner_args: "RunnerArguments", session):
+    from pipecat.audio.vad.vad_analyzer import VADParams
+    from pipecat.runner.utils import create_transport
+    from pipecat.transports.base_transport import TransportParams
+
+    from app.pipeline.model_runtime import create_turn_analyzer, create_vad_analyzer
+
+    if not startup.ready:
+        logger.warning("⚠️ Sesión iniciada antes de terminar la precarga; esta primera conexión será más lenta")
 
-    vad_analyzer = SileroVADAnalyzer(params=VADParams(
+    # Modelos compartidos por todas las sesiones del proceso (ver model_runtime)
+    vad_analyzer = create_vad_analyzer(params=VADParams(
         confidence=0.8, # Sensibilidad mas baja (requiere voz mas clara)
         min_speech_duration_ms=300, # Ignorar ruidos cortos (clicks, golpes)
         min_silence_duration_ms=500
     ))
+    turn_analyzer = create_turn_analyzer() if SMART_TURN_ENABLED else None
 
     transport_params = {
         "daily": lambda: DailyParams(
             audio_in_enabled=True,
             audio_out_enabled=True,
             vad_analyzer=vad_analyzer,
+            turn_analyzer=turn_analyzer,
             transcription_enabled=True,
         ),
         "webrtc": lambda: TransportParams(
@@ -333,6 +506,7 @@ async def bot(runner_args: RunnerArguments):
             audio_out_enabled=True,
             camera_in_enabled=True,
             vad_analyzer=vad_analyzer,
+            turn_analyzer=turn_analyzer,
             ice_servers=[
                 {"urls": ["stun:stun.l.google.com:19302", "stun:stun1.l.google.com:19302"]},
             ],
@@ -341,10 +515,50 @@ async def bot(runner_args: RunnerArguments):
 
     transport = await create_transport(runner_args, transport_params)
 
-    await run_bot(transport, runner_args)
+    await run_bot(transport, runner_args, session)
+
+
+def register_loop_on_startup(runner):
+    """
+    Registra el loop del runner en el profiler apenas arranca el servidor, así
+    /debug/tasks y /debug/loop-lag funcionan en un worker sin llamadas.
+
+    `pipecat.runner.run` no expone un hook de arranque: se envuelve la creación
+    de la app para sumarle un lifespan. Si la versión de Pipecat no tiene esas
+    funciones el loop se registra en la primera sesión, como antes.
+    """
+    create_app = getattr(runner, "_create_server_app", None)
+    add_lifespan = getattr(runner, "_add_lifespan_to_app", None)
+    if create_app is None or add_lifespan is None:
+        logger.warning("⚠️ El runner de Pipecat no permite engancharse al arranque; el loop se registra en la primera sesión")
+        return
+
+    @asynccontextmanager
+    async def profiler_lifespan(app):
+        profiler.register_loop()
+        yield
+
+    def create_server_app(**kwargs):
+        app = create_app(**kwargs)
+        add_lifespan(app, profiler_lifespan)
+        return app
+
+    runner._create_server_app = create_server_app
 
 
 if __name__ == "__main__":
-    from pipecat.runner.run import main
+    from app.core.ops_server import start_ops_server
+
+    tracing.configure(service_name="voice-bot")
+    start_ops_server()
+    if os.getenv("STARTUP_PREWARM", "true").lower() == "true":
+        startup.prewarm(PREWARM_TASKS)
+    else:
+        # Sin precarga: cada import se paga en la primera sesión
+        startup.mark_ready()
+
+    with startup.phase("imports.runner"):
+        import pipecat.runner.run as pipecat_runner
 
-    main()
+    register_loop_on_startup(pipecat_runner)
+    pipecat_runner.main()
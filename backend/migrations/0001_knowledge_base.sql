@@ -0,0 +1,43 @@
+-- ============================================
+-- TABLA: knowledge_base
+-- Chunks de documentos con su embedding (text-embedding-3-small, 1536 dims).
+-- La escriben la ruta upload-knowledge del frontend (RPC insert_knowledge_chunk)
+-- y app/services/ingestion.py.
+-- ============================================
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS knowledge_base (
+  id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  document_name TEXT NOT NULL,
+  document_type TEXT,
+  chunk_text TEXT NOT NULL,
+  chunk_index INTEGER NOT NULL DEFAULT 0,
+  embedding VECTOR(1536),
+  metadata JSONB NOT NULL DEFAULT '{}'::jsonb,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Listado y borrado por documento (panel de admin, re-indexado)
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_document_name ON knowledge_base(document_name);
+
+-- ============================================
+-- RPC: insert_knowledge_chunk (usada por el frontend)
+-- ============================================
+CREATE OR REPLACE FUNCTION insert_knowledge_chunk(
+  p_document_name TEXT,
+  p_document_type TEXT,
+  p_chunk_text TEXT,
+  p_chunk_index INTEGER,
+  p_embedding VECTOR(1536),
+  p_metadata JSONB DEFAULT '{}'::jsonb
+)
+RETURNS BIGINT AS $$
+DECLARE
+  new_id BIGINT;
+BEGIN
+  INSERT INTO knowledge_base (document_name, document_type, chunk_text, chunk_index, embedding, metadata)
+  VALUES (p_document_name, p_document_type, p_chunk_text, p_chunk_index, p_embedding, COALESCE(p_metadata, '{}'::jsonb))
+  RETURNING id INTO new_id;
+  RETURN new_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
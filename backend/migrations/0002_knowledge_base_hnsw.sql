@@ -0,0 +1,16 @@
+-- ============================================
+-- Índice ANN para la búsqueda semántica
+-- Sin este índice cada búsqueda es un scan secuencial que calcula la
+-- distancia contra todos los chunks. HNSW no necesita entrenarse con datos
+-- (a diferencia de IVFFlat) y se mantiene bien con inserts incrementales.
+--
+-- m / ef_construction: valores por defecto de pgvector; subirlos mejora el
+-- recall a cambio de un índice más lento de construir. El parámetro de
+-- búsqueda (hnsw.ef_search) se ajusta por consulta desde match_documents.
+-- ============================================
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_embedding_hnsw
+  ON knowledge_base USING hnsw (embedding vector_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- Filtros por metadata en match_documents (metadata @> '{...}')
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_metadata ON knowledge_base USING gin (metadata jsonb_path_ops);
@@ -0,0 +1,61 @@
+-- ============================================
+-- RPC: match_documents con filtros opcionales
+--
+-- - filter_documents: solo busca en esos document_name
+-- - filter_metadata: solo chunks cuya metadata contiene ese JSON
+-- - ef_search: tamaño de la lista de candidatos de HNSW (más alto = mejor
+--   recall, más lento). NULL deja el valor de la sesión (40 por defecto).
+--
+-- La consulta interna ordena por distancia con LIMIT para que Postgres use
+-- el índice HNSW; el umbral se aplica después. Con filtros, iterative_scan
+-- (pgvector >= 0.8) sigue recorriendo el índice hasta llenar el LIMIT en vez
+-- de devolver menos filas; en versiones anteriores el ajuste se ignora.
+--
+-- Devuelve solo las columnas que usa el backend (sin el vector ni metadata).
+-- Los nuevos parámetros tienen DEFAULT, así que las llamadas con
+-- (query_embedding, match_threshold, match_count) siguen funcionando.
+-- ============================================
+DROP FUNCTION IF EXISTS match_documents(VECTOR, FLOAT, INT);
+
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding VECTOR(1536),
+  match_threshold FLOAT,
+  match_count INT,
+  filter_documents TEXT[] DEFAULT NULL,
+  filter_metadata JSONB DEFAULT NULL,
+  ef_search INT DEFAULT NULL
+)
+RETURNS TABLE (
+  id BIGINT,
+  document_name TEXT,
+  chunk_index INTEGER,
+  chunk_text TEXT,
+  similarity FLOAT
+) AS $$
+BEGIN
+  IF ef_search IS NOT NULL THEN
+    PERFORM set_config('hnsw.ef_search', ef_search::TEXT, true);
+  END IF;
+  IF filter_documents IS NOT NULL OR filter_metadata IS NOT NULL THEN
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  END IF;
+
+  RETURN QUERY
+  SELECT c.id, c.document_name, c.chunk_index, c.chunk_text, c.similarity
+  FROM (
+    SELECT
+      kb.id,
+      kb.document_name,
+      kb.chunk_index,
+      kb.chunk_text,
+      1 - (kb.embedding <=> query_embedding) AS similarity
+    FROM knowledge_base kb
+    WHERE (filter_documents IS NULL OR kb.document_name = ANY(filter_documents))
+      AND (filter_metadata IS NULL OR kb.metadata @> filter_metadata)
+    ORDER BY kb.embedding <=> query_embedding
+    LIMIT match_count
+  ) c
+  WHERE c.similarity > match_threshold
+  ORDER BY c.similarity DESC;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,83 @@
+-- ============================================
+-- Perfiles de embedding reducidos (app/services/embedding_profile.py)
+--
+-- Cada perfil tiene su columna halfvec `embedding_<perfil>`, su índice HNSW
+-- y su RPC `match_documents_<perfil>` con la misma firma que
+-- match_documents. pgvector no tiene tipo int8: los perfiles *_i8 guardan
+-- en halfvec los valores ya cuantizados (el coseno no depende de la escala).
+-- ============================================
+DO $migration$
+DECLARE
+  profile RECORD;
+BEGIN
+  FOR profile IN
+    SELECT * FROM (VALUES
+      ('d1536_f16', 1536),
+      ('d768_f16', 768),
+      ('d512_f16', 512),
+      ('d512_i8', 512),
+      ('d256_i8', 256)
+    ) AS p(name, dims)
+  LOOP
+    EXECUTE format(
+      'ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS embedding_%s HALFVEC(%s)',
+      profile.name, profile.dims
+    );
+    EXECUTE format(
+      'CREATE INDEX IF NOT EXISTS idx_knowledge_base_embedding_%1$s_hnsw
+         ON knowledge_base USING hnsw (embedding_%1$s halfvec_cosine_ops)
+         WITH (m = 16, ef_construction = 64)',
+      profile.name
+    );
+    EXECUTE format(
+      'DROP FUNCTION IF EXISTS match_documents_%s(HALFVEC, FLOAT, INT)',
+      profile.name
+    );
+    EXECUTE format($fn$
+      CREATE OR REPLACE FUNCTION match_documents_%1$s(
+        query_embedding HALFVEC(%2$s),
+        match_threshold FLOAT,
+        match_count INT,
+        filter_documents TEXT[] DEFAULT NULL,
+        filter_metadata JSONB DEFAULT NULL,
+        ef_search INT DEFAULT NULL
+      )
+      RETURNS TABLE (
+        id BIGINT,
+        document_name TEXT,
+        chunk_index INTEGER,
+        chunk_text TEXT,
+        similarity FLOAT
+      ) AS $body$
+      BEGIN
+        IF ef_search IS NOT NULL THEN
+          PERFORM set_config('hnsw.ef_search', ef_search::TEXT, true);
+        END IF;
+        IF filter_documents IS NOT NULL OR filter_metadata IS NOT NULL THEN
+          PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+        END IF;
+
+        RETURN QUERY
+        SELECT c.id, c.document_name, c.chunk_index, c.chunk_text, c.similarity
+        FROM (
+          SELECT
+            kb.id,
+            kb.document_name,
+            kb.chunk_index,
+            kb.chunk_text,
+            1 - (kb.embedding_%1$s <=> query_embedding) AS similarity
+          FROM knowledge_base kb
+          WHERE kb.embedding_%1$s IS NOT NULL
+            AND (filter_documents IS NULL OR kb.document_name = ANY(filter_documents))
+            AND (filter_metadata IS NULL OR kb.metadata @> filter_metadata)
+          ORDER BY kb.embedding_%1$s <=> query_embedding
+          LIMIT match_count
+        ) c
+        WHERE c.similarity > match_threshold
+        ORDER BY c.similarity DESC;
+      END;
+      $body$ LANGUAGE plpgsql
+    $fn$, profile.name, profile.dims);
+  END LOOP;
+END
+$migration$;
@@ -0,0 +1,22 @@
+-- ============================================
+-- TABLA: turn_latency
+-- Latencia voz a voz de cada turno y su desglose por etapa, escrita por
+-- app/pipeline/latency.py cuando LATENCY_PERSIST=true. Los valores son ms
+-- (NULL si la etapa no ocurrió en ese turno, ej. sin herramientas).
+-- ============================================
+CREATE TABLE IF NOT EXISTS turn_latency (
+  id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  conversation_id UUID REFERENCES conversations(id) ON DELETE CASCADE,
+  turn_index INTEGER NOT NULL,
+  voice_to_voice_ms REAL,
+  stt_ms REAL,
+  llm_ms REAL,
+  tools_ms REAL,
+  tts_ms REAL,
+  transport_ms REAL,
+  tool_calls JSONB NOT NULL DEFAULT '[]'::jsonb,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_turn_latency_conversation_id ON turn_latency(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_turn_latency_created_at ON turn_latency(created_at DESC);
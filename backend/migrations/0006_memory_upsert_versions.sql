@@ -0,0 +1,62 @@
+-- ============================================
+-- MEMORIA: upsert por (user_id, key) y versiones por scope
+-- app/services/memory_store.py guarda los datos de user_memory con un solo
+-- upsert ON CONFLICT (user_id, key), que necesita un índice único. Antes de
+-- crearlo se borran los duplicados que pudo dejar el select + insert anterior
+-- (se conserva la fila más nueva).
+-- ============================================
+DELETE FROM user_memory older
+USING user_memory newer
+WHERE older.user_id = newer.user_id
+  AND older.key = newer.key
+  AND older.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_memory_user_id_key ON user_memory(user_id, key);
+
+-- ============================================
+-- TABLA: memory_versions
+-- Una versión por scope ('global' para shared_memory, el user_id para
+-- user_memory) que suben los triggers de abajo en cada cambio. La caché de
+-- memoria la consulta al vencer su TTL y solo relee el scope si cambió.
+-- ============================================
+CREATE TABLE IF NOT EXISTS memory_versions (
+  scope TEXT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Solo el backend (service_role, que ignora RLS) la lee y escribe
+ALTER TABLE memory_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION bump_memory_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  changed_scope TEXT;
+BEGIN
+  IF TG_TABLE_NAME = 'shared_memory' THEN
+    changed_scope := 'global';
+  ELSIF TG_OP = 'DELETE' THEN
+    changed_scope := OLD.user_id::TEXT;
+  ELSE
+    changed_scope := NEW.user_id::TEXT;
+  END IF;
+
+  INSERT INTO memory_versions (scope, version) VALUES (changed_scope, 1)
+  ON CONFLICT (scope) DO UPDATE
+    SET version = memory_versions.version + 1,
+        updated_at = NOW();
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_user_memory_version ON user_memory;
+CREATE TRIGGER trg_user_memory_version
+  AFTER INSERT OR UPDATE OR DELETE ON user_memory
+  FOR EACH ROW EXECUTE FUNCTION bump_memory_version();
+
+DROP TRIGGER IF EXISTS trg_shared_memory_version ON shared_memory;
+CREATE TRIGGER trg_shared_memory_version
+  AFTER INSERT OR UPDATE OR DELETE ON shared_memory
+  FOR EACH ROW EXECUTE FUNCTION bump_memory_version();
@@ -0,0 +1,15 @@
+-- ============================================
+-- MEMORIA: embedding y datos fijos
+-- app/services/memory_selection.py ya no inyecta todas las memorias en el
+-- prompt: elige las más parecidas al mensaje actual. El embedding de cada
+-- dato se calcula una sola vez, al guardarlo (memory_store.py).
+--
+-- La columna no fija dimensiones: sigue al perfil de EMBEDDING_PROFILE y los
+-- vectores de otro tamaño se ignoran (se recalculan en memoria). `pinned`
+-- marca los datos que se inyectan siempre, sin importar el mensaje.
+-- ============================================
+ALTER TABLE shared_memory ADD COLUMN IF NOT EXISTS embedding VECTOR;
+ALTER TABLE shared_memory ADD COLUMN IF NOT EXISTS pinned BOOLEAN NOT NULL DEFAULT FALSE;
+
+ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS embedding VECTOR;
+ALTER TABLE user_memory ADD COLUMN IF NOT EXISTS pinned BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,21 @@
+-- ============================================
+-- FUNCIÓN: tuguia_user_count
+-- Total de usuarios de Tu Guía contado en la base, sin bajar los usuarios
+-- por la API de administración. La usa app/services/tuguia_user_count.py.
+-- Solo la puede ejecutar service_role (lee auth.users).
+--
+-- Se aplica sobre la base de Tu Guía, no la principal:
+--   uv run python -m app.services.migrations --dir migrations/tuguia --database-url "$TUGUIA_DATABASE_URL"
+-- ============================================
+CREATE OR REPLACE FUNCTION public.tuguia_user_count()
+RETURNS BIGINT
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+  SELECT count(*) FROM auth.users;
+$$;
+
+REVOKE ALL ON FUNCTION public.tuguia_user_count() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.tuguia_user_count() TO service_role;
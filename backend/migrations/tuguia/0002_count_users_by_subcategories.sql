@@ -0,0 +1,45 @@
+-- ============================================
+-- FUNCIÓN: count_users_by_subcategories
+-- Resuelve varios nombres de subcategoría y cuenta sus perfiles en una sola
+-- llamada (antes: un ilike + un count por nombre, en serie). La usa
+-- TuGuiaDatabase.count_users_by_subcategory.
+--
+-- Por cada nombre pedido devuelve una fila, en el mismo orden. Si ninguna
+-- subcategoría coincide, subcategory_id es NULL. Entre varias coincidencias
+-- gana la exacta y después la de nombre más corto.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.count_users_by_subcategories(names TEXT[])
+RETURNS TABLE (
+  requested TEXT,
+  subcategory_id TEXT,
+  subcategory_name TEXT,
+  user_count BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    r.requested,
+    s.id::TEXT,
+    s.name,
+    CASE WHEN s.id IS NULL THEN 0 ELSE (
+      SELECT count(*) FROM public.profile_subcategories ps WHERE ps.subcategory_id = s.id
+    ) END
+  FROM unnest(names) WITH ORDINALITY AS r(requested, ord)
+  LEFT JOIN LATERAL (
+    SELECT sc.id, sc.name
+    FROM public.subcategories sc
+    -- % y _ del texto pedido se buscan literalmente
+    WHERE sc.name ILIKE '%' || replace(replace(replace(r.requested, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+    ORDER BY lower(sc.name) = lower(r.requested) DESC, length(sc.name), sc.id
+    LIMIT 1
+  ) s ON TRUE
+  ORDER BY r.ord;
+$$;
+
+REVOKE ALL ON FUNCTION public.count_users_by_subcategories(TEXT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.count_users_by_subcategories(TEXT[]) TO service_role;
+
+-- El count por subcategoría no debe recorrer toda la tabla
+CREATE INDEX IF NOT EXISTS idx_profile_subcategories_subcategory_id
+  ON public.profile_subcategories(subcategory_id);
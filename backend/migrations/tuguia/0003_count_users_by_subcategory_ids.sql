@@ -0,0 +1,23 @@
+-- ============================================
+-- FUNCIÓN: count_users_by_subcategory_ids
+-- Perfiles por subcategoría para ids ya resueltos (el catálogo local de
+-- app/services/subcategory_catalog.py resuelve los nombres sin ir a la base).
+-- Una fila por id que tenga perfiles; los que no aparecen tienen 0.
+-- ============================================
+CREATE OR REPLACE FUNCTION public.count_users_by_subcategory_ids(ids TEXT[])
+RETURNS TABLE (
+  subcategory_id TEXT,
+  user_count BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT ps.subcategory_id::TEXT, count(*)
+  FROM public.profile_subcategories ps
+  -- Se compara contra los ids reales de subcategories para que use el índice de ps
+  WHERE ps.subcategory_id IN (SELECT sc.id FROM public.subcategories sc WHERE sc.id::TEXT = ANY(ids))
+  GROUP BY ps.subcategory_id;
+$$;
+
+REVOKE ALL ON FUNCTION public.count_users_by_subcategory_ids(TEXT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.count_users_by_subcategory_ids(TEXT[]) TO service_role;
@@ -2,19 +2,61 @@
 Script para iniciar AMBOS servidores con un solo comando.
 - Servidor de voz (Pipecat WebRTC) en puerto 7860
 - Servidor de chat texto (FastAPI) en puerto 7861
+
+Con `--supervise` corre como supervisor (app/core/supervisor.py): varios
+workers de voz detrás del puerto 7860 (`--voice-workers N` o VOICE_WORKERS),
+chequeos de vida, reinicio con backoff, drenado de llamadas con SIGTERM y
+estado agregado en http://localhost:7862/status.
 """
+import argparse
 import subprocess
 import sys
 import os
 import signal
+import threading
+import time
+import urllib.request
+
+OPS_PORT = int(os.getenv("OPS_PORT", 7862))
+READY_TIMEOUT = float(os.getenv("STARTUP_READY_TIMEOUT", 120))
+
+def wait_for_voice_ready(launched_at: float):
+    """Espera a que el bot de voz responda 200 en /ready e informa el tiempo de arranque."""
+    url = f"http://127.0.0.1:{OPS_PORT}/ready"
+    while time.time() - launched_at < READY_TIMEOUT:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    print(f"✅ Servidor de voz listo en {time.time() - launched_at:.1f}s "
+                          f"(detalle: http://localhost:{OPS_PORT}/startup)")
+                    return
+        except Exception:
+            pass
+        time.sleep(0.25)
+    print(f"⚠️ El servidor de voz no reportó /ready después de {READY_TIMEOUT:.0f}s")
 
 def main():
     # Directorio actual
     cwd = os.path.dirname(os.path.abspath(__file__))
 
+    parser = argparse.ArgumentParser(description="Inicia el servidor de voz y la API de chat")
+    parser.add_argument("--supervise", action="store_true", help="Supervisar los procesos (reinicio, drenado, varios workers de voz)")
+    parser.add_argument("--voice-workers", type=int, help="Procesos de voz con --supervise (por defecto VOICE_WORKERS o 1)")
+    args = parser.parse_args()
+
+    if args.supervise:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        from app.core.supervisor import VOICE_WORKERS, run_supervised
+
+        run_supervised(cwd, voice_workers=args.voice_workers or VOICE_WORKERS)
+        return
+
     print("🚀 Iniciando servidores de Bot Sonora...")
     print("   - Voz (Pipecat): http://localhost:7860")
     print("   - Chat texto: http://localhost:7861")
+    print(f"   - Estado del bot de voz: http://localhost:{OPS_PORT}/ready")
     print("   Presiona Ctrl+C para detener ambos.\n")
 
     # Iniciar ambos procesos
@@ -22,11 +64,14 @@ def main():
     
     try:
         # Servidor de voz (Pipecat) - con host 0.0.0.0 para Docker
+        launched_at = time.time()
         p1 = subprocess.Popen(
             [sys.executable, "bot.py", "--host", "0.0.0.0"],
             cwd=cwd,
+            env={**os.environ, "STARTUP_LAUNCHED_AT": str(launched_at)},
         )
         processes.append(p1)
+        threading.Thread(target=wait_for_voice_ready, args=(launched_at,), daemon=True).start()
         
         # Servidor de chat texto
         p2 = subprocess.Popen(
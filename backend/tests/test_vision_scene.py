@@ -0,0 +1,33 @@
+import numpy as np
+from pipecat.frames.frames import UserImageRawFrame
+
+from app.pipeline.vision_processor import SCENE_THUMB_SIZE, scene_changed, scene_signature
+
+
+def _frame(width: int, height: int, value: int = 0, channels: int = 3) -> UserImageRawFrame:
+    image = np.full((height, width, channels), value, dtype=np.uint8)
+    return UserImageRawFrame(user_id="test", image=image.tobytes(), size=(width, height), format="RGB")
+
+
+def test_small_frame_signature_has_no_nan():
+    # Menos de 4 * SCENE_THUMB_SIZE de lado: el submuestreo dejaba bloques vacíos (NaN)
+    signature = scene_signature(_frame(40, 30))
+    assert signature.shape == (SCENE_THUMB_SIZE, SCENE_THUMB_SIZE)
+    assert not np.isnan(signature).any()
+
+
+def test_small_frame_detects_change():
+    assert scene_changed(scene_signature(_frame(40, 30, 0)), scene_signature(_frame(40, 30, 255)))
+    assert not scene_changed(scene_signature(_frame(40, 30, 90)), scene_signature(_frame(40, 30, 90)))
+
+
+def test_tiny_frame_counts_as_changed():
+    signature = scene_signature(_frame(8, 8))
+    assert signature is None
+    assert scene_changed(signature, signature)
+
+
+def test_rgba_frame():
+    signature = scene_signature(_frame(640, 480, 120, channels=4))
+    assert signature.shape == (SCENE_THUMB_SIZE, SCENE_THUMB_SIZE)
+    assert np.allclose(signature, 120, atol=1)
@@ -11,9 +11,18 @@ export async function POST(req: NextRequest) {
             return NextResponse.json({ error: "Faltan campos requeridos" }, { status: 400 });
         }
 
+        // Propagar la traza (W3C traceparent) si el navegador o un proxy la trae
+        const headers: Record<string, string> = { "Content-Type": "application/json" };
+        const traceparent = req.headers.get("traceparent");
+        if (traceparent) {
+            headers["traceparent"] = traceparent;
+            const tracestate = req.headers.get("tracestate");
+            if (tracestate) headers["tracestate"] = tracestate;
+        }
+
         const response = await fetch(PIPECAT_CHAT_URL, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers,
             body: JSON.stringify({
                 message,
                 conversation_id: conversationId,